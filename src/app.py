@@ -12,6 +12,9 @@ vectorial_model = Vectorial(query_builders=[SpellingChecker(), Synonymous()])
 lsi_model = LSI(query_builders=[SpellingChecker(), Synonymous()])
 boolean_model = Boolean(query_builders=[BooleanQueryBuilder()])
 
+if 'sri' in st.session_state:
+    # Every run of the script replaces the system, the feedback of the previous one is written first
+    st.session_state.sri.close()
 st.session_state.sri = SRISystem([vectorial_model, lsi_model, boolean_model])
 sri = st.session_state.sri
 sri.load()
@@ -0,0 +1,69 @@
+"""
+Compares the document analysis throughput of the per-document and per-token
+spaCy calls with the batched Analyzer.
+
+Run from the repository root:
+
+    PYTHONPATH=src python -m benchmarks.analysis [cant_docs] [n_process]
+"""
+import sys
+import time
+from typing import List
+from sri.core import Analyzer, get_nlp
+from sri.ir_dataset import IRDataset
+
+
+def tokenize_doc(doc: str) -> List[str]:
+    """
+    Tokenizes a document with one spaCy call, as documents were analyzed before the Analyzer.
+    """
+    return [token.text for token in get_nlp()(doc.lower()) if token.is_alpha and not token.is_stop]
+
+
+def lemma(tokens: List[str]) -> List[str]:
+    """
+    Lemmatizes tokens with one spaCy call per token.
+    """
+    return [get_nlp()(token)[0].lemma_ for token in tokens]
+
+
+def main() -> None:
+    cant = 200
+    n_process = 2
+
+    try:
+        cant = int(sys.argv[1])
+        n_process = int(sys.argv[2])
+    except:
+        pass
+
+    corpus = IRDataset("cranfield")
+    documents = corpus.load(cant)
+    texts = [doc.text for doc in documents]
+
+    start = time.perf_counter()
+    legacy = []
+    for text in texts:
+        tokens = tokenize_doc(text)
+        legacy.append((tokens, lemma(tokens)))
+    legacy_time = time.perf_counter() - start
+
+    print(f'Documents: {len(texts)}')
+    print(f'{"path":>22} {"docs/s":>10} {"speedup":>8} {"same tokens":>12} {"same lemmas":>12}')
+    print(f'{"nlp per doc and token":>22} {len(texts) / legacy_time:>10.1f} {1:>8.2f} {1:>12.3f} {1:>12.3f}')
+
+    for processes in sorted({1, n_process}):
+        analyzer = Analyzer(n_process=processes)
+        start = time.perf_counter()
+        analyzed = list(analyzer.analyze(texts))
+        elapsed = time.perf_counter() - start
+
+        same_tokens = sum(a[0] == b[0] for a, b in zip(analyzed, legacy)) / max(len(texts), 1)
+        same_lemmas = sum(a[1] == b[1] for a, b in zip(analyzed, legacy)) / max(len(texts), 1)
+        name = f'nlp.pipe n_process={processes}'
+        print(f'{name:>22} {len(texts) / elapsed:>10.1f} {legacy_time / elapsed:>8.2f} '
+              f'{same_tokens:>12.3f} {same_lemmas:>12.3f}')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Measures recall@k and latency of the approximate LSI search against the exact one
+for several values of nprobe.
+
+Run from the repository root after building the system:
+
+    PYTHONPATH=src python -m benchmarks.ann [cant_queries] [k]
+"""
+import sys
+import time
+import ir_datasets
+from sri.models.lsi import LSI
+from sri.sri import SRISystem
+
+
+def main() -> None:
+    cant_queries = -1
+    k = 10
+
+    try:
+        cant_queries = int(sys.argv[1])
+        k = int(sys.argv[2])
+    except:
+        pass
+
+    model = LSI()
+    sri = SRISystem([model])
+    sri.load()
+    sri.change_selected(0)
+
+    queries = [q.text for q in ir_datasets.load("cranfield").queries_iter()]
+    if cant_queries >= 0:
+        queries = queries[:cant_queries]
+
+    snapshot = model.snapshot()
+    vectors = [model.query_vector(q, snapshot) for q in queries]
+    n = max(len(vectors), 1)
+
+    model.ann = False
+    start = time.perf_counter()
+    exact = [set(doc_id for doc_id, _, _ in model.search(v, k, snapshot)) for v in vectors]
+    exact_time = time.perf_counter() - start
+
+    lists = max(len(part.ivf.centroids) for part in model.parts)
+    print(f'Documents: {len(model.docs)}  Segments: {len(model.parts)}  Lists: {lists}  Queries: {len(vectors)}  k: {k}')
+    print(f'{"nprobe":>8} {"recall@" + str(k):>10} {"ms/query":>10} {"speedup":>8}')
+    print(f'{"exact":>8} {1:>10.3f} {1000 * exact_time / n:>10.3f} {1:>8.2f}')
+
+    model.ann = True
+    nprobe = 1
+    while nprobe <= lists:
+        model.nprobe = nprobe
+        start = time.perf_counter()
+        approx = [set(doc_id for doc_id, _, _ in model.search(v, k, snapshot)) for v in vectors]
+        elapsed = time.perf_counter() - start
+
+        recall = sum(len(a & e) / max(len(e), 1) for a, e in zip(approx, exact)) / n
+        print(f'{nprobe:>8} {recall:>10.3f} {1000 * elapsed / n:>10.3f} {exact_time / max(elapsed, 1e-12):>8.2f}')
+        nprobe *= 2
+
+
+if __name__ == "__main__":
+    main()
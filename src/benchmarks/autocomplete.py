@@ -0,0 +1,120 @@
+"""
+Measures the latency of the autocomplete per keystroke over the vocabulary
+of the whole movie corpus: every prefix of a sample of words is completed
+as typed, and then with a typo in it, with exact and typo-tolerant
+completion. Fails if the 95th percentile of the typo-tolerant latency is
+over the budget.
+
+The vocabulary is read from data/movies_db/movies_metadata.csv, or taken
+from the trie in data/autocomplete when the corpus is not there. Run from
+the repository root:
+
+    PYTHONPATH=src python -m benchmarks.autocomplete [budget_ms] [cant_words]
+"""
+import random
+import re
+import string
+import sys
+import time
+from collections import Counter
+from typing import Dict, List, Tuple
+import numpy as np
+from sri.utils.trie import Trie
+
+
+def vocabulary() -> Tuple[List[str], List[int]]:
+    """
+    Finds the words of the movie corpus and their document frequency.
+
+    Returns:
+        Tuple[List[str], List[int]]: The words and their document frequency.
+    """
+    try:
+        from sri.movie.movie_corpus import MovieCorpus
+
+        frequency = Counter()
+        for movie in MovieCorpus().iter():
+            frequency.update(set(re.findall(r'[^\W\d_]+', f'{movie.title} {movie.text}'.lower())))
+        return list(frequency), list(frequency.values())
+    except FileNotFoundError:
+        trie = Trie.load('data/autocomplete')
+        return [trie[i] for i in range(len(trie))], trie.counts.tolist()
+
+
+def typo(word: str, rng: random.Random) -> str:
+    """
+    Replaces, inserts, deletes or swaps one character of a word, after the first one.
+    """
+    i = rng.randrange(1, len(word))
+    char = rng.choice(string.ascii_lowercase)
+    edit = rng.randrange(4)
+    if edit == 0:
+        return word[:i] + char + word[i + 1:]
+    if edit == 1:
+        return word[:i] + char + word[i:]
+    if edit == 2 or i == len(word) - 1:
+        return word[:i] + word[i + 1:]
+    return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+
+
+def percentiles(times: List[float]) -> Dict[str, float]:
+    """
+    Summarizes latencies in seconds as milliseconds.
+    """
+    times = np.array(times) * 1000
+    return {'p50': np.percentile(times, 50), 'p95': np.percentile(times, 95), 'p99': np.percentile(times, 99),
+            'max': times.max()}
+
+
+def main() -> None:
+    budget = 20.0
+    cant = 200
+
+    try:
+        budget = float(sys.argv[1])
+        cant = int(sys.argv[2])
+    except:
+        pass
+
+    start = time.perf_counter()
+    words, counts = vocabulary()
+    trie = Trie.build(words, counts)
+    print(f'Words: {len(trie)}, nodes: {len(trie.labels)}, built in {time.perf_counter() - start:.2f} s')
+
+    rng = random.Random(0)
+    long_words = [word for word in words if len(word) >= 4]
+    sample = rng.sample(long_words, min(cant, len(long_words)))
+    typed = [word[:i] for word in sample for i in range(1, len(word) + 1)]
+    misspelled = [(typo(word, rng), word) for word in sample]
+    typed_misspelled = [(wrong[:i], word) for wrong, word in misspelled for i in range(2, len(wrong) + 1)]
+
+    # The default distance of SRISystem.auto_complete
+    def distance(prefix: str) -> int:
+        return min(2, len(prefix) // 4)
+
+    results = {}
+    for name, prefixes, max_distance in [('exact', typed, lambda prefix: 0), ('fuzzy', typed, distance),
+                                         ('fuzzy typo', [p for p, _ in typed_misspelled], distance)]:
+        times = []
+        for prefix in prefixes:
+            start = time.perf_counter()
+            trie.find_closest_words(prefix, 5, max_distance(prefix))
+            times.append(time.perf_counter() - start)
+        results[name] = percentiles(times)
+
+    found = sum(word in trie.find_closest_words(wrong, 5, distance(wrong)) for wrong, word in misspelled)
+
+    print(f'{"mode":>12} {"keystrokes":>11} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"max ms":>8}')
+    for name, prefixes in [('exact', typed), ('fuzzy', typed), ('fuzzy typo', typed_misspelled)]:
+        r = results[name]
+        print(f'{name:>12} {len(prefixes):>11} {r["p50"]:>8.3f} {r["p95"]:>8.3f} {r["p99"]:>8.3f} {r["max"]:>8.3f}')
+    print(f'Misspelled words completed to the word: {found}/{len(misspelled)}')
+
+    worst = max(results['fuzzy']['p95'], results['fuzzy typo']['p95'])
+    if worst > budget:
+        print(f'p95 of {worst:.3f} ms is over the budget of {budget} ms per keystroke')
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Compares executing the Cranfield queries one by one with executing them in a
+single batch, for the vectorial and the LSI models.
+
+Run from the repository root after building the system:
+
+    PYTHONPATH=src python -m benchmarks.batch [cant_queries] [k]
+"""
+import sys
+import time
+import ir_datasets
+from sri.models.lsi import LSI
+from sri.models.vectorial import Vectorial
+from sri.sri import SRISystem
+
+
+def main() -> None:
+    cant_queries = -1
+    k = 10
+    repeat = 3
+
+    try:
+        cant_queries = int(sys.argv[1])
+        k = int(sys.argv[2])
+    except:
+        pass
+
+    models = [Vectorial(), LSI()]
+    sri = SRISystem(models, cache_size=0)
+    sri.load()
+
+    queries = [q.text for q in ir_datasets.load("cranfield").queries_iter()]
+    if cant_queries >= 0:
+        queries = queries[:cant_queries]
+    n = max(len(queries), 1)
+
+    print(f'Documents: {len(sri.docs)}  Queries: {len(queries)}  k: {k}')
+    for i, name in enumerate(['vectorial', 'lsi']):
+        sri.change_selected(i)
+        models[i].ensure_loaded()
+
+        # The best of several runs, so the first ones warm up the lemmas and the pages of the index
+        single_time = batch_time = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            single = [sri.query(query, k) for query in queries]
+            single_time = min(single_time, time.perf_counter() - start)
+
+            start = time.perf_counter()
+            batch = sri.query_batch(queries, k)
+            batch_time = min(batch_time, time.perf_counter() - start)
+
+        mismatches = sum([doc_id for doc_id, _, _ in a] != [doc_id for doc_id, _, _ in b]
+                         for a, b in zip(single, batch))
+        print(f'{name}:')
+        print(f'  One by one: {n / single_time:.1f} queries/s ({1000 * single_time / n:.3f} ms/query)')
+        print(f'  Batch:      {n / batch_time:.1f} queries/s ({1000 * batch_time / n:.3f} ms/query)')
+        print(f'  Speedup:    {single_time / max(batch_time, 1e-12):.2f}x')
+        print(f'  Rankings that differ: {mismatches}')
+
+
+if __name__ == "__main__":
+    main()
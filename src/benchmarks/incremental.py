@@ -0,0 +1,97 @@
+"""
+Measures how much of a rebuild the analysis cache saves when only a few
+documents of the corpus changed, and how long adding just those documents
+to the built index with SRISystem.add_documents takes. The analysis column is the whole
+AnalyzedCorpus step, including the dictionaries and bag of words that are
+still built over every document.
+
+It builds in a temporary directory, so the index in data/ is not touched.
+Run from the repository root:
+
+    PYTHONPATH=src python -m benchmarks.incremental [cant_docs] [changed_percent]
+"""
+import os
+import sys
+import tempfile
+import time
+from typing import List
+from sri.core import AnalyzedCorpus, Analyzer, Corpus, Document
+from sri.ir_dataset import IRDataset, IRDocument
+from sri.models.boolean import Boolean
+from sri.models.lsi import LSI
+from sri.models.vectorial import Vectorial
+from sri.sri import SRISystem
+from sri.utils.analysis_cache import AnalysisCache
+
+
+class ListCorpus(Corpus):
+    def __init__(self, documents: List[Document]) -> None:
+        super().__init__()
+        self.documents = documents
+
+    def load(self, cant: int = -1) -> List[Document]:
+        return self.documents
+
+
+def main() -> None:
+    cant = 1000
+    changed_percent = 1.0
+
+    try:
+        cant = int(sys.argv[1])
+        changed_percent = float(sys.argv[2])
+    except:
+        pass
+
+    documents = IRDataset("cranfield").load(cant)
+    step = max(1, round(100 / changed_percent))
+    changed = [IRDocument(doc.doc_id, doc.title, doc.text + ' revised') if i % step == 0 else doc
+               for i, doc in enumerate(documents)]
+    only_changed = [doc for i, doc in enumerate(changed) if i % step == 0]
+
+    analyzer = Analyzer()
+    cwd = os.getcwd()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        os.mkdir('data')
+        try:
+            def analysis(docs: List[Document]) -> float:
+                start = time.perf_counter()
+                AnalyzedCorpus.analyze(docs, analyzer, AnalysisCache(analyzer.config()))
+                return time.perf_counter() - start
+
+            def build(docs: List[Document]) -> float:
+                start = time.perf_counter()
+                SRISystem([Vectorial(), LSI(), Boolean()], analyzer).build(ListCorpus(docs))
+                return time.perf_counter() - start
+
+            def add(docs: List[Document]) -> float:
+                sri = SRISystem([Vectorial(), LSI(), Boolean()], analyzer, background_merge=False)
+                sri.load()
+                start = time.perf_counter()
+                sri.add_documents(docs)
+                return time.perf_counter() - start
+
+            rows = [
+                ('cold build', analysis(documents), build(documents)),
+                ('unchanged rebuild', analysis(documents), build(documents)),
+                (f'{changed_percent:g}% changed rebuild', analysis(changed), build(changed)),
+            ]
+            added = add([IRDocument(doc.doc_id, doc.title, doc.text + ' revised again') for doc in only_changed])
+            uncached = time.perf_counter()
+            list(analyzer.analyze(doc.text for doc in only_changed))
+            uncached = time.perf_counter() - uncached
+        finally:
+            os.chdir(cwd)
+
+    print(f'Documents: {len(documents)}  Changed: {len(only_changed)}')
+    print(f'{"":>22} {"analysis s":>11} {"build s":>9}')
+    for name, analysis_time, build_time in rows:
+        print(f'{name:>22} {analysis_time:>11.3f} {build_time:>9.3f}')
+    print(f'{"changed docs alone":>22} {uncached:>11.3f}')
+    print(f'{"add_documents changed":>22} {"":>11} {added:>9.3f}')
+
+
+if __name__ == "__main__":
+    main()
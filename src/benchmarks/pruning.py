@@ -0,0 +1,74 @@
+"""
+Compares the exhaustive and the MaxScore pruned top-k paths of the vectorial model.
+
+Run from the repository root after building the system:
+
+    PYTHONPATH=src python -m benchmarks.pruning [cant_queries] [k]
+"""
+import sys
+import time
+import ir_datasets
+import numpy as np
+from sri.models.vectorial import Vectorial
+from sri.sri import SRISystem
+
+
+def main() -> None:
+    cant_queries = -1
+    k = 10
+
+    try:
+        cant_queries = int(sys.argv[1])
+        k = int(sys.argv[2])
+    except:
+        pass
+
+    model = Vectorial()
+    sri = SRISystem([model])
+    sri.load()
+    sri.change_selected(0)
+
+    queries = [q.text for q in ir_datasets.load("cranfield").queries_iter()]
+    if cant_queries >= 0:
+        queries = queries[:cant_queries]
+
+    snapshot = model.snapshot()
+    vectors = [model.query_vector(q, snapshot) for q in queries]
+    total_postings = 0
+    exhaustive_time = 0.0
+    pruned_time = 0.0
+    mismatches = 0
+
+    for vector in vectors:
+        terms = np.flatnonzero(vector)
+        total_postings += sum(int(np.diff(part.index.matrix.indptr)[terms[terms < part.matrix.shape[1]]].sum())
+                              for part in model.parts)
+
+        model.pruning = False
+        start = time.perf_counter()
+        exhaustive = model.search(vector, k, snapshot)
+        exhaustive_time += time.perf_counter() - start
+
+        model.pruning = True
+        start = time.perf_counter()
+        pruned = model.search(vector, k, snapshot)
+        pruned_time += time.perf_counter() - start
+
+        if [round(v, 5) for _, _, v in exhaustive] != [round(v, 5) for _, _, v in pruned]:
+            mismatches += 1
+
+    n = max(len(vectors), 1)
+    scored = sum(part.index.postings_scored for part in model.parts)
+    skipped = sum(part.index.postings_skipped for part in model.parts)
+    print(f'Documents: {len(model.docs)}  Terms: {len(model.dictionary)}  Segments: {len(model.parts)}  '
+          f'Queries: {len(vectors)}  k: {k}')
+    print(f'Exhaustive: {1000 * exhaustive_time / n:.3f} ms/query')
+    print(f'MaxScore:   {1000 * pruned_time / n:.3f} ms/query')
+    print(f'Speedup:    {exhaustive_time / max(pruned_time, 1e-12):.2f}x')
+    print(f'Postings:   {total_postings} total, {scored} scored, '
+          f'{skipped} skipped ({100 * skipped / max(total_postings, 1):.1f}%)')
+    print(f'Rankings that differ from the exhaustive path: {mismatches}')
+
+
+if __name__ == "__main__":
+    main()
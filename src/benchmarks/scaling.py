@@ -0,0 +1,270 @@
+"""
+Measures how the system scales with the size of the corpus: the time and
+the peak memory of SRISystem.build, the size of the index on disk, the time
+and the memory of SRISystem.load, and the latency of the queries of every
+model and of the autocomplete.
+
+The corpora are taken from Cranfield or from the movie corpus. Sizes over
+the size of the corpus are completed with synthetic documents, whose
+words are drawn with the frequencies of the words of the corpus. The
+queries are a few words of random documents, and the autocomplete types
+every prefix of frequent words.
+
+Every size is built and loaded in fresh processes in a temporary
+directory, so the measures do not mix and the index in data/ is not
+touched. The results are printed as a table and written to
+data/scaling.json. Given the JSON of a previous run as the baseline, it
+fails if any measure grew more than the tolerance over it. Run from the
+repository root:
+
+    PYTHONPATH=src python -m benchmarks.scaling [cranfield|movies] [sizes] [baseline] [tolerance]
+"""
+import json
+import os
+import random
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import Dict, Iterator, List
+import numpy as np
+from sri.core import Corpus, Document
+
+MODEL_NAMES = ['vectorial', 'lsi', 'boolean']
+COLUMNS = ['build s', 'build MB', 'disk MB', 'load s', 'load MB'] + \
+    [f'{name} {p} ms' for name in MODEL_NAMES + ['autocomplete'] for p in ['p50', 'p95']]
+# Growths smaller than these are noise of the measure, whatever the tolerance
+NOISE = {'s': 0.05, 'MB': 2.0, 'ms': 0.5}
+
+
+class FileCorpus(Corpus):
+    def __init__(self, path: str) -> None:
+        """
+        Initializes a corpus that streams the documents of a JSON lines file, so it is never in memory.
+
+        Args:
+            path (str): The path to the file.
+        """
+        super().__init__()
+        self.path = path
+
+    def load(self, cant: int = -1) -> List[Document]:
+        self.documents = list(self.iter(cant))
+        return self.documents
+
+    def iter(self, cant: int = -1) -> Iterator[Document]:
+        with open(self.path, encoding='utf-8') as f:
+            for i, line in enumerate(f):
+                if i == cant:
+                    break
+                doc = json.loads(line)
+                yield Document(doc['id'], doc['title'], doc['text'])
+
+
+def source_documents(source: str, cant: int) -> List[Document]:
+    """
+    Reads the first documents of Cranfield or of the movie corpus.
+    """
+    if source == 'movies':
+        from sri.movie.movie_corpus import MovieCorpus
+        return MovieCorpus().load(cant)
+
+    from sri.ir_dataset import IRDataset
+    return IRDataset("cranfield").load(cant)
+
+
+def write_corpus(documents: List[Document], size: int, path: str, rng: random.Random):
+    """
+    Writes the first size documents, completed with synthetic documents if there are not enough of them.
+    """
+    with open(path, 'w', encoding='utf-8') as f:
+        for doc in documents[:size]:
+            f.write(json.dumps({'id': doc.doc_id, 'title': doc.title, 'text': doc.text}) + '\n')
+
+        if size <= len(documents):
+            return
+        frequency = Counter(word for doc in documents for word in re.findall(r'[^\W\d_]+', doc.text.lower()))
+        words, counts = list(frequency), list(frequency.values())
+        lengths = [len(doc.text.split()) for doc in documents]
+        for i in range(size - len(documents)):
+            text = rng.choices(words, weights=counts, k=max(1, rng.choice(lengths)))
+            f.write(json.dumps({'id': f'synthetic-{i}', 'title': ' '.join(text[:5]), 'text': ' '.join(text)}) + '\n')
+
+
+def workload(documents: List[Document], rng: random.Random, cant_queries: int = 100,
+             cant_words: int = 50) -> Dict[str, List[str]]:
+    """
+    Samples the queries and the autocomplete prefixes.
+    """
+    queries = []
+    for doc in rng.sample(documents, min(cant_queries, len(documents))):
+        words = re.findall(r'[^\W\d_]+', doc.text.lower())
+        if words:
+            queries.append(' '.join(rng.sample(words, min(len(words), rng.randint(2, 5)))))
+
+    frequency = Counter(word for doc in documents for word in re.findall(r'[^\W\d_]+', doc.text.lower())
+                        if len(word) >= 4)
+    frequent = [word for word, _ in frequency.most_common(10 * cant_words)]
+    sample = rng.sample(frequent, min(cant_words, len(frequent)))
+    return {'queries': queries, 'prefixes': [word[:i] for word in sample for i in range(1, len(word) + 1)]}
+
+
+def percentiles(times: List[float]) -> Dict[str, float]:
+    """
+    Summarizes latencies in seconds as milliseconds.
+    """
+    times = np.array(times) * 1000
+    return {'p50': float(np.percentile(times, 50)), 'p95': float(np.percentile(times, 95))}
+
+
+def peak_memory() -> float:
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure_build(directory: str) -> Dict[str, float]:
+    """
+    Builds the system over the corpus of a directory, in the current process.
+
+    Returns:
+        Dict[str, float]: Seconds spent building, peak resident memory and size of the index in MB.
+    """
+    from sri.models.boolean import Boolean
+    from sri.models.lsi import LSI
+    from sri.models.vectorial import Vectorial
+    from sri.sri import SRISystem
+
+    os.chdir(directory)
+    os.mkdir('data')
+    start = time.perf_counter()
+    SRISystem([Vectorial(), LSI(), Boolean()]).build(FileCorpus('corpus.jsonl'))
+    elapsed = time.perf_counter() - start
+
+    disk = sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk('data') for name in names)
+    return {'build s': elapsed, 'build MB': peak_memory(), 'disk MB': disk / 2 ** 20}
+
+
+def measure_queries(directory: str) -> Dict[str, float]:
+    """
+    Loads the system built in a directory and times the queries and the autocomplete, in the current process.
+
+    Returns:
+        Dict[str, float]: Seconds spent loading every model, peak resident memory in MB and latency percentiles.
+    """
+    from sri.models.boolean import Boolean
+    from sri.models.lsi import LSI
+    from sri.models.vectorial import Vectorial
+    from sri.sri import SRISystem
+
+    os.chdir(directory)
+    with open('workload.json') as f:
+        work = json.load(f)
+
+    start = time.perf_counter()
+    sri = SRISystem([Vectorial(), LSI(), Boolean()], background_merge=False, cache_size=0)
+    sri.load()
+    for model in sri.models:
+        model.ensure_loaded()
+    result = {'load s': time.perf_counter() - start}
+
+    for selected, name in enumerate(MODEL_NAMES):
+        sri.change_selected(selected)
+        # The first query loads the language pipeline
+        sri.query(work['queries'][0])
+        times = []
+        for query in work['queries']:
+            start = time.perf_counter()
+            sri.query(query)
+            times.append(time.perf_counter() - start)
+        result.update({f'{name} {p} ms': v for p, v in percentiles(times).items()})
+
+    times = []
+    for prefix in work['prefixes']:
+        start = time.perf_counter()
+        sri.auto_complete(prefix)
+        times.append(time.perf_counter() - start)
+    result.update({f'autocomplete {p} ms': v for p, v in percentiles(times).items()})
+
+    result['load MB'] = peak_memory()
+    return result
+
+
+def run_child(mode: str, directory: str) -> Dict[str, float]:
+    child = subprocess.run([sys.executable, '-m', 'benchmarks.scaling', mode, directory],
+                           capture_output=True, text=True, check=True)
+    return json.loads(child.stdout.strip().splitlines()[-1])
+
+
+def regressions(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]],
+                tolerance: float) -> List[str]:
+    """
+    Finds the measures that grew more than the tolerance and more than the noise
+    over the baseline, for the sizes of both runs.
+    """
+    found = []
+    for size, measures in results.items():
+        for column, value in measures.items():
+            old = baseline.get(size, {}).get(column)
+            noise = NOISE[column.split()[-1]]
+            if old is not None and value > old * (1 + tolerance) and value - old > noise:
+                found.append(f'{size} docs, {column}: {value:.3f} over {old:.3f} of the baseline')
+    return found
+
+
+def main() -> None:
+    if len(sys.argv) == 3 and sys.argv[1] in ('--build', '--query'):
+        measure = measure_build if sys.argv[1] == '--build' else measure_queries
+        print(json.dumps(measure(sys.argv[2])))
+        return
+
+    source = 'cranfield'
+    sizes = [250, 500, 1000, 2000, 4000]
+    baseline_path = None
+    tolerance = 0.25
+
+    try:
+        source = sys.argv[1]
+        sizes = [int(size) for size in sys.argv[2].split(',')]
+        baseline_path = sys.argv[3]
+        tolerance = float(sys.argv[4])
+    except:
+        pass
+
+    baseline = {}
+    if baseline_path is not None:
+        with open(baseline_path) as f:
+            baseline = json.load(f)['results']
+
+    documents = source_documents(source, max(sizes))
+    rng = random.Random(0)
+    work = workload(documents, rng)
+
+    results = {}
+    print(f'{"docs":>8} ' + ' '.join(f'{column:>{max(len(column), 9)}}' for column in COLUMNS))
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            write_corpus(documents, size, os.path.join(tmp, 'corpus.jsonl'), rng)
+            with open(os.path.join(tmp, 'workload.json'), 'w') as f:
+                json.dump(work, f)
+
+            measures = run_child('--build', tmp)
+            measures.update(run_child('--query', tmp))
+        results[str(size)] = measures
+        print(f'{size:>8} ' + ' '.join(f'{measures[column]:>{max(len(column), 9)}.3f}' for column in COLUMNS))
+
+    with open('data/scaling.json', 'w') as f:
+        json.dump({'source': source, 'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'results': results}, f, indent=2)
+
+    found = regressions(results, baseline, tolerance)
+    if found:
+        print(f'Regressions over {100 * tolerance:.0f}% of the baseline:')
+        for regression in found:
+            print(f'  {regression}')
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Measures the cold start of the system: the time from a new process to the
+first query of every model, loading the indexes eagerly (every model before
+the first query), lazily (only the queried model) and lazily with the
+background warm-up.
+
+Every measure runs in a fresh process, so nothing is imported or cached
+beforehand. Run from the repository root after building the system:
+
+    PYTHONPATH=src python -m benchmarks.startup [query]
+"""
+import json
+import subprocess
+import sys
+import time
+from typing import Dict
+
+MODES = ['eager', 'lazy', 'warm-up']
+MODEL_NAMES = ['vectorial', 'lsi', 'boolean']
+
+
+def measure(selected: int, mode: str, query: str) -> Dict[str, float]:
+    """
+    Measures the cold start of one model in the current process.
+
+    Args:
+        selected (int): Index of the queried model.
+        mode (str): One of MODES.
+        query (str): The query.
+
+    Returns:
+        Dict[str, float]: Seconds spent importing, loading and answering the first and the second query.
+    """
+    start = time.perf_counter()
+    from sri.models.boolean import Boolean
+    from sri.models.lsi import LSI
+    from sri.models.vectorial import Vectorial
+    from sri.sri import SRISystem
+    imported = time.perf_counter()
+
+    sri = SRISystem([Vectorial(), LSI(), Boolean()])
+    sri.load(warm_up=mode == 'warm-up')
+    if mode == 'eager':
+        for model in sri.models:
+            model.ensure_loaded()
+    loaded = time.perf_counter()
+
+    sri.change_selected(selected)
+    sri.query(query)
+    first = time.perf_counter()
+
+    sri.query(query)
+    second = time.perf_counter()
+
+    return {'import': imported - start, 'load': loaded - imported,
+            'first query': first - loaded, 'second query': second - first, 'to first query': first - start}
+
+
+def main() -> None:
+    if len(sys.argv) == 5 and sys.argv[1] == '--child':
+        print(json.dumps(measure(int(sys.argv[2]), sys.argv[3], sys.argv[4])))
+        return
+
+    query = 'boundary layer flow'
+
+    try:
+        query = sys.argv[1]
+    except:
+        pass
+
+    columns = ['import', 'load', 'first query', 'second query', 'to first query']
+    print(f'{"model":>10} {"mode":>8} ' + ' '.join(f'{c + " s":>16}' for c in columns))
+    for selected, name in enumerate(MODEL_NAMES):
+        for mode in MODES:
+            child = subprocess.run([sys.executable, '-m', 'benchmarks.startup', '--child', str(selected), mode, query],
+                                   capture_output=True, text=True, check=True)
+            times = json.loads(child.stdout.strip().splitlines()[-1])
+            print(f'{name:>10} {mode:>8} ' + ' '.join(f'{times[c]:>16.3f}' for c in columns))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Measures the peak memory of SRISystem.build over growing prefixes of the
+corpus, analyzing the whole corpus as a single chunk and streaming it in
+chunks of chunk_size documents. With streaming, the peak should stay flat as
+the corpus grows.
+
+Every build runs in a fresh process in a temporary directory, so the peaks
+do not mix and the index in data/ is not touched. The system is built with
+its default configuration, including the analysis cache. Run from the repository
+root:
+
+    PYTHONPATH=src python -m benchmarks.streaming [cant_docs] [chunk_size]
+"""
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict
+
+
+def measure(cant: int, chunk_size: int) -> Dict[str, float]:
+    """
+    Builds the system over the first documents of the corpus in the current process.
+
+    Args:
+        cant (int): Number of documents.
+        chunk_size (int): Number of documents analyzed together.
+
+    Returns:
+        Dict[str, float]: Seconds spent building and peak resident memory in MB.
+    """
+    from sri.ir_dataset import IRDataset
+    from sri.models.boolean import Boolean
+    from sri.models.lsi import LSI
+    from sri.models.vectorial import Vectorial
+    from sri.sri import SRISystem
+
+    corpus = IRDataset("cranfield")
+    cwd = os.getcwd()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        os.mkdir('data')
+        try:
+            start = time.perf_counter()
+            SRISystem([Vectorial(), LSI(chunksize=chunk_size), Boolean()],
+                      chunk_size=chunk_size).build(corpus, cant)
+            elapsed = time.perf_counter() - start
+        finally:
+            os.chdir(cwd)
+
+    # ru_maxrss is in kilobytes on Linux
+    return {'build': elapsed, 'peak': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+
+
+def main() -> None:
+    if len(sys.argv) == 4 and sys.argv[1] == '--child':
+        print(json.dumps(measure(int(sys.argv[2]), int(sys.argv[3]))))
+        return
+
+    cant = 1400
+    chunk_size = 100
+
+    try:
+        cant = int(sys.argv[1])
+        chunk_size = int(sys.argv[2])
+    except:
+        pass
+
+    print(f'{"docs":>8} {"chunk size":>11} {"build s":>9} {"peak MB":>9}')
+    for size in [cant // 4, cant // 2, cant]:
+        for chunk in [size, chunk_size]:
+            child = subprocess.run([sys.executable, '-m', 'benchmarks.streaming', '--child', str(size), str(chunk)],
+                                   capture_output=True, text=True, check=True)
+            result = json.loads(child.stdout.strip().splitlines()[-1])
+            print(f'{size:>8} {chunk:>11} {result["build"]:>9.3f} {result["peak"]:>9.1f}')
+
+
+if __name__ == "__main__":
+    main()
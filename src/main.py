@@ -22,11 +22,12 @@ def main() -> None:
     lsi_model = LSI()
     boolean_model = Boolean()
 
+    # WordNet is only needed to build the synonym map
+    nltk.download('wordnet')
+
     sri = SRISystem([vectorial_model, lsi_model, boolean_model])
     sri.build(corpus, cant)
 
-    nltk.download('wordnet')
-
 
 if __name__ == "__main__":
     main()
@@ -1,56 +1,162 @@
+"""
+Evaluates the models over the Cranfield collection with ir_measures, and
+measures the throughput and the latency of every query while doing it.
+
+The queries are spread over a pool of processes. Every process loads the
+index, whose segments are memory mapped, so all of them share the same
+pages. The metrics and the percentiles of the latency of every stage of a
+query are printed and written as JSON, so the quality and the performance
+of the models can be tracked together over time. Run after building the
+system with the same number of documents:
+
+    python src/metrics.py [cant] [workers] [output]
+"""
 from sri.models.vectorial import Vectorial
 from sri.models.boolean import Boolean
 from sri.models.lsi import LSI
+import json
+import os
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
+import numpy as np
 from sri.sri import SRISystem
 from sri.ir_dataset import IRDataset
 from ir_measures import calc_aggregate
 # from ir_measures.measures import nDCG, P, RR, AP
 from ir_measures import *
 
-cant = -1
-
-try:
-    cant = int(sys.argv[1])
-except:
-    pass
-
-corpus = IRDataset("cranfield")
-corpus.load(cant)
-
-vectorial_model = Vectorial()
-lsi_model = LSI()
-
-models = [vectorial_model, lsi_model]
-name_models = ['vectorial', 'lsi']
-
-sri = SRISystem(models)
-sri.load()
-
-
-qrels = corpus.get_qrels()
-queries = list(corpus.get_queries())
-
-
-qrels = [q for q in qrels if any(
-    [doc for doc in corpus.documents if doc.doc_id == q.doc_id])]
-
-
-for i in range(len(models)):
-    sri.change_selected(i)
-
-    results = {}
-
-    for query in queries:
-        top_k_results = sri.query(query.text)
-        results[query.query_id] = {doc_id: v for doc_id, _, v in top_k_results}
-
-    # Calcular las métricas
-    metrics = calc_aggregate(
-        [P@10, R@10, Rprec(rel=2), nDCG@10, RR(rel=2), AP(rel=2)], qrels, results)
-
-    print(f'Model: {name_models[i]}')
-    # Imprimir las métricas
-    for metric, value in metrics.items():
-        print(f"{metric}: {value}")
-    print('*****************')
+NAME_MODELS = ['vectorial', 'lsi']
+STAGES = ['analysis', 'search', 'total']
+
+# System of every process of the pool
+sri: SRISystem = None
+
+
+def init_worker():
+    """
+    Loads the system in a process of the pool, and runs a query with every
+    model so the models and the language pipeline are not loaded while timing.
+    """
+    global sri
+    sri = SRISystem([Vectorial(), LSI()], background_merge=False, cache_size=0)
+    sri.load()
+    for model in sri.models:
+        model.ensure_loaded()
+        model.query('warm up', 1)
+
+
+def run_queries(selected: int, queries: List[Tuple[str, str]], k: int) -> List[Tuple[str, Dict[str, float], float, float]]:
+    """
+    Executes queries with a model, timing the analysis of every query and the search of its results.
+
+    Args:
+        selected (int): Index of the model.
+        queries (List[Tuple[str, str]]): Id and text of the queries.
+        k (int): Number of documents to return per query.
+
+    Returns:
+        List[Tuple[str, Dict[str, float], float, float]]: Id of every query, score of its documents, and seconds of
+        the analysis and of the search.
+    """
+    model = sri.models[selected]
+    snapshot = model.snapshot()
+    results = []
+    for query_id, text in queries:
+        start = time.perf_counter()
+        vector = model.query_vector(text, snapshot)
+        analyzed = time.perf_counter()
+        documents = model.search(vector, k, snapshot)
+        end = time.perf_counter()
+        results.append((query_id, {doc_id: v for doc_id, _, v in documents}, analyzed - start, end - analyzed))
+    return results
+
+
+def percentiles(times: List[float]) -> Dict[str, float]:
+    """
+    Summarizes latencies in seconds as milliseconds.
+    """
+    times = np.array(times) * 1000
+    return {'mean': float(times.mean()), 'p50': float(np.percentile(times, 50)),
+            'p95': float(np.percentile(times, 95)), 'p99': float(np.percentile(times, 99)), 'max': float(times.max())}
+
+
+def evaluate(executor: ProcessPoolExecutor, workers: int, selected: int, queries: List[Tuple[str, str]],
+             qrels: List, k: int) -> dict:
+    """
+    Evaluates a model, running chunks of the queries in parallel.
+
+    Returns:
+        dict: Metrics, throughput and latency of every stage of the model.
+    """
+    size = max(1, -(-len(queries) // (4 * workers)))
+    chunks = [queries[i:i + size] for i in range(0, len(queries), size)]
+
+    start = time.perf_counter()
+    futures = [executor.submit(run_queries, selected, chunk, k) for chunk in chunks]
+    rows = [row for future in futures for row in future.result()]
+    wall_time = time.perf_counter() - start
+
+    results = {query_id: documents for query_id, documents, _, _ in rows}
+    latency = {'analysis': [row[2] for row in rows], 'search': [row[3] for row in rows]}
+    latency['total'] = [analysis + search for analysis, search in zip(latency['analysis'], latency['search'])]
+
+    metrics = calc_aggregate([P@10, R@10, Rprec(rel=2), nDCG@10, RR(rel=2), AP(rel=2)], qrels, results)
+
+    return {
+        'metrics': {str(metric): float(value) for metric, value in metrics.items()},
+        'throughput': len(rows) / wall_time,
+        'wall_time': wall_time,
+        'latency_ms': {stage: percentiles(latency[stage]) for stage in STAGES},
+    }
+
+
+def main() -> None:
+    cant = -1
+    workers = os.cpu_count() or 1
+    output = 'data/metrics.json'
+
+    try:
+        cant = int(sys.argv[1])
+        workers = int(sys.argv[2])
+        output = sys.argv[3]
+    except:
+        pass
+
+    corpus = IRDataset("cranfield")
+    corpus.load(cant)
+
+    doc_ids = {doc.doc_id for doc in corpus.documents}
+    qrels = [q for q in corpus.get_qrels() if q.doc_id in doc_ids]
+    queries = [(query.query_id, query.text) for query in corpus.get_queries()]
+
+    report = {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'dataset': corpus.name,
+        'documents': len(corpus.documents),
+        'queries': len(queries),
+        'workers': workers,
+        'models': {},
+    }
+
+    with ProcessPoolExecutor(workers, initializer=init_worker) as executor:
+        for i, name in enumerate(NAME_MODELS):
+            result = report['models'][name] = evaluate(executor, workers, i, queries, qrels, 10)
+
+            print(f'Model: {name}')
+            # Imprimir las métricas
+            for metric, value in result['metrics'].items():
+                print(f"{metric}: {value}")
+            print(f"Throughput: {result['throughput']:.1f} queries/s")
+            for stage in STAGES:
+                r = result['latency_ms'][stage]
+                print(f"Latency {stage}: p50 {r['p50']:.3f} ms, p95 {r['p95']:.3f} ms, p99 {r['p99']:.3f} ms")
+            print('*****************')
+
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,43 @@
 from abc import ABC, abstractmethod
-from typing import List, Tuple
+from collections import Counter, OrderedDict
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import json
+import os
+import re
+import threading
 import spacy
 import gensim
+import numpy as np
+from gensim.matutils import corpus2csc
+from scipy import sparse
+from spacy.lang.en.stop_words import STOP_WORDS
+from .utils.analysis_cache import AnalysisCache
+from .utils.dictionary_log import DictionaryLog
+from .utils.doc_table import DocTables
+from .utils.feedback_log import FeedbackLog
+from .utils.methods import top_k
+from .utils.rocchio import Rocchio, Vector
+from .utils.segment import Segment
 
-nlp = spacy.load('en_core_web_sm')
+_nlp = None
+_nlp_lock = threading.Lock()
+
+
+def get_nlp() -> spacy.language.Language:
+    """
+    Gets the spaCy pipeline shared by the whole system. It is loaded on the first
+    call, so importing the package or loading an index does not pay for it.
+
+    Returns:
+        spacy.language.Language: The pipeline.
+    """
+    global _nlp
+    if _nlp is None:
+        with _nlp_lock:
+            if _nlp is None:
+                _nlp = spacy.load('en_core_web_sm')
+    return _nlp
 
 
 class Document(ABC):
@@ -31,6 +65,19 @@ class Corpus(ABC):
     def load(self, cant: int = -1) -> List[Document]:
         pass
 
+    def iter(self, cant: int = -1) -> Iterator[Document]:
+        """
+        Iterates over the documents of the corpus. Corpora that can read their
+        documents one at a time override it, so the corpus is never in memory.
+
+        Args:
+            cant (int, optional): Number of documents to read. Defaults to -1 (read all).
+
+        Returns:
+            Iterator[Document]: The documents.
+        """
+        return iter(self.load(cant))
+
     def get_qrels(self) -> List:
         return []
 
@@ -38,35 +85,130 @@ class Corpus(ABC):
         return []
 
 
-class QueryBuilder(ABC):
-    @abstractmethod
-    def build(self, tokens: List[str], words: List[str]) -> List[str]:
-        pass
+class Analyzer:
+    def __init__(self, batch_size: int = 256, n_process: int = 1,
+                 disable: Tuple[str, ...] = ('parser', 'ner')) -> None:
+        """
+        Initializes an analyzer that tokenizes and lemmatizes texts in batches with nlp.pipe.
 
+        Args:
+            batch_size (int): Number of texts processed together.
+            n_process (int): Number of worker processes.
+            disable (Tuple[str, ...]): Pipeline components not needed to find tokens and lemmas.
+        """
+        self.batch_size = batch_size
+        self.n_process = n_process
+        self.disable = list(disable)
 
-class Model(ABC):
-    def __init__(self) -> None:
+    def config(self) -> str:
         """
-        Abstract base class for a text model.
+        Describes everything that affects the output of the analyzer.
+
+        Returns:
+            str: The description.
         """
-        self.vocabulary: List[str] = []
-        self.relevant_docs = []
-        self.non_relevant_docs = []
+        nlp = get_nlp()
+        return (f"{nlp.meta.get('lang')}_{nlp.meta.get('name')}-{nlp.meta.get('version')} "
+                f"spacy-{spacy.__version__} pipes={','.join(n for n in nlp.pipe_names if n not in self.disable)} "
+                f"alpha-no-stop")
 
-    def _tokenize_doc(doc) -> List[str]:
+    def analyze(self, texts: Iterable[str]) -> Iterator[Tuple[List[str], List[str]]]:
         """
-        Tokenize a document.
+        Tokenizes and lemmatizes texts in a single pass of the pipeline.
 
         Args:
-            doc: The document to tokenize.
+            texts (Iterable[str]): The texts to analyze.
+
+        Returns:
+            Iterator[Tuple[List[str], List[str]]]: The tokens and the lemmas of every text, in order.
+        """
+        nlp = get_nlp()
+        disable = [name for name in self.disable if name in nlp.pipe_names]
+        for doc in nlp.pipe((text.lower() for text in texts), batch_size=self.batch_size,
+                            n_process=self.n_process, disable=disable):
+            kept = [token for token in doc if token.is_alpha and not token.is_stop]
+            yield [token.text for token in kept], [token.lemma_ for token in kept]
+
+
+class QueryAnalyzer:
+    WORD = re.compile(r"[^\W\d_]+")
+
+    def __init__(self, lemmas: Dict[str, str] = {}, cache_size: int = 4096) -> None:
+        """
+        Initializes a lightweight analyzer for queries that tokenizes with a regular
+        expression and lemmatizes with the word to lemma table of the corpus.
+        spaCy is only used for words that are not in the table, and its results
+        are memoized in a bounded LRU cache.
+
+        Args:
+            lemmas (Dict[str, str]): Lemma of every word of the corpus.
+            cache_size (int): Maximum number of unseen words whose lemma is memoized.
+        """
+        self.lemmas = lemmas
+        self.unseen_lemma = lru_cache(maxsize=cache_size)(lambda word: get_nlp()(word)[0].lemma_)
+
+    @staticmethod
+    def load() -> 'QueryAnalyzer':
+        """
+        Loads the analyzer with the lemma table saved by the last build and the
+        lemmas of the words added after it.
+
+        Returns:
+            QueryAnalyzer: The analyzer.
+        """
+        with open('data/lemmas.json') as f:
+            lemmas = json.load(f)
+        if os.path.exists('data/lemmas.json.log'):
+            with open('data/lemmas.json.log', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        lemmas.update(json.loads(line))
+                    except ValueError:
+                        # A line cut by a crash in the middle of a write is ignored
+                        continue
+        return QueryAnalyzer(lemmas)
+
+    def tokenize(self, text: str) -> List[str]:
+        """
+        Splits a text into its lowercase alphabetic words that are not stop words.
+
+        Args:
+            text (str): The text.
 
         Returns:
             List[str]: A list of tokens.
         """
-        return [token.text for token in nlp(
-            doc.lower()) if token.is_alpha and not token.is_stop]
+        return [word for word in QueryAnalyzer.WORD.findall(text.lower()) if word not in STOP_WORDS]
+
+    def lemma(self, word: str) -> str:
+        """
+        Finds the lemma of a word.
+
+        Args:
+            word (str): The word.
+
+        Returns:
+            str: The lemma.
+        """
+        lemma = self.lemmas.get(word)
+        return lemma if lemma is not None else self.unseen_lemma(word)
+
+    def lemmatize_batch(self, queries: List[List[str]]) -> List[List[str]]:
+        """
+        Lemmatizes the tokens of several queries. The words that are not in the
+        table are lemmatized together with a single nlp.pipe call.
+
+        Args:
+            queries (List[List[str]]): Tokens of every query.
+
+        Returns:
+            List[List[str]]: Lemmas of every query.
+        """
+        unseen = sorted({token for tokens in queries for token in tokens if token not in self.lemmas})
+        lemmas = {word: doc[0].lemma_ for word, doc in zip(unseen, get_nlp().pipe(unseen))}
+        return [[self.lemmas[token] if token in self.lemmas else lemmas[token] for token in tokens] for tokens in queries]
 
-    def _lemma(tokens: List[str]) -> List[str]:
+    def lemmatize(self, tokens: List[str]) -> List[str]:
         """
         Lemmatize tokens.
 
@@ -76,50 +218,602 @@ class Model(ABC):
         Returns:
             List[str]: A list of lemmatized tokens.
         """
-        return [nlp(token)[0].lemma_ for token in tokens]
+        return [self.lemma(token) for token in tokens]
+
+
+class AnalyzedCorpus:
+    def __init__(self, docs: List[Tuple[str, str]], tokens: List[List[str]], lemmas: List[List[str]],
+                 vocabulary: gensim.corpora.Dictionary = None, dictionary: gensim.corpora.Dictionary = None) -> None:
+        """
+        Initializes the analysis of a corpus shared by every model during a build.
+
+        Args:
+            docs (List[Tuple[str, str]]): Id and title of every document.
+            tokens (List[List[str]]): Tokens of every document.
+            lemmas (List[List[str]]): Lemmas of every document.
+            vocabulary (gensim.corpora.Dictionary, optional): Dictionary of the tokens of an existing index, extended with the new tokens.
+            dictionary (gensim.corpora.Dictionary, optional): Dictionary of the lemmas of an existing index, extended with the new
+                lemmas. Its document frequencies are the global statistics of the whole index.
+
+        Attributes:
+            vocabulary (gensim.corpora.Dictionary): Dictionary of the tokens, used by query builders and auto-completion.
+            dictionary (gensim.corpora.Dictionary): Dictionary of the lemmas, the terms of every model.
+            bow (List[List[Tuple[int, int]]]): Bag of words of the lemmas of every document.
+        """
+        self.docs = docs
+        self.tokens = tokens
+        self.lemmas = lemmas
+        self.vocabulary = vocabulary if vocabulary is not None else gensim.corpora.Dictionary()
+        self.dictionary = dictionary if dictionary is not None else gensim.corpora.Dictionary()
+        self.vocabulary.add_documents(tokens)
+        self.bow = [self.dictionary.doc2bow(doc, allow_update=True) for doc in lemmas]
 
-    def build(self, documents: List[Document]) -> List[Tuple[str, str, List[str]]]:
+    @staticmethod
+    def analyze(documents: List[Document], analyzer: Analyzer, cache: AnalysisCache = None,
+                vocabulary: gensim.corpora.Dictionary = None,
+                dictionary: gensim.corpora.Dictionary = None) -> 'AnalyzedCorpus':
         """
-        Build the model from a list of documents.
+        Tokenizes and lemmatizes a list of documents. With a cache, only the
+        documents whose text is not in it are analyzed, and they are added to it.
 
         Args:
             documents (List[Document]): List of documents.
+            analyzer (Analyzer): Analyzer used to tokenize and lemmatize the documents.
+            cache (AnalysisCache, optional): Cache of previous analyses.
+            vocabulary (gensim.corpora.Dictionary, optional): Dictionary of the tokens of an existing index.
+            dictionary (gensim.corpora.Dictionary, optional): Dictionary of the lemmas of an existing index.
 
         Returns:
-            List[Tuple[str, List[str]]]: A list of tuples containing document titles and tokenized text.
+            AnalyzedCorpus: The analyzed corpus.
         """
-        tokenized_docs = [(doc.doc_id, doc.title, Model._tokenize_doc(
-            doc.text.lower())) for doc in documents]
+        return AnalyzedCorpus.of(documents, AnalyzedCorpus.analyze_texts(documents, analyzer, cache),
+                                 vocabulary, dictionary)
 
-        dict_voc = gensim.corpora.Dictionary(
-            [doc for _, _, doc in tokenized_docs])
-        dict_voc.save('data/vocabulary.dict')
+    @staticmethod
+    def analyze_texts(documents: List[Document], analyzer: Analyzer,
+                      cache: AnalysisCache = None) -> List[Tuple[List[str], List[str]]]:
+        """
+        Tokenizes and lemmatizes the texts of a list of documents, without
+        touching any dictionary. With a cache, only the documents whose text is
+        not in it are analyzed, and they are added to it.
 
-        return tokenized_docs
+        Args:
+            documents (List[Document]): List of documents.
+            analyzer (Analyzer): Analyzer used to tokenize and lemmatize the documents.
+            cache (AnalysisCache, optional): Cache of previous analyses.
 
-    def load(self, vocabulary: List[str], relevant_docs, non_relevant_docs):
+        Returns:
+            List[Tuple[List[str], List[str]]]: Tokens and lemmas of every document.
         """
-        Load model data.
+        if cache is None:
+            return list(analyzer.analyze(doc.text for doc in documents))
+
+        keys = [cache.key(doc.text) for doc in documents]
+        missing = {key: doc.text for key, doc in zip(keys, documents) if key not in cache}
+        for key, analysis in zip(missing, analyzer.analyze(missing.values())):
+            cache.put(key, *analysis)
+
+        return [cache.get(key) for key in keys]
+
+    @staticmethod
+    def of(documents: List[Document], analyzed: List[Tuple[List[str], List[str]]],
+           vocabulary: gensim.corpora.Dictionary = None,
+           dictionary: gensim.corpora.Dictionary = None) -> 'AnalyzedCorpus':
+        """
+        Builds the analyzed corpus of documents whose texts were analyzed with analyze_texts.
 
         Args:
             documents (List[Document]): List of documents.
+            analyzed (List[Tuple[List[str], List[str]]]): Tokens and lemmas of every document.
+            vocabulary (gensim.corpora.Dictionary, optional): Dictionary of the tokens of an existing index.
+            dictionary (gensim.corpora.Dictionary, optional): Dictionary of the lemmas of an existing index.
+
+        Returns:
+            AnalyzedCorpus: The analyzed corpus.
+        """
+        tokens = [doc_tokens for doc_tokens, _ in analyzed]
+        lemmas = [doc_lemmas for _, doc_lemmas in analyzed]
+
+        return AnalyzedCorpus([(doc.doc_id, doc.title) for doc in documents], tokens, lemmas,
+                              vocabulary, dictionary)
+
+    def lemma_counts(self) -> Counter:
+        """
+        Counts how many times every token of the corpus has every lemma.
+
+        Returns:
+            Counter: Count of every (token, lemma) pair.
+        """
+        return Counter(pair for tokens, lemmas in zip(self.tokens, self.lemmas)
+                       for pair in zip(tokens, lemmas))
+
+    @staticmethod
+    def lemma_table(counts: Counter) -> Dict[str, str]:
+        """
+        Finds the most frequent lemma of every token.
+
+        Args:
+            counts (Counter): Count of every (token, lemma) pair, from lemma_counts.
+
+        Returns:
+            Dict[str, str]: Lemma of every token.
+        """
+        table = {}
+        for (token, lemma), _ in counts.most_common():
+            table.setdefault(token, lemma)
+        return table
+
+    def matrix(self) -> sparse.csr_matrix:
+        """
+        Gets the bag of words of every document as a matrix.
+
+        Returns:
+            scipy.sparse.csr_matrix: Matrix with documents as rows, terms as columns and term counts as values.
+        """
+        matrix = corpus2csc(self.bow, num_terms=len(self.dictionary), num_docs=len(self.bow), dtype=np.int32).T.tocsr()
+        matrix.sort_indices()
+        return matrix
+
+    def word_matrix(self) -> sparse.csr_matrix:
+        """
+        Gets the words of every document as a matrix, so the documents can be
+        removed from the frequencies of the vocabulary once they are deleted.
+
+        Returns:
+            scipy.sparse.csr_matrix: Matrix with documents as rows, words as columns and word counts as values.
+        """
+        bow = [self.vocabulary.doc2bow(tokens) for tokens in self.tokens]
+        matrix = corpus2csc(bow, num_terms=len(self.vocabulary), num_docs=len(bow), dtype=np.int32).T.tocsr()
+        matrix.sort_indices()
+        return matrix
+
+    def save(self, lemmas: Dict[str, str]) -> None:
+        """
+        Saves the vocabulary, the lemma table and the dictionary shared by every model.
+
+        Args:
+            lemmas (Dict[str, str]): Lemma table of the whole index.
+        """
+        DictionaryLog.save(self.vocabulary, 'data/vocabulary.dict')
+        DictionaryLog.save(self.dictionary, 'data/dictionary.dict')
+        self.__save_lemmas(lemmas)
+
+    @staticmethod
+    def __save_lemmas(lemmas: Dict[str, str]) -> None:
+        with open('data/lemmas.json.tmp', 'w') as f:
+            json.dump(lemmas, f)
+        os.replace('data/lemmas.json.tmp', 'data/lemmas.json')
+        if os.path.exists('data/lemmas.json.log'):
+            os.remove('data/lemmas.json.log')
+
+    def append(self, lemmas: Dict[str, str], added: Iterable[str]) -> None:
+        """
+        Saves the changes of the vocabulary, the lemma table and the dictionary
+        made by the documents of the corpus, after they were added to the ones
+        of an existing index. Only the entries of the words and the terms of the
+        documents are written, in the logs of the saved files.
+
+        Args:
+            lemmas (Dict[str, str]): Lemma table of the whole index.
+            added (Iterable[str]): Tokens added to the lemma table.
+        """
+        DictionaryLog.append(self.vocabulary, 'data/vocabulary.dict',
+                             {self.vocabulary.token2id[token] for tokens in self.tokens for token in tokens})
+        DictionaryLog.append(self.dictionary, 'data/dictionary.dict',
+                             {term for doc in self.bow for term, _ in doc})
+
+        added = {token: lemmas[token] for token in added}
+        if not added:
+            return
+        if os.path.exists('data/lemmas.json.log') and \
+                os.path.getsize('data/lemmas.json.log') > os.path.getsize('data/lemmas.json'):
+            self.__save_lemmas(lemmas)
+            return
+        with open('data/lemmas.json.log', 'a', encoding='utf-8') as f:
+            f.write(json.dumps(added) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+
+class SegmentCorpus:
+    def __init__(self, paths: List[str], deleted: List[List[int]] = None) -> None:
+        """
+        Initializes a gensim streaming corpus over the bag of words stored in
+        segments. It can be iterated many times and only one document is in
+        memory at a time, besides the memory-mapped counts.
+
+        Args:
+            paths (List[str]): Directory of every segment with a bow segment.
+            deleted (List[List[int]], optional): Rows of every segment that are skipped.
+        """
+        self.paths = paths
+        self.deleted = deleted if deleted is not None else [[] for _ in paths]
+
+    def __iter__(self) -> Iterator[List[Tuple[int, int]]]:
+        for path, deleted in zip(self.paths, self.deleted):
+            bow = Segment.read(os.path.join(path, 'bow')).sparse()
+            deleted = set(deleted)
+            for row in range(bow.shape[0]):
+                if row in deleted:
+                    continue
+                start, end = bow.indptr[row], bow.indptr[row + 1]
+                yield list(zip(bow.indices[start:end].tolist(), bow.data[start:end].tolist()))
+
+    def __len__(self) -> int:
+        return sum(Segment.read(os.path.join(path, 'bow')).meta['shape'][0] - len(set(deleted))
+                   for path, deleted in zip(self.paths, self.deleted))
+
+
+class QueryBuilder(ABC):
+    @abstractmethod
+    def build(self, tokens: List[str], words: List[str]) -> List[str]:
+        pass
+
+    def reload(self) -> None:
+        """
+        Loads again the data the system saved for the builder, after the
+        system changed it. Builders without data do nothing.
+        """
+        pass
+
+
+class Snapshot:
+    def __init__(self, parts: List[Any], docs: DocTables, feedback: Optional[Rocchio] = None,
+                 state: Any = None) -> None:
+        """
+        Initializes the view of a model that a query is scored against. It is
+        taken while the index does not change, so queries are scored without
+        holding the lock of the index, unaffected by the documents added,
+        deleted or merged meanwhile.
+
+        Args:
+            parts (List[Any]): Loaded data of every segment.
+            docs (DocTables): Id, title and tombstone of every document of every segment.
+            feedback (Rocchio, optional): Relevance feedback of the scope of the query.
+            state (Any, optional): State learned from the corpus that scoring reads, for models that have one.
+        """
+        self.parts = parts
+        self.docs = docs
+        self.feedback = feedback
+        self.state = state
+
+
+class Model(ABC):
+    def __init__(self) -> None:
+        """
+        Abstract base class for a text model.
+        """
+        self.vocabulary: List[str] = []
+        self.analyzer: QueryAnalyzer = QueryAnalyzer()
+        self.docs: DocTables = DocTables()
+        self.segments: List[str] = []
+        self.parts: List[Any] = []
+        self.feedback_log = FeedbackLog(path=None)
+        # Relevance feedback of the scopes queried last, for models that support it
+        self.feedback: Dict[str, Rocchio] = OrderedDict()
+        self.max_scopes = 256
+        self.loaded = False
+        self.load_lock = threading.Lock()
+
+    def load(self, vocabulary: List[str], analyzer: QueryAnalyzer, dictionary: gensim.corpora.Dictionary,
+             docs: DocTables, segments: List[str], feedback_log: FeedbackLog):
+        """
+        Load the data shared by every model. The index of the model itself is
+        loaded by ensure_loaded, the first time it is needed.
+
+        Args:
             vocabulary (List[str]): List of vocabulary terms.
-            relevant_docs: Relevant documents.
-            non_relevant_docs: Non-relevant documents.
+            analyzer (QueryAnalyzer): Analyzer of the queries.
+            dictionary (gensim.corpora.Dictionary): Dictionary of the lemmas shared by every model.
+            docs (DocTables): Id and title of every document of every segment.
+            segments (List[str]): Directory of every segment, in the order of docs.
+            feedback_log (FeedbackLog): Relevant and non-relevant documents of every scope.
         """
         self.vocabulary = vocabulary
-        self.relevant_docs = relevant_docs
-        self.non_relevant_docs = non_relevant_docs
-        self._load()
+        self.analyzer = analyzer
+        self.dictionary = dictionary
+        self.docs = docs
+        self.segments = segments
+        self.feedback_log = feedback_log
+        self.feedback.clear()
+        self.loaded = False
+
+    def ensure_loaded(self) -> None:
+        """
+        Loads the index of the model if it is not loaded yet. Safe to call from several threads.
+        """
+        if self.loaded:
+            return
+
+        with self.load_lock:
+            if not self.loaded:
+                self._load()
+                self.parts = [self._load_segment(path) for path in self.segments]
+                self.feedback.clear()
+                self.loaded = True
+
+    def set_segments(self, segments: List[str]) -> None:
+        """
+        Changes the segments of the model after documents were added or segments
+        were merged. If the model is loaded, only the new segments are loaded.
+
+        Args:
+            segments (List[str]): Directory of every segment, in the order of docs.
+        """
+        with self.load_lock:
+            if self.loaded:
+                parts = dict(zip(self.segments, self.parts))
+                self.parts = [parts[path] if path in parts else self._load_segment(path) for path in segments]
+            self.segments = segments
+
+    def reload_segments(self) -> None:
+        """
+        Loads again every segment of a loaded model, after their data was rebuilt.
+        """
+        with self.load_lock:
+            if self.loaded:
+                self.parts = [self._load_segment(path) for path in self.segments]
+                self.feedback.clear()
+
+    def reset_feedback(self) -> None:
+        """
+        Discards the sums of the feedback, after the vectors of marked documents
+        changed. They are summed again from the log the next time they are used.
+        """
+        with self.load_lock:
+            self.feedback.clear()
+
+    def add_feedback(self, doc: str, relevant: bool, scope: str = '') -> None:
+        """
+        Adds the vector of a document marked in the feedback log to the sums of
+        its scope, unmarking it from the other set.
+
+        Args:
+            doc (str): Document id.
+            relevant (bool): Whether the document is relevant.
+            scope (str): Scope of the feedback.
+        """
+        with self.load_lock:
+            rocchio = self.feedback.get(scope)
+            if rocchio is not None and doc in self.docs:
+                rocchio.add(doc, self._doc_vector(doc), relevant)
+
+    def remove_feedback(self, doc: str, relevant: bool, scope: str = '') -> None:
+        """
+        Subtracts the vector of a document unmarked in the feedback log from the sums of its scope.
+
+        Args:
+            doc (str): Document id.
+            relevant (bool): Whether the document was marked as relevant.
+            scope (str): Scope of the feedback.
+        """
+        with self.load_lock:
+            rocchio = self.feedback.get(scope)
+            if rocchio is not None:
+                rocchio.remove(doc, relevant)
+
+    def snapshot(self, scope: str = '') -> Snapshot:
+        """
+        Takes the view of the model that a query is scored against. Must be
+        called while the index does not change, and the model is loaded.
+
+        Args:
+            scope (str): Scope of the relevance feedback of the query.
+
+        Returns:
+            Snapshot: The view.
+        """
+        return Snapshot(self.parts, self.docs.snapshot(), self.__feedback(scope), self._state())
+
+    def _state(self) -> Any:
+        """
+        Gets the state learned from the corpus that scoring a query reads.
+        Models whose state changes with the index return it, so it is taken
+        together with the segments.
+
+        Returns:
+            Any: The state, None for models without one.
+        """
+        return None
+
+    def __feedback(self, scope: str) -> Optional[Rocchio]:
+        """
+        Gets a copy of the relevance feedback of a scope. The sums of a scope
+        are computed the first time it is queried, and kept for the max_scopes
+        scopes queried last.
+
+        Args:
+            scope (str): Scope of the feedback.
+
+        Returns:
+            Optional[Rocchio]: The feedback, None for models that do not support it.
+        """
+        with self.load_lock:
+            rocchio = self.feedback.get(scope)
+            if rocchio is None:
+                rocchio = self._rocchio()
+                if rocchio is None:
+                    return None
+                for relevant in [True, False]:
+                    for doc in self.feedback_log.docs(relevant, scope):
+                        if doc in self.docs:
+                            rocchio.add(doc, self._doc_vector(doc), relevant)
+                self.feedback[scope] = rocchio
+                if len(self.feedback) > self.max_scopes:
+                    self.feedback.popitem(last=False)
+            self.feedback.move_to_end(scope)
+            return rocchio.snapshot()
+
+    @staticmethod
+    def _expand(query_vector: np.ndarray, snapshot: Snapshot) -> np.ndarray:
+        """
+        Applies the relevance feedback of a snapshot to the vector of a query.
+
+        Args:
+            query_vector (np.ndarray): Dense vector of the query.
+            snapshot (Snapshot): View of the model the query is scored against.
+
+        Returns:
+            np.ndarray: Dense vector of the expanded query.
+        """
+        if snapshot.feedback is None:
+            return query_vector
+        return snapshot.feedback.expand(query_vector)
+
+    def _rocchio(self) -> Optional[Rocchio]:
+        """
+        Creates the empty relevance feedback of a scope.
+
+        Returns:
+            Optional[Rocchio]: The feedback, None for models that do not support it.
+        """
+        return None
+
+    def _doc_vector(self, doc: str) -> Vector:
+        """
+        Gets the vector of a document used by the relevance feedback. By
+        default, the L2-normalized term counts of the document, read from its
+        segment. Models that score documents in another space override it.
+
+        Args:
+            doc (str): Document id.
+
+        Returns:
+            Vector: Dense vector, or indices and values of a sparse one.
+        """
+        segment, row = self.docs.locate(self.docs.row(doc))
+        bow = Segment.read(os.path.join(self.segments[segment], 'bow')).sparse()
+        start, end = bow.indptr[row], bow.indptr[row + 1]
+        counts = bow.data[start:end].astype(np.float32)
+        norm = np.linalg.norm(counts)
+        return np.array(bow.indices[start:end]), counts / norm if norm != 0 else counts
+
+    def add_documents(self, bow: sparse.csr_matrix) -> bool:
+        """
+        Updates the model with documents added to the index, before their
+        segment is built. Models without state learned from the corpus keep it.
+
+        Args:
+            bow (scipy.sparse.csr_matrix): Term counts of the new documents.
+
+        Returns:
+            bool: Whether the model drifted too far and must be trained again over every document.
+        """
+        return False
+
+    def _locate(self, doc: str) -> Tuple[Any, int]:
+        """
+        Finds the segment of a live document.
+
+        Args:
+            doc (str): Document id.
+
+        Returns:
+            Tuple[Any, int]: The loaded segment and the row of the document in it.
+        """
+        segment, row = self.docs.locate(self.docs.row(doc))
+        return self.parts[segment], row
+
+    def _search_segments(self, search: Callable[[Any, int], Tuple[np.ndarray, np.ndarray]],
+                         cant: int, snapshot: Snapshot) -> List[Tuple[str, str, float]]:
+        """
+        Ranks the live documents of every segment and merges the results.
+
+        Args:
+            search (Callable): Finds the best k rows of a loaded segment and their scores, best first.
+            cant (int): The maximum number of documents to return.
+            snapshot (Snapshot): View of the model the query is scored against.
+
+        Returns:
+            List[Tuple[str, str, float]]: Id, title and score of the best documents.
+        """
+        return self._search_segments_batch(lambda part, k: [search(part, k)], 1, cant, snapshot)[0]
+
+    @staticmethod
+    def _search_segments_batch(search: Callable[[Any, int], List[Tuple[np.ndarray, np.ndarray]]],
+                               n_queries: int, cant: int, snapshot: Snapshot) -> List[List[Tuple[str, str, float]]]:
+        """
+        Ranks the live documents of every segment for several queries at once and merges the results.
+
+        Args:
+            search (Callable): Finds the best k rows of a loaded segment and their scores for every query, best first.
+            n_queries (int): Number of queries.
+            cant (int): The maximum number of documents to return per query.
+            snapshot (Snapshot): View of the model the queries are scored against.
+
+        Returns:
+            List[List[Tuple[str, str, float]]]: Id, title and score of the best documents of every query.
+        """
+        docs = snapshot.docs
+        rows = [[np.empty(0, dtype=np.int64)] for _ in range(n_queries)]
+        scores = [[np.empty(0)] for _ in range(n_queries)]
+        for segment, part in enumerate(snapshot.parts):
+            # Deleted rows are filtered out, so enough extra rows are asked for to replace them
+            deleted = docs.segment_deleted(segment)
+            live = None
+            if len(deleted):
+                live = np.ones(docs.starts[segment + 1] - docs.starts[segment], dtype=bool)
+                live[deleted] = False
+            for i, (part_rows, part_scores) in enumerate(search(part, cant + len(deleted))):
+                if live is not None:
+                    part_rows, part_scores = part_rows[live[part_rows]], part_scores[live[part_rows]]
+                rows[i].append(part_rows + docs.starts[segment])
+                scores[i].append(part_scores)
+
+        results = []
+        for query_rows, query_scores in zip(rows, scores):
+            query_rows, query_scores = np.concatenate(query_rows), np.concatenate(query_scores)
+            best = top_k(query_scores, cant)
+            results.append([(*docs[i], float(v)) for i, v in zip(query_rows[best], query_scores[best]) if v != 0])
+        return results
+
+    def normalize_query(self, query: str) -> Tuple[str, ...]:
+        """
+        Analyzes a query into the terms its results depend on, so queries that
+        only differ in case, punctuation or stop words share their results.
+
+        Args:
+            query (str): The query.
+
+        Returns:
+            Tuple[str, ...]: The terms.
+        """
+        return tuple(self.analyzer.tokenize(query))
+
+    @abstractmethod
+    def query(self, query: str, cant: int, scope: str = '',
+              snapshot: Snapshot = None) -> List[Tuple[str, str, float]]:
+        pass
+
+    def query_batch(self, queries: List[str], cant: int, scope: str = '',
+                    snapshot: Snapshot = None) -> List[List[Tuple[str, str, float]]]:
+        """
+        Executes several queries. Models that can score many queries at once override it.
+
+        Args:
+            queries (List[str]): The queries.
+            cant (int): The maximum number of documents to return per query.
+            scope (str): Scope of the relevance feedback.
+            snapshot (Snapshot, optional): View of the model the queries are scored against. Defaults to the current one.
+
+        Returns:
+            List[List[Tuple[str, str, float]]]: Id, title and score of the best documents of every query.
+        """
+        snapshot = snapshot if snapshot is not None else self.snapshot(scope)
+        return [self.query(query, cant, scope, snapshot) for query in queries]
 
     @abstractmethod
-    def query(self, query: str, cant: int) -> List[Tuple[str, str, float]]:
-        self._query(Model._lemma(query), cant)
+    def build_model(self, dictionary: gensim.corpora.Dictionary, corpus: Iterable[List[Tuple[int, int]]]):
+        pass
 
     @abstractmethod
-    def build_model(self, tokenized_docs: List[Tuple[str, str, List[str]]]):
+    def build_segment(self, path: str, bow: sparse.csr_matrix):
         pass
 
     @abstractmethod
     def _load(self):
         pass
+
+    @abstractmethod
+    def _load_segment(self, path: str) -> Any:
+        pass
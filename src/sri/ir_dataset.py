@@ -1,4 +1,5 @@
-from typing import List
+from itertools import islice
+from typing import Iterator, List
 from .core import Corpus, Document
 import ir_datasets
 
@@ -9,13 +10,17 @@ class IRDataset(Corpus):
         self.name = name
 
     def load(self, cant: int = -1) -> List[Document]:
+        self.documents = list(self.iter(cant))
+
+        return self.documents
+
+    def iter(self, cant: int = -1) -> Iterator[Document]:
         dataset = ir_datasets.load(self.name)
         self.dataset = dataset
 
-        self.documents = [IRDocument(doc.doc_id, doc.title, doc.text)
-                          for doc in dataset.docs_iter()[:cant]]
-
-        return self.documents
+        docs = dataset.docs_iter()
+        for doc in islice(docs, None if cant < 0 else cant):
+            yield IRDocument(doc.doc_id, doc.title, doc.text)
 
     def get_qrels(self) -> List:
         return self.dataset.qrels_iter()
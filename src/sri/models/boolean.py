@@ -1,12 +1,14 @@
-from ..core import Model, QueryBuilder, Document
-from typing import List, Tuple
-import json
+from ..core import Model, QueryBuilder, Document, Snapshot
+from typing import Iterable, List, Tuple
+import gensim
+import os
+import re
+import time
 import numpy as np
-from gensim.matutils import corpus2dense
-from sympy import sympify, to_dnf
-import spacy
-
-nlp = spacy.load('en_core_web_sm')
+from scipy import sparse
+from spacy.lang.en.stop_words import STOP_WORDS
+from ..utils.bitmap import BitmapIndex, DocSet
+from ..utils.boolean_query import BooleanQuery, QueryBudgetExceeded
 
 
 class Boolean(Model):
@@ -15,60 +17,80 @@ class Boolean(Model):
 
     Args:
         query_builders (List[QueryBuilder]): List of query builders.
+        max_clauses (int): Maximum number of terms of a query.
+        time_budget (float): Maximum seconds the evaluation of a query may take.
 
     Attributes:
         query_builders (List[QueryBuilder]): List of query builders.
-        boolean_data_build (dict): Dictionary containing tokenized documents.
+        max_clauses (int): Maximum number of terms of a query.
+        time_budget (float): Maximum seconds the evaluation of a query may take.
+        parts (List[BitmapIndex]): Set of documents that contain every term, for every segment.
 
     Methods:
-        build_model(tokenized_docs: List[Tuple[str, List[str]]]) -> None:
-            Builds the boolean model from tokenized documents.
+        build_model(dictionary: gensim.corpora.Dictionary, corpus: Iterable) -> None:
+            Builds the boolean model from the corpus.
+        build_segment(path: str, bow: scipy.sparse.csr_matrix) -> None:
+            Builds the bitmap index of a segment.
         _load() -> None:
-            Loads the boolean data from a JSON file.
+            Loads the boolean index from files.
         tokenize_query(query: str) -> List[str]:
             Tokenizes a query and returns a list of relevant terms.
-        query_to_DNF(query: str) -> str:
-            Converts a query to Disjunctive Normal Form (DNF).
+        parse_query(query: str) -> BooleanQuery:
+            Parses a query into an expression tree.
 
     """
 
-    def __init__(self, query_builders: List[QueryBuilder] = []) -> None:
+    def __init__(self, query_builders: List[QueryBuilder] = [], max_clauses: int = 64,
+                 time_budget: float = 1.0) -> None:
         super().__init__()
         self.query_builders: List[QueryBuilder] = query_builders
+        self.max_clauses = max_clauses
+        self.time_budget = time_budget
 
-    def build_model(self, tokenized_docs: List[Tuple[str, List[str]]]) -> None:
+    def build_model(self, dictionary: gensim.corpora.Dictionary, corpus: Iterable[List[Tuple[int, int]]]) -> None:
         """
-        Builds the boolean model from tokenized documents.
+        Builds the boolean model from the corpus. The model has no state besides its segments.
 
         Args:
-            tokenized_docs (List[Tuple[str, List[str]]]): List of tokenized documents.
+            dictionary (gensim.corpora.Dictionary): Dictionary of the lemmas of every document.
+            corpus (Iterable[List[Tuple[int, int]]]): Streamed bag of words of every document.
 
         Returns:
             None
         """
-        tokenized_docs = [(doc_id, t, Model._lemma(doc))
-                          for doc_id, t, doc in tokenized_docs]
-        boolean_data_build = {}
-        for i in range(len(tokenized_docs)):
-            boolean_data_build[tokenized_docs[i][0]
-                               ] = tokenized_docs[i][1], tokenized_docs[i][2]
 
-        f = open('data/boolean_data_build.json', 'w')
-        json.dump(boolean_data_build, f)
-        f.close()
+    def build_segment(self, path: str, bow: sparse.csr_matrix) -> None:
+        """
+        Builds the bitmap index of the documents of a segment.
+
+        Args:
+            path (str): Directory of the segment.
+            bow (scipy.sparse.csr_matrix): Term counts of the documents of the segment.
+
+        Returns:
+            None
+        """
+        BitmapIndex.build(bow.tocsc()).save(os.path.join(path, 'boolean'))
 
     def _load(self) -> None:
         """
-        Loads the boolean data from a JSON file.
+        Loads the boolean model from files.
 
         Returns:
             None
         """
-        f = open('data/boolean_data_build.json')
-        self.boolean_data_build = json.load(f)
-        self.boolean_data_build.update(
-            {k: (n, set(v)) for k, (n, v) in self.boolean_data_build.items()})
-        f.close()
+
+    def _load_segment(self, path: str) -> BitmapIndex:
+        """
+        Loads the bitmap index of a segment, memory-mapped.
+
+        Args:
+            path (str): Directory of the segment.
+
+        Returns:
+            BitmapIndex: The index.
+        """
+        return BitmapIndex.load(os.path.join(path, 'boolean'))
 
     def tokenize_query(self, query: str) -> List[str]:
         """
@@ -81,57 +103,65 @@ class Boolean(Model):
             List[str]: List of tokenized terms.
         """
         exceptions = ["and", "or", "not", "(", ")", "&", "|", "~"]
-        query = [token.lemma_ for token in nlp(query.lower(
-        )) if token.lemma_ in exceptions or (not token.is_stop and token.is_alpha)]
+        query = [token if token in exceptions else self.analyzer.lemma(token)
+                 for token in re.findall(r"[()&|~]|[^\W\d_]+", query.lower())
+                 if token in exceptions or token not in STOP_WORDS]
         return query
 
-    def query_to_DNF(self, query: str) -> str:
+    def normalize_query(self, query: str) -> Tuple[str, ...]:
+        """
+        Analyzes a query into its terms and operators.
+
+        Args:
+            query (str): Input query.
+
+        Returns:
+            Tuple[str, ...]: The lemmas of the terms and the operators, in order.
+        """
+        return tuple(self.tokenize_query(query))
+
+    def parse_query(self, query: str) -> BooleanQuery:
         """
-        Converts a query to Disjunctive Normal Form (DNF).
+        Parses a query into an expression tree.
 
         Args:
             query (str): Input query.
 
         Returns:
-            str: Query in DNF.
+            BooleanQuery: The expression tree of the query.
+
+        Raises:
+            QueryBudgetExceeded: If the query has more than max_clauses terms.
         """
         query = self.tokenize_query(query)
         for builder in self.query_builders:
             query = builder.build(query)
-        query = sympify(query)
-        query = to_dnf(query, True)
-        return str(query)
+        return BooleanQuery(query, self.max_clauses)
 
-    def query(self, query: str, _: int) -> List[Tuple[str, str, float]]:
+    def query(self, query: str, _: int, scope: str = '', snapshot: Snapshot = None) -> List[Tuple[str, str, float]]:
         """
         Executes a boolean query and returns a list of matching documents.
 
         Args:
-            query (str): The input query in Disjunctive Normal Form (DNF).
+            query (str): The input query with the operators and, or, not.
             cant (int): The maximum number of matching documents to return.
+            scope (str): Scope of the relevance feedback, which the boolean model does not use.
+            snapshot (Snapshot, optional): View of the model the query is evaluated against. Defaults to the current one.
 
         Returns:
-            List[Document]: A list of matching documents.
-        """
-        query = self.query_to_DNF(query)
-        clauses = query.split(" | ")
-        matching_docs = []
-        for k, (n, v) in self.boolean_data_build.items():
-            for clause in clauses:
-                if clause[0] == "(":
-                    clause = clause[1:-1]
-
-                clause_matched = True
-                for word in clause.split(" & "):
-                    if word[0] == "~":
-                        if word[1:] in v:
-                            clause_matched = False
-                            break
-                    else:
-                        if word not in v:
-                            clause_matched = False
-                            break
-                if clause_matched:
-                    matching_docs.append((k, n, 1))
-                    break
-        return matching_docs
+            List[Document]: A list of matching documents, empty if the query exceeds its budget.
+        """
+        snapshot = snapshot if snapshot is not None else self.snapshot(scope)
+        docs = snapshot.docs
+        deadline = time.perf_counter() + self.time_budget
+        rows = []
+        try:
+            parsed = self.parse_query(query)
+            for segment, index in enumerate(snapshot.parts):
+                result = parsed.evaluate(index, self.dictionary.token2id, deadline - time.perf_counter())
+                result = result - DocSet.from_docs(docs.segment_deleted(segment), index.size)
+                rows.append(result.to_array().astype(np.int64) + docs.starts[segment])
+        except QueryBudgetExceeded:
+            return []
+
+        return [(*docs[i], 1) for i in np.concatenate(rows or [np.empty(0, dtype=np.int64)])]
@@ -1,137 +1,351 @@
-from ..core import Model, QueryBuilder
-from typing import List, Tuple, Dict
-import json
+from ..core import Model, QueryBuilder, Snapshot
+from typing import Iterable, List, Tuple, Dict
+import copy
 import gensim
+import os
+import shutil
 import numpy as np
+from scipy import sparse
 from gensim.models import LsiModel
+from gensim.matutils import Sparse2Corpus, corpus2csc, sparse2full
+
+from ..utils.methods import normalize_rows, top_k, top_k_rows
+from ..utils.rocchio import Rocchio
+from ..utils.ivf import IVFIndex
+from ..utils.segment import Segment
 
-import numpy as np
-from ..utils.methods import sum_vectors, mult_scalar, mean
 
+class LSISegment:
+    def __init__(self, matrix: np.ndarray, ivf: IVFIndex) -> None:
+        """
+        Initializes the LSI data of a segment.
 
-class NpEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, np.integer):
-            return int(obj)
-        if isinstance(obj, np.floating):
-            return float(obj)
-        if isinstance(obj, np.ndarray):
-            return obj.tolist()
-        return super(NpEncoder, self).default(obj)
+        Args:
+            matrix (np.ndarray): Normalized LSI vector of every document of the segment, one per row.
+            ivf (IVFIndex): Inverted file index over the rows of the matrix.
+        """
+        self.matrix = matrix
+        self.ivf = ivf
 
 
 class LSI(Model):
 
-    def __init__(self, query_builders: List[QueryBuilder] = []) -> None:
+    def __init__(self, query_builders: List[QueryBuilder] = [], ann: bool = False, nprobe: int = 8,
+                 chunksize: int = 20000, online: bool = True, max_drift: float = 0.1, batch_size: int = 64) -> None:
         """
         Initialize an LSI model.
 
+        Documents added to a built index update the SVD with gensim's
+        add_documents. The vectors already stored are not projected again, so
+        the updated space is rotated to match the space of the last training as
+        closely as possible, and the drift is the part of the new space that no
+        rotation can match. Over max_drift, the model asks for a full retrain.
+
         Args:
             query_builders: List of query builders.
+            ann: Whether to search approximately with the IVF index instead of scanning every document.
+            nprobe: Number of IVF lists scanned per query in ann mode. Higher means better recall and more latency.
+            chunksize: Number of documents in memory at a time while training.
+            online: Whether added documents update the SVD. Otherwise they are only folded into the trained space.
+            max_drift: Drift, from 0 to 1, over which adding documents retrains the model.
+            batch_size: Number of queries of query_batch scored with a single matrix product.
         """
         super().__init__()
         self.query_builders: List[QueryBuilder] = query_builders
-        self.data_build: Dict[str, List[float]] = {}
-
-    def build_model(self, tokenized_docs: List[Tuple[str, str, List[str]]]):
+        self.ann = ann
+        self.nprobe = nprobe
+        self.chunksize = chunksize
+        self.online = online
+        self.max_drift = max_drift
+        self.batch_size = batch_size
+        self.drift = 0.0
+
+    def build_model(self, dictionary: gensim.corpora.Dictionary, corpus: Iterable[List[Tuple[int, int]]]):
         """
         Build the LSI model.
 
         Args:
-            A list of tuples containing document information.
+            dictionary: Dictionary of the lemmas of every document.
+            corpus: Streamed bag of words of every document, read chunksize documents at a time.
         """
 
-        tokenized_docs = [(doc_id, t, Model._lemma(doc))
-                          for doc_id, t, doc in tokenized_docs]
-        dictionary = gensim.corpora.Dictionary(
-            [doc for _, _, doc in tokenized_docs])
+        num_topics = 100
+        self.lsi = LsiModel(corpus, id2word=dictionary, num_topics=num_topics, chunksize=self.chunksize)
+        # Small corpora have fewer topics than asked for, as many as the columns of the projection
+        topics = self.lsi.projection.u.shape[1]
+        self.basis = np.array(self.lsi.projection.u, dtype=np.float32)
+        self.rotation = np.eye(topics, dtype=np.float32)
+        self.drift = 0.0
 
-        corpus = [dictionary.doc2bow(doc) for _, _, doc in tokenized_docs]
+        self.__save()
+        Segment.write("data/lsi_basis", {'basis': self.basis})
 
-        num_topics = 100
-        lsi = LsiModel(corpus, id2word=dictionary, num_topics=num_topics)
+    def add_documents(self, bow: sparse.csr_matrix) -> bool:
+        """
+        Updates the SVD with documents added to the index. Terms the model does
+        not know are ignored until it is trained again.
+
+        Args:
+            bow (scipy.sparse.csr_matrix): Term counts of the new documents.
 
-        lsi.save("data/lsi.model")
-        dictionary.save("data/dictionary_lsi.dict")
+        Returns:
+            bool: Whether the drift is over max_drift and the model must be trained again.
+        """
+        if not self.online:
+            return False
+
+        num_terms = self.lsi.num_terms
+        bow = bow[:, :num_terms] if bow.shape[1] > num_terms else bow
+        bow = sparse.csr_matrix((bow.data, bow.indices, bow.indptr), shape=(bow.shape[0], num_terms))
+        # A copy is updated, as gensim changes the projection in place and queries may be reading it
+        lsi = copy.copy(self.lsi)
+        lsi.projection = copy.copy(self.lsi.projection)
+        lsi.add_documents(Sparse2Corpus(bow, documents_columns=False), chunksize=self.chunksize)
+
+        # Orthogonal Procrustes: the rotation of the new space closest to the trained one
+        # The update may keep fewer topics than the trained space, so the rotation is not always square
+        overlap = lsi.projection.u.T @ self.basis
+        left, cosines, right = np.linalg.svd(overlap, full_matrices=False)
+        self.lsi, self.rotation = lsi, (left @ right).astype(np.float32)
+        self.drift = float(1 - np.sum(cosines ** 2) / self.basis.shape[1])
+
+        self.__save()
+        return self.drift > self.max_drift
+
+    def __save(self):
+        """
+        Saves the model and its rotation, replacing the files of the previous
+        version only once every new file is written.
+        """
+        shutil.rmtree("data/lsi.tmp", ignore_errors=True)
+        os.makedirs("data/lsi.tmp")
+        # Arrays stored apart from the pickle, so loading can memory-map them
+        self.lsi.save("data/lsi.tmp/lsi.model", sep_limit=0)
+        for name in os.listdir("data/lsi.tmp"):
+            os.replace(os.path.join("data/lsi.tmp", name), os.path.join("data", name))
+        os.rmdir("data/lsi.tmp")
 
-        vector_repr = [lsi[doc] for doc in corpus]
+        Segment.write("data/lsi_rotation", {'rotation': self.rotation}, {'drift': self.drift})
 
-        data_build = {}
+    def _state(self) -> Tuple[LsiModel, np.ndarray]:
+        """
+        Gets the SVD and its rotation, which change as documents are added.
 
-        for i in range(len(vector_repr)):
-            data_build[tokenized_docs[i][0]
-                       ] = tokenized_docs[i][1], vector_repr[i]
+        Returns:
+            Tuple[LsiModel, np.ndarray]: The model and the rotation into the space of the stored vectors.
+        """
+        return self.lsi, self.rotation
 
-        with open('data/data_build_lsi.json', 'w') as f:
-            json.dump(data_build, f, cls=NpEncoder)
+    @staticmethod
+    def __projection(state: Tuple[LsiModel, np.ndarray], num_terms: int) -> np.ndarray:
+        """
+        Gets the matrix that projects the term counts of a document into the
+        space of the stored vectors.
+
+        Args:
+            state (Tuple[LsiModel, np.ndarray]): The model and its rotation.
+            num_terms (int): Number of terms of the documents.
+
+        Returns:
+            np.ndarray: Projection matrix, one row per term.
+        """
+        lsi, rotation = state
+        return lsi.projection.u[:num_terms] @ rotation
+
+    def build_segment(self, path: str, bow: sparse.csr_matrix):
+        """
+        Projects the documents of a segment into the LSI space. Documents added
+        after the model was trained are folded into the existing space, and the
+        terms the model does not know are ignored.
+
+        Args:
+            path (str): Directory of the segment.
+            bow (scipy.sparse.csr_matrix): Term counts of the documents of the segment.
+        """
+        num_terms = self.lsi.num_terms
+        bow = bow[:, :num_terms] if bow.shape[1] > num_terms else bow
+
+        # One pre-normalized float32 row per document, so a query is a single matmul
+        matrix = np.asarray(bow @ self.__projection(self._state(), bow.shape[1]), dtype=np.float32)
+        matrix = np.ascontiguousarray(normalize_rows(matrix))
+        Segment.write(os.path.join(path, 'lsi'), {'matrix': matrix})
+        IVFIndex.build(matrix).save(os.path.join(path, 'lsi_ivf'))
 
     def _load(self):
         """
         Load the LSI model.
         """
 
-        self.lsi = LsiModel.load("data/lsi.model")
-        self.dictionary = gensim.corpora.Dictionary.load(
-            "data/dictionary_lsi.dict")
+        self.lsi = LsiModel.load("data/lsi.model", mmap='r')
+        self.basis = Segment.read("data/lsi_basis")['basis']
+        rotation = Segment.read("data/lsi_rotation", mmap=False)
+        self.rotation = rotation['rotation']
+        self.drift = rotation.meta['drift']
 
-        with open('data/data_build_lsi.json') as f:
-            self.data_build = json.load(f)
+    def _load_segment(self, path: str) -> LSISegment:
+        """
+        Loads the LSI vectors and the IVF index of a segment, memory-mapped.
 
-        self.relevant_docs = set()
-        self.non_relevant_docs = set()
+        Args:
+            path (str): Directory of the segment.
 
-    def __rocchio_algorithm(self, query):
-        '''
-        Rocchio Algorithm
+        Returns:
+            LSISegment: The data of the segment.
+        """
+        return LSISegment(Segment.read(os.path.join(path, 'lsi'))['matrix'],
+                          IVFIndex.load(os.path.join(path, 'lsi_ivf')))
 
-        query: Original query
+    def _rocchio(self) -> Rocchio:
+        """
+        Creates the empty relevance feedback of a scope, over dense LSI vectors.
 
-        return:
-        query_rocchio: Modified query
-        '''
+        Returns:
+            Rocchio: The feedback.
+        """
+        return Rocchio(sparse=False)
 
-        a = 1.0  # Weight of the original query
-        b = 0.8  # Weight of relevant documents
-        c = 0.1  # Weight of non-relevant documents
+    def _doc_vector(self, doc: str) -> np.ndarray:
+        """
+        Gets the LSI vector of a document.
 
-        relevant_docs_bow = [self.data_build[doc][1]
-                             for doc in self.relevant_docs]
-        non_relevant_docs_bow = [self.dictionary.doc2bow(Model._lemma(
-            self.data_build[doc][1])) for doc in self.non_relevant_docs]
+        Args:
+            doc (str): Document id.
 
-        mean_relevant = mean(relevant_docs_bow)
-        mean_non_relevant = mean(non_relevant_docs_bow)
+        Returns:
+            np.ndarray: Dense vector of the document.
+        """
+        part, row = self._locate(doc)
+        return np.array(part.matrix[row])
 
-        # Calculate the modified Rocchio query
-        query_rocchio = sum_vectors(sum_vectors(mult_scalar(query, a),  mult_scalar(
-            mean_relevant, b)), mult_scalar(mean_non_relevant, c))
+    def query_vector(self, query: str, snapshot: Snapshot) -> np.ndarray:
+        """
+        Computes the normalized LSI vector of a query, including Rocchio feedback.
+        It is the first stage of query, the analysis, and search is the second,
+        so they can be timed apart.
 
-        return query_rocchio
+        Args:
+            query (str): The input query.
+            snapshot (Snapshot): View of the model the query is scored against.
 
-    def query(self, query: str, cant: int) -> List[Tuple[str, str, float]]:
+        Returns:
+            np.ndarray: Dense query vector, all zeros if no query term is in the vocabulary.
         """
-        Executes a LSI query and returns a list of relevant documents.
+        lsi, rotation = snapshot.state
+        query_bow = self.__bow(self.analyzer.lemmatize(self._query_tokens(query)), lsi.num_terms)
+
+        query_lsi = sparse2full(lsi[query_bow], len(rotation)) @ rotation
+
+        return self.__feedback_vector(query_lsi, snapshot)
+
+    def _query_tokens(self, query: str) -> List[str]:
+        """
+        Tokenizes a query and applies the query builders.
 
         Args:
             query (str): The input query.
-            cant (int): The maximum number of relevant documents to return.
 
         Returns:
-            List[Document]: A list of relevant documents.
+            List[str]: The tokens.
         """
-
-        query_tokens = Model._tokenize_doc(query)
+        query_tokens = self.analyzer.tokenize(query)
 
         for builder in self.query_builders:
             query_tokens = builder.build(query_tokens, self.vocabulary)
 
-        query_bow = self.dictionary.doc2bow(Model._lemma(query_tokens))
+        return query_tokens
+
+    def __bow(self, lemmas: List[str], num_terms: int) -> List[Tuple[int, int]]:
+        """
+        Gets the bag of words of the lemmas of a query, without the terms the model does not know.
+        """
+        return [(term, count) for term, count in self.dictionary.doc2bow(lemmas) if term < num_terms]
+
+    def __feedback_vector(self, query_lsi: np.ndarray, snapshot: Snapshot) -> np.ndarray:
+        """
+        Normalizes the LSI vector of a query, applies the Rocchio feedback to
+        it and normalizes the result, so the weight of the feedback does not
+        depend on the length of the query.
+        """
+        query_vector = self._expand(self.__normalize(query_lsi), snapshot)
+
+        return self.__normalize(query_vector)
+
+    @staticmethod
+    def __normalize(vector: np.ndarray) -> np.ndarray:
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm != 0 else vector
+
+    def search(self, query_vector: np.ndarray, cant: int, snapshot: Snapshot) -> List[Tuple[str, str, float]]:
+        """
+        Ranks the documents by cosine similarity with a normalized query vector,
+        from query_vector.
+
+        Args:
+            query_vector (np.ndarray): Dense normalized query vector.
+            cant (int): The maximum number of relevant documents to return.
+            snapshot (Snapshot): View of the model the query is scored against.
 
-        query_lsi = self.lsi[query_bow]
+        Returns:
+            List[Tuple[str, str, float]]: Id, title and score of the best documents.
+        """
+        def search(part: LSISegment, k: int) -> Tuple[np.ndarray, np.ndarray]:
+            if self.ann:
+                return part.ivf.search(part.matrix, query_vector, k, self.nprobe)
+            scores = part.matrix @ query_vector
+            rows = top_k(scores, k)
+            return rows, scores[rows]
 
-        similarities = [(gensim.matutils.cossim(self.__rocchio_algorithm(query_lsi), v), k, n)
-                        for k, (n, v) in self.data_build.items()]
+        return self._search_segments(search, cant, snapshot)
 
-        similarities.sort(reverse=True)
+    def query(self, query: str, cant: int, scope: str = '', snapshot: Snapshot = None) -> List[Tuple[str, str, float]]:
+        """
+        Executes a LSI query and returns a list of relevant documents.
+
+        Args:
+            query (str): The input query.
+            cant (int): The maximum number of relevant documents to return.
+            scope (str): Scope of the relevance feedback.
+            snapshot (Snapshot, optional): View of the model the query is scored against. Defaults to the current one.
 
-        return [(k, n, v) for v, k, n in similarities[:cant] if v != 0]
+        Returns:
+            List[Document]: A list of relevant documents.
+        """
+        snapshot = snapshot if snapshot is not None else self.snapshot(scope)
+        return self.search(self.query_vector(query, snapshot), cant, snapshot)
+
+    def query_batch(self, queries: List[str], cant: int, scope: str = '',
+                    snapshot: Snapshot = None) -> List[List[Tuple[str, str, float]]]:
+        """
+        Executes several LSI queries. The words of every query are lemmatized
+        together, the bags of words of every batch_size queries are projected
+        into the LSI space with a single matrix product, and the resulting
+        matrix is scored against the LSI matrix of every segment with another.
+
+        Args:
+            queries (List[str]): The input queries.
+            cant (int): The maximum number of relevant documents to return per query.
+            scope (str): Scope of the relevance feedback.
+            snapshot (Snapshot, optional): View of the model the queries are scored against. Defaults to the current one.
+
+        Returns:
+            List[List[Tuple[str, str, float]]]: Id, title and score of the best documents of every query.
+        """
+        snapshot = snapshot if snapshot is not None else self.snapshot(scope)
+        lemmas = self.analyzer.lemmatize_batch([self._query_tokens(query) for query in queries])
+        num_terms = snapshot.state[0].num_terms
+        projection = self.__projection(snapshot.state, num_terms)
+
+        results = []
+        for start in range(0, len(queries), self.batch_size):
+            bows = [self.__bow(query_lemmas, num_terms) for query_lemmas in lemmas[start:start + self.batch_size]]
+            counts = sparse.csr_matrix(corpus2csc(bows, num_terms=num_terms).T)
+            vectors = np.asarray(counts @ projection)
+            vectors = np.vstack([self.__feedback_vector(vector, snapshot) for vector in vectors]).astype(np.float32)
+
+            def search(part: LSISegment, k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+                if self.ann:
+                    return [part.ivf.search(part.matrix, vector, k, self.nprobe) for vector in vectors]
+                return top_k_rows(vectors @ part.matrix.T, k)
+
+            results.extend(self._search_segments_batch(search, len(vectors), cant, snapshot))
+        return results
@@ -1,9 +1,32 @@
-from ..core import Model, QueryBuilder
-from typing import List, Tuple, Dict
-import json
+from ..core import Model, QueryBuilder, Snapshot
+from typing import Iterable, List, Tuple, Dict
 import gensim
+import os
 import numpy as np
-from ..utils.methods import sum_vectors, mult_scalar, mean
+from scipy import sparse
+from gensim.matutils import sparse2full, unitvec
+from ..utils.methods import top_k, top_k_rows
+from ..utils.rocchio import Rocchio
+from ..utils.inverted_index import InvertedIndex
+from ..utils.segment import Segment
+
+
+class VectorialSegment:
+    def __init__(self, matrix: sparse.csr_matrix, index: InvertedIndex) -> None:
+        """
+        Initializes the vectorial data of a segment.
+
+        Args:
+            matrix (scipy.sparse.csr_matrix): Document-term TF matrix of the documents of the segment.
+            index (InvertedIndex): Postings lists of every term, with their term frequencies.
+
+        Attributes:
+            weights (Tuple): Statistics of the dictionary the weights were computed with, the inverse of the
+                TF-IDF norm of every document, and the highest normalized TF-IDF weight of every term over its IDF.
+        """
+        self.matrix = matrix
+        self.index = index
+        self.weights: Tuple[Tuple[int, int, int], np.ndarray, np.ndarray] = None
 
 
 class Vectorial(Model):
@@ -12,131 +35,330 @@ class Vectorial(Model):
 
     Args:
         query_builders (List[QueryBuilder]): List of query builders.
+        pruning (bool): Whether to rank with the pruned inverted index instead of a full scan.
+        batch_size (int): Number of queries of query_batch scored with a single matrix product.
 
     Attributes:
         query_builders (List[QueryBuilder]): List of query builders.
-        tfidf (gensim.models.TfidfModel): TF-IDF model.
-        dictionary (gensim.corpora.Dictionary): Dictionary for vector representation.
-        data_build (dict): Dictionary containing vector representations of documents.
-        relevant_docs (set): Set of relevant document titles.
-        non_relevant_docs (set): Set of non-relevant document titles.
+        pruning (bool): Whether to rank with the pruned inverted index instead of a full scan.
+        dictionary (gensim.corpora.Dictionary): Dictionary for vector representation, with the global document frequencies.
+        parts (List[VectorialSegment]): TF matrix and inverted index of every segment.
+        docs (DocTables): Document id and title of every row of every segment.
+        feedback_log (FeedbackLog): Relevant and non-relevant documents of every scope.
+        feedback (Dict[str, Rocchio]): Sums of the TF-IDF vectors of the relevant and non-relevant documents, per scope.
 
     Methods:
-        build_model(tokenized_docs: List[Tuple[str, List[str]]]) -> None:
-            Builds the vectorial model from tokenized documents.
+        build_model(dictionary: gensim.corpora.Dictionary, corpus: Iterable) -> None:
+            Builds the vectorial model from the corpus.
+        build_segment(path: str, bow: scipy.sparse.csr_matrix) -> None:
+            Builds the TF matrix and the inverted index of a segment.
         _load() -> None:
             Loads the vectorial data from files.
-        __rocchio_algorithm(query) -> None:
-            Calculates the Rocchio query with feedback.
+        _doc_vector(doc: str) -> Tuple[np.ndarray, np.ndarray]:
+            Gets the TF-IDF vector of a document for the Rocchio feedback.
+        query_vector(query: str, snapshot: Snapshot) -> np.ndarray:
+            Computes the TF-IDF vector of a query, the first stage of query.
+        search(query_vector: np.ndarray, cant: int, snapshot: Snapshot) -> List[Tuple[str, str, float]]:
+            Ranks the documents with the vector of a query, the second stage of query.
 
     """
-    def __init__(self, query_builders: List[QueryBuilder] = []) -> None:
+    def __init__(self, query_builders: List[QueryBuilder] = [], pruning: bool = True, batch_size: int = 64) -> None:
         super().__init__()
         self.query_builders: List[QueryBuilder] = query_builders
-        self.data_build: Dict[str, List[float]] = {}
+        self.pruning = pruning
+        self.batch_size = batch_size
+        # Statistics of the dictionary the IDF was computed with, and the IDF of every term
+        self.idf: Tuple[Tuple[int, int, int], np.ndarray] = ((-1, -1, -1), np.zeros(0))
 
-    def build_model(self, tokenized_docs: List[Tuple[str, str, List[str]]]):
+    def build_model(self, dictionary: gensim.corpora.Dictionary, corpus: Iterable[List[Tuple[int, int]]]):
         """
-        Builds the vectorial model from tokenized documents.
+        Builds the vectorial model from the corpus. The IDF of the terms comes
+        from the global document frequencies of the dictionary, so the model has
+        no state besides its segments.
 
         Args:
-            tokenized_docs (List[Tuple[str, List[str]]]): List of tokenized documents.
+            dictionary (gensim.corpora.Dictionary): Dictionary of the lemmas of every document.
+            corpus (Iterable[List[Tuple[int, int]]]): Streamed bag of words of every document.
 
         Returns:
             None
         """
-        tokenized_docs = [(doc_id, t, Model._lemma(doc))
-                          for doc_id, t, doc in tokenized_docs]
-        dictionary = gensim.corpora.Dictionary(
-            [doc for _, _, doc in tokenized_docs])
+        self.dictionary = dictionary
 
-        corpus = [dictionary.doc2bow(doc) for _, _, doc in tokenized_docs]
+    def build_segment(self, path: str, bow: sparse.csr_matrix):
+        """
+        Builds the TF matrix and the inverted index of the documents of a segment.
+        The global IDF is applied when the segment is queried, so segments
+        written before documents were added score with the same IDF as new ones.
 
-        tfidf = gensim.models.TfidfModel(corpus)
+        Args:
+            path (str): Directory of the segment.
+            bow (scipy.sparse.csr_matrix): Term counts of the documents of the segment.
 
-        tfidf.save("data/tfidf.model")
-        dictionary.save("data/dictionary_vectorial.dict")
-        vector_repr = [tfidf[doc] for doc in corpus]
+        Returns:
+            None
+        """
+        matrix = sparse.csr_matrix(bow, dtype=np.float32)
+        matrix.sort_indices()
 
-        data_build = {}
+        Segment.write_sparse(os.path.join(path, 'vectorial'), matrix)
+        InvertedIndex.build(matrix).save(os.path.join(path, 'vectorial_index'))
 
-        for i in range(len(vector_repr)):
-            data_build[tokenized_docs[i][0]
-                       ] = tokenized_docs[i][1], vector_repr[i]
+    def add_documents(self, bow: sparse.csr_matrix) -> bool:
+        """
+        Discards the sums of the feedback when documents are added, as they
+        change the IDF of the vectors of the marked documents.
 
-        f = open('data/data_build_vectorial.json', 'w')
-        json.dump(data_build, f)
-        f.close()
+        Args:
+            bow (scipy.sparse.csr_matrix): Term counts of the new documents.
+
+        Returns:
+            bool: False, the model has nothing to train.
+        """
+        self.reset_feedback()
+        return False
 
     def _load(self):
         """
-        Loads the vectorial data from files.
+        The vectorial model keeps nothing besides the segments and the shared dictionary.
+        """
+        pass
+
+    def _load_segment(self, path: str) -> VectorialSegment:
+        """
+        Loads the TF-IDF matrix and the inverted index of a segment, memory-mapped.
+
+        Args:
+            path (str): Directory of the segment.
 
         Returns:
-            None
+            VectorialSegment: The data of the segment.
         """
-        self.tfidf = gensim.models.TfidfModel.load("data/tfidf.model")
-        self.dictionary = gensim.corpora.Dictionary.load(
-            "data/dictionary_vectorial.dict")
+        return VectorialSegment(Segment.read(os.path.join(path, 'vectorial')).sparse(),
+                                InvertedIndex.load(os.path.join(path, 'vectorial_index')))
 
-        f = open('data/data_build_vectorial.json')
-        self.data_build = json.load(f)
-        f.close()
+    def _state(self) -> Tuple[Tuple[int, int, int], np.ndarray]:
+        """
+        Gets the global IDF, which changes as documents are added and merged.
 
-        self.relevant_docs = set()
-        self.non_relevant_docs = set()
+        Returns:
+            Tuple[Tuple[int, int, int], np.ndarray]: Statistics of the dictionary it was computed with, and IDF of
+            every term.
+        """
+        return self.__idf()
 
-    def __rocchio_algorithm(self, query):
-        '''
-        Rocchio Algorithm
+    def __idf(self) -> Tuple[Tuple[int, int, int], np.ndarray]:
+        """
+        Gets the IDF of every term from the global document frequencies of the
+        dictionary. It is recomputed only after the dictionary changes, so it
+        must be called while the dictionary does not change.
 
-        query: Original query
+        Returns:
+            Tuple[Tuple[int, int, int], np.ndarray]: Statistics of the dictionary it was computed with, and IDF of
+            every term, 0 for terms in every document.
+        """
+        stats = (self.dictionary.num_docs, self.dictionary.num_nnz, len(self.dictionary))
+        if stats != self.idf[0]:
+            terms = np.fromiter(self.dictionary.dfs.keys(), dtype=np.int64, count=len(self.dictionary.dfs))
+            dfs = np.fromiter(self.dictionary.dfs.values(), dtype=np.float64, count=len(self.dictionary.dfs))
+            idf = np.zeros(len(self.dictionary))
+            idf[terms] = np.log2(self.dictionary.num_docs / np.maximum(dfs, 1))
+            self.idf = (stats, idf)
+        return self.idf
+
+    @staticmethod
+    def __weights(part: VectorialSegment, state: Tuple[Tuple[int, int, int], np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Gets the factors that turn the term frequencies of a segment into
+        L2-normalized TF-IDF weights with a global IDF. They are computed
+        again, with a pass over the postings of the segment, only after the
+        dictionary changes.
 
-        return:
-        query_rocchio: Modified query
-        '''
-        a = 1.0  # Weight of the original query
-        b = 0.8  # Weight of relevant documents
-        c = 0.1  # Weight of non-relevant documents
+        Args:
+            part (VectorialSegment): The segment.
+            state (Tuple[Tuple[int, int, int], np.ndarray]): The IDF and the statistics it was computed with.
 
-        # Convertir los documentos relevantes y no relevantes a su representación BoW
-        relevant_docs_bow = [self.data_build[doc][1]
-                             for doc in self.relevant_docs]
-        non_relevant_docs_bow = [self.dictionary.doc2bow(Model._lemma(
-            self.data_build[doc][1])) for doc in self.non_relevant_docs]
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Inverse of the TF-IDF norm of every document, and highest normalized
+            weight of every term divided by its IDF, the bound of MaxScore.
+        """
+        stats, idf = state
+        weights = part.weights
+        if weights is None or weights[0] != stats:
+            matrix = part.matrix
+            idf = idf[:matrix.shape[1]]
+            norms = np.sqrt(matrix.multiply(matrix) @ (idf ** 2))
+            scale = np.divide(1, norms, out=np.zeros_like(norms), where=norms != 0).astype(np.float32)
+
+            postings = part.index.matrix
+            max_impact = np.zeros(postings.shape[1])
+            nonempty = np.flatnonzero(np.diff(postings.indptr))
+            if len(nonempty):
+                max_impact[nonempty] = np.maximum.reduceat(postings.data * scale[postings.indices],
+                                                           postings.indptr[nonempty])
+            # Replaced at once, so concurrent queries never see the weights of two versions
+            weights = part.weights = (stats, scale, max_impact)
+        return weights[1], weights[2]
+
+    def _rocchio(self) -> Rocchio:
+        """
+        Creates the empty relevance feedback of a scope, over sparse TF-IDF vectors.
 
-        mean_relevant = mean(relevant_docs_bow)
-        mean_non_relevant = mean(non_relevant_docs_bow)
+        Returns:
+            Rocchio: The feedback.
+        """
+        # Negative weights are clipped, as MaxScore only ranks by terms with positive weights
+        return Rocchio(sparse=True, clip=True)
 
-        # Calculate the modified Rocchio query
-        query_rocchio = sum_vectors(sum_vectors(mult_scalar(query, a),  mult_scalar(
-            mean_relevant, b)), mult_scalar(mean_non_relevant, c))
+    def _doc_vector(self, doc: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Gets the L2-normalized TF-IDF vector of a document.
 
-        return query_rocchio
+        Args:
+            doc (str): Document id.
 
-    def query(self, query: str, cant: int) -> List[Tuple[str, float]]:
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Terms and weights of the sparse vector of the document.
         """
-        Executes a vectorial query and returns a list of relevant documents.
+        part, row = self._locate(doc)
+        state = self.__idf()
+        scale, _ = self.__weights(part, state)
+        start, end = part.matrix.indptr[row], part.matrix.indptr[row + 1]
+        terms = np.array(part.matrix.indices[start:end])
+        weights = part.matrix.data[start:end] * state[1][terms] * scale[row]
+        return terms[weights != 0], weights[weights != 0].astype(np.float32)
+
+    def query_vector(self, query: str, snapshot: Snapshot) -> np.ndarray:
+        """
+        Computes the normalized TF-IDF vector of a query, including Rocchio feedback.
+        It is the first stage of query, the analysis, and search is the second,
+        so they can be timed apart.
 
         Args:
             query (str): The input query.
-            cant (int): The maximum number of relevant documents to return.
+            snapshot (Snapshot): View of the model the query is scored against.
 
         Returns:
-            List[Document]: A list of relevant documents.
+            np.ndarray: Dense query vector, all zeros if no query term is in the vocabulary.
+        """
+        return self.__lemmas_vector(self.analyzer.lemmatize(self._query_tokens(query)), snapshot)
+
+    def _query_tokens(self, query: str) -> List[str]:
         """
-        query_tokens = Model._tokenize_doc(query)
+        Tokenizes a query and applies the query builders.
+
+        Args:
+            query (str): The input query.
+
+        Returns:
+            List[str]: The tokens.
+        """
+        query_tokens = self.analyzer.tokenize(query)
 
         for builder in self.query_builders:
             query_tokens = builder.build(query_tokens, self.vocabulary)
 
-        query_bow = self.dictionary.doc2bow(Model._lemma(query_tokens))
+        return query_tokens
 
-        query_tfidf = self.tfidf[query_bow]
+    def __lemmas_vector(self, lemmas: List[str], snapshot: Snapshot) -> np.ndarray:
+        """
+        Computes the normalized TF-IDF vector of the lemmas of a query, including Rocchio feedback.
 
-        similarities = [(gensim.matutils.cossim(self.__rocchio_algorithm(query_tfidf), v), k, n)
-                        for k, (n, v) in self.data_build.items()]
+        Args:
+            lemmas (List[str]): Lemmas of the query.
+            snapshot (Snapshot): View of the model the query is scored against.
+
+        Returns:
+            np.ndarray: Dense query vector, all zeros if no query term is in the vocabulary.
+        """
+        query_bow = self.dictionary.doc2bow(lemmas)
+
+        _, idf = snapshot.state
+        # Terms added to the dictionary after the snapshot are in no document of it
+        query_tfidf = unitvec([(term, tf * idf[term]) for term, tf in query_bow if term < len(idf) and idf[term] != 0])
 
-        similarities.sort(reverse=True)
+        query_vector = self._expand(sparse2full(query_tfidf, len(idf)), snapshot)
+        norm = np.linalg.norm(query_vector)
 
-        return [(k, n, v) for v, k, n in similarities[:cant] if v != 0]
+        return query_vector / norm if norm != 0 else query_vector
+
+    def search(self, query_vector: np.ndarray, cant: int, snapshot: Snapshot) -> List[Tuple[str, str, float]]:
+        """
+        Ranks the documents by cosine similarity with a normalized query vector,
+        from query_vector.
+
+        Args:
+            query_vector (np.ndarray): Dense normalized query vector.
+            cant (int): The maximum number of relevant documents to return.
+            snapshot (Snapshot): View of the model the query is scored against.
+
+        Returns:
+            List[Tuple[str, str, float]]: Id, title and score of the best documents.
+        """
+        _, idf = snapshot.state
+        # The IDF of the documents is applied to the query instead
+        weighted = query_vector * idf[:len(query_vector)]
+
+        def search(part: VectorialSegment, k: int) -> Tuple[np.ndarray, np.ndarray]:
+            scale, max_impact = self.__weights(part, snapshot.state)
+            # Segments added before the last terms of the dictionary do not have their columns
+            vector = weighted[:part.matrix.shape[1]]
+            if self.pruning:
+                return part.index.top_k(vector, k, scale, max_impact)
+            scores = (part.matrix @ vector) * scale
+            rows = top_k(scores, k)
+            return rows, scores[rows]
+
+        return self._search_segments(search, cant, snapshot)
+
+    def query(self, query: str, cant: int, scope: str = '', snapshot: Snapshot = None) -> List[Tuple[str, float]]:
+        """
+        Executes a vectorial query and returns a list of relevant documents.
+
+        Args:
+            query (str): The input query.
+            cant (int): The maximum number of relevant documents to return.
+            scope (str): Scope of the relevance feedback.
+            snapshot (Snapshot, optional): View of the model the query is scored against. Defaults to the current one.
+
+        Returns:
+            List[Document]: A list of relevant documents.
+        """
+        snapshot = snapshot if snapshot is not None else self.snapshot(scope)
+        return self.search(self.query_vector(query, snapshot), cant, snapshot)
+
+    def query_batch(self, queries: List[str], cant: int, scope: str = '',
+                    snapshot: Snapshot = None) -> List[List[Tuple[str, str, float]]]:
+        """
+        Executes several vectorial queries. The words of every query are
+        lemmatized together, and every batch_size queries are stacked into a
+        sparse matrix that is scored against the TF-IDF matrix of every segment
+        with a single matrix product.
+
+        Args:
+            queries (List[str]): The input queries.
+            cant (int): The maximum number of relevant documents to return per query.
+            scope (str): Scope of the relevance feedback.
+            snapshot (Snapshot, optional): View of the model the queries are scored against. Defaults to the current one.
+
+        Returns:
+            List[List[Tuple[str, str, float]]]: Id, title and score of the best documents of every query.
+        """
+        snapshot = snapshot if snapshot is not None else self.snapshot(scope)
+        lemmas = self.analyzer.lemmatize_batch([self._query_tokens(query) for query in queries])
+
+        results = []
+        for start in range(0, len(queries), self.batch_size):
+            vectors = np.vstack([self.__lemmas_vector(query_lemmas, snapshot)
+                                 for query_lemmas in lemmas[start:start + self.batch_size]])
+            # The IDF of the documents is applied to the queries instead
+            vectors = sparse.csr_matrix(vectors * snapshot.state[1][:vectors.shape[1]].astype(np.float32))
+
+            def search(part: VectorialSegment, k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+                scale, _ = self.__weights(part, snapshot.state)
+                # Segments added before the last terms of the dictionary do not have their columns
+                scores = (vectors[:, :part.matrix.shape[1]] @ part.matrix.T).toarray() * scale
+                return top_k_rows(scores, k)
+
+            results.extend(self._search_segments_batch(search, vectors.shape[0], cant, snapshot))
+        return results
@@ -1,6 +1,6 @@
 import csv
 import json
-from typing import List
+from typing import Iterator, List
 from ..core import Corpus
 from .movie_doc import Movie
 
@@ -31,6 +31,21 @@ class MovieCorpus(Corpus):
         - List[Movie]
             A list of Movie objects.
         '''
+        self.documents = list(self.iter(cant))
+        return self.documents
+
+    def iter(self, cant: int = -1) -> Iterator[Movie]:
+        '''
+        Reads movie data from the CSV file one row at a time.
+
+        Parameters:
+        - cant: int (optional)
+            The number of documents to read (-1 reads all).
+
+        Returns:
+        - Iterator[Movie]
+            The Movie objects, in file order.
+        '''
         def process_genres(genres_str):
             '''
             Processes the genres string and extracts genre names.
@@ -69,7 +84,7 @@ class MovieCorpus(Corpus):
                 if cant == ind:
                     break
 
-                self.documents.append(Movie(
+                yield Movie(
                     str(i),
                     row['title'],
                     row['overview'],
@@ -77,7 +92,6 @@ class MovieCorpus(Corpus):
                     row['original_language'],
                     row['popularity'],
                     row['vote_average']
-                ))
+                )
 
                 ind += 1
-        return self.documents
@@ -1,13 +1,23 @@
-from .utils.synonimous import SynonimousDictionary
+from .utils.synonimous import SynonymMap
 from typing import List
 from .core import QueryBuilder
-import spacy
-from fuzzywuzzy import process
-
-nlp = spacy.load('en_core_web_sm')
+from .utils.segment import SegmentError
+from .utils.spelling import SpellingIndex
 
 
 class SpellingChecker(QueryBuilder):
+    def __init__(self, path: str = 'data/spelling', score_cutoff: int = 70) -> None:
+        """
+        Initializes a spelling checker over the spelling index saved by the system.
+
+        Args:
+            path (str): Directory of the spelling index.
+            score_cutoff (int): Minimum similarity, from 0 to 100, of a correction to its token.
+        """
+        self.path = path
+        self.score_cutoff = score_cutoff
+        self.index: SpellingIndex = None
+
     def build(self, tokens: List[str], words: List[str]):
         """
         Build a corrected list of tokens by checking against a list of valid words.
@@ -19,21 +29,51 @@ class SpellingChecker(QueryBuilder):
         Returns:
             List[str]: A list of corrected tokens, including valid words and close matches.
         """
+        index = self.__index(words)
         result = tokens.copy()
 
         q = set(tokens)
 
         for token in tokens:
-            if token in words:
+            if token in index:
                 continue
 
-            w = process.extractOne(token, words, score_cutoff=70)
+            w = index.correct(token, self.score_cutoff)
 
-            if w and w[0] not in q:
-                result.append(w[0])
+            if w and w not in q:
+                result.append(w)
 
         return result
 
+    def reload(self) -> None:
+        """
+        Loads the spelling index again, after the system added words to it or changed their frequencies.
+        """
+        self.index = SpellingIndex.load(self.path)
+
+    def __index(self, words: List[str]) -> SpellingIndex:
+        """
+        Gets the spelling index of the valid words, loading it the first time.
+        The system saves the words it adds to the index before adding them to
+        the vocabulary, so the index is never shorter than the vocabulary.
+
+        Args:
+            words (List[str]): List of valid words.
+
+        Returns:
+            SpellingIndex: The index.
+
+        Raises:
+            SegmentError: If the index has fewer words than the vocabulary.
+        """
+        index = self.index
+        if index is None:
+            index = self.index = SpellingIndex.load(self.path)
+        if len(index) < len(words):
+            raise SegmentError(f'{self.path} has {len(index)} words and the vocabulary {len(words)}, '
+                               'rebuild the system')
+        return index
+
 
 class BooleanQueryBuilder(QueryBuilder):
     def build(self, tokens: List[str]):
@@ -48,15 +88,14 @@ class BooleanQueryBuilder(QueryBuilder):
         """
         processed_query = ""
         operators = ["and", "or", "not", "(", ")", "&", "|", "~"]
-        tokens = " ".join(tokens)
-        q = nlp(tokens)
+        q = tokens
 
         for i, token in enumerate(q):
-            if token.text in operators:
-                processed_query += token.text
+            if token in operators:
+                processed_query += token
             else:
-                processed_query += token.text
-                if i+1 < len(q) and q[i+1].text not in operators:
+                processed_query += token
+                if i+1 < len(q) and q[i+1] not in operators:
                     processed_query += " &"
             processed_query += " "
 
@@ -65,7 +104,17 @@ class BooleanQueryBuilder(QueryBuilder):
         return processed_query
 
 
-class Synonymous:
+class Synonymous(QueryBuilder):
+    def __init__(self, path: str = 'data/synonyms') -> None:
+        """
+        Initializes a query expansion over the synonym map saved by the system.
+
+        Args:
+            path (str): Directory of the synonym map.
+        """
+        self.path = path
+        self.synonyms: SynonymMap = None
+
     def build(self, tokens: List[str], words: List[str]):
         """
         Build a list of synonymous tokens based on a dictionary of synonyms.
@@ -77,17 +126,43 @@ class Synonymous:
         Returns:
             List[str]: A list of tokens, including synonyms.
         """
-        dictionary = SynonimousDictionary()
+        synonyms = self.__synonyms(words)
         result = tokens.copy()
 
         q1 = set(tokens)
-        q2 = set(words)
 
         for token in tokens:
-            synonymous = dictionary.synonym(token)
-            if synonymous:
-                for syn in synonymous:
-                    if syn not in q1 and syn in q2:
-                        result.append(syn)
+            for syn in synonyms.synonyms(token):
+                if syn not in q1:
+                    result.append(syn)
 
         return result
+
+    def reload(self) -> None:
+        """
+        Loads the synonym map again, after the system added words to it.
+        """
+        self.synonyms = SynonymMap.load(self.path)
+
+    def __synonyms(self, words: List[str]) -> SynonymMap:
+        """
+        Gets the synonym map of the valid words, loading it the first time. The
+        system saves the words it adds to the map before adding them to the
+        vocabulary, so the map is never shorter than the vocabulary.
+
+        Args:
+            words (List[str]): List of valid words.
+
+        Returns:
+            SynonymMap: The map.
+
+        Raises:
+            SegmentError: If the map has fewer words than the vocabulary.
+        """
+        synonyms = self.synonyms
+        if synonyms is None:
+            synonyms = self.synonyms = SynonymMap.load(self.path)
+        if len(synonyms) < len(words):
+            raise SegmentError(f'{self.path} has {len(synonyms)} words and the vocabulary {len(words)}, '
+                               'rebuild the system')
+        return synonyms
@@ -1,177 +1,780 @@
-from .core import Corpus, Model
-from typing import List, Tuple
-from .utils.trie import Trie
+from .core import AnalyzedCorpus, Analyzer, Corpus, Document, Model, QueryAnalyzer, SegmentCorpus, get_nlp
+from typing import Dict, List, Optional, Tuple
+from .utils.trie import DeltaTrie
+from .utils.analysis_cache import AnalysisCache
+from .utils.dictionary_log import DictionaryLog
+from .utils.doc_table import DocTable, DocTables
+from .utils.feedback_log import FeedbackLog
+from .utils.segment import Segment
+from .utils.spelling import SpellingIndex
+from .utils.synonimous import SynonymMap
+from .utils.methods import chunks
+from .utils.query_cache import QueryCache
+from collections import Counter
+from scipy import sparse
 import gensim
 import json
+import numpy as np
+import os
+import shutil
+import threading
+import time
 
 
 class SRISystem:
-    def __init__(self, models: List[Model]) -> None:
+    def __init__(self, models: List[Model], analyzer: Analyzer = None, use_cache: bool = True,
+                 chunk_size: int = 10000, max_segments: int = 8, max_merge_docs: int = 100000,
+                 max_deleted: float = 0.3, background_merge: bool = True, cache_size: int = 1024,
+                 cache_ttl: float = 600) -> None:
         """
         Initializes an SRISystem instance.
 
+        The index is a list of segments. A build writes a single segment, every
+        call to add_documents appends a small one and deleted documents are only
+        marked with a tombstone. Segments are merged by a tiered policy, so the
+        cost of an update depends on the size of the batch and not on the size of
+        the corpus.
+
+        Queries only hold the lock of the index to look up the cache and to take
+        a snapshot of the model, and are scored outside it, so they run in
+        parallel with each other and with updates. Results of queries are
+        cached by model, analyzed query and number of documents. The cache is
+        emptied whenever the index or the relevance feedback changes, and every
+        change bumps a generation, so results scored against an older snapshot
+        are never cached.
+
         Args:
-            corpus (Corpus): The corpus containing documents.
             models (List[Model]): List of models used in the system.
+            analyzer (Analyzer, optional): Analyzer used to tokenize and lemmatize the corpus.
+            use_cache (bool): Whether builds reuse the analysis of documents analyzed by previous builds.
+            chunk_size (int): Number of documents analyzed and written together by a build, one segment per chunk.
+            max_segments (int): Number of segments over which the smallest ones are merged.
+            max_merge_docs (int): Maximum number of documents of a segment written by a merge, which bounds its memory.
+            max_deleted (float): Fraction of deleted documents over which a segment is rewritten without them.
+            background_merge (bool): Whether merges run in a background thread instead of in the update that needs them.
+            cache_size (int): Maximum number of cached query results, 0 disables the cache.
+            cache_ttl (float): Seconds a cached query result is valid for, None to keep it until it is evicted.
         """
         self.models: List[Model] = models
-        self.trie = Trie()
+        self.analyzer: Analyzer = analyzer if analyzer is not None else Analyzer()
+        self.use_cache = use_cache
+        self.chunk_size = chunk_size
+        self.max_segments = max_segments
+        self.max_merge_docs = max_merge_docs
+        self.max_deleted = max_deleted
+        self.background_merge = background_merge
+        self.results = QueryCache(cache_size, cache_ttl)
+        # Bumped with every change of the index or of the feedback, always while holding lock
+        self.generation = 0
+        self.trie: DeltaTrie = None
+        # Opened on the first build or addition, so its keys are read only once
+        self.cache: AnalysisCache = None
         self.selected = 0
-        self.relevant_docs = []
-        self.non_relevant_docs = []
+        self.feedback = FeedbackLog()
+        self.warm_up_thread: threading.Thread = None
+        self.merge_thread: threading.Thread = None
+
+        self.segments: List[Dict] = []
+        self.next_segment = 0
+        self.docs = DocTables()
+        # Queries and changes of the segments hold lock, writers of segments also hold write_lock
+        self.lock = threading.RLock()
+        self.write_lock = threading.RLock()
 
     def build(self, corpus: Corpus, cant=-1):
         """
-        Builds the SRISystem by loading the corpus and constructing models.
+        Builds the SRISystem by streaming the corpus and constructing models.
+
+        The corpus is read and analyzed chunk_size documents at a time, and the
+        term counts of every chunk are written to its own segment, so memory does
+        not grow with the corpus. Once the global statistics are known, the
+        models are trained over the streamed segments and every segment is
+        indexed.
 
         Args:
             cant_lines (int, optional): Number of lines to load from the corpus. Defaults to -1 (load all).
         """
-        corpus.load(cant)
+        cache = self.__analysis_cache()
+        vocabulary, dictionary = gensim.corpora.Dictionary(), gensim.corpora.Dictionary()
+        lemma_counts = Counter()
+        keys = set()
+        cached = 0
+
+        shutil.rmtree('data/segments', ignore_errors=True)
+        self.next_segment = 0
+        self.segments = []
+
+        start = time.perf_counter()
+        for chunk in chunks(corpus.iter(cant), self.chunk_size):
+            if cache is not None:
+                chunk_keys = [cache.key(doc.text) for doc in chunk]
+                cached += sum(key in cache for key in chunk_keys)
+                keys.update(chunk_keys)
+
+            analyzed = AnalyzedCorpus.analyze(chunk, self.analyzer, cache, vocabulary, dictionary)
+            if cache is not None:
+                # The analyses of a chunk go to disk with it, so they do not pile up in memory
+                cache.flush()
+            lemma_counts.update(analyzed.lemma_counts())
+            self.segments.append(self.__write_segment(analyzed.docs, analyzed.matrix(), analyzed.word_matrix()))
+
+        if cache is not None:
+            cache.compact(keys)
+        analyzed = AnalyzedCorpus([], [], [], vocabulary, dictionary)
+        analyzed.save(AnalyzedCorpus.lemma_table(lemma_counts))
+        words = [vocabulary[i] for i in range(len(vocabulary))]
+        SpellingIndex.build(words, [vocabulary.dfs.get(i, 0) for i in range(len(vocabulary))]).save('data/spelling')
+        SynonymMap.build(words).save('data/synonyms')
+        self.__create_trie(vocabulary)
 
-        tokenized_docs = self.models[0].build(corpus.documents)
+        elapsed = time.perf_counter() - start
+        print(f'Analyzed {dictionary.num_docs} documents ({cached} from cache) in {elapsed:.2f}s '
+              f'({dictionary.num_docs / max(elapsed, 1e-9):.1f} docs/s)')
 
         for model in self.models:
-            model.build_model(tokenized_docs)
+            model.build_model(dictionary, SegmentCorpus(self.__segment_paths()))
+        for path in self.__segment_paths():
+            self.__build_segment(path)
+        self.__save_manifest()
+        self.__invalidate()
 
-        self.__save_relevant_docs()
-        self.__save_non_relevant_docs()
+        self.feedback.clear()
 
     def change_selected(self, ind: int):
         """
-        Changes the selected model index.
+        Changes the selected model index and loads its index if needed.
 
         Args:
             ind (int): Index of the selected model.
         """
         self.selected = ind
+        self.models[ind].ensure_loaded()
 
-    def load(self):
+    def load(self, warm_up: bool = False, verify: bool = False):
         """
-        Loads the corpus and relevant/non-relevant documents.
+        Loads the corpus and relevant/non-relevant documents. The index of every
+        model is loaded the first time the model is selected or queried.
 
+        Args:
+            warm_up (bool): Whether to load the indexes and spaCy in a background thread, the selected model first.
+            verify (bool): Whether to check the checksums of every segment first, which reads the whole index.
         """
-        dict_voc = gensim.corpora.Dictionary.load(
-            "data/vocabulary.dict")
-        vocabulary = list(dict_voc.token2id.keys())
+        if verify:
+            self.verify()
 
-        f1 = open('data/relevant_docs.json')
-        f2 = open('data/non_relevant_docs.json')
+        self.vocabulary_dict = DictionaryLog.load("data/vocabulary.dict")
+        self.vocabulary = list(self.vocabulary_dict.token2id.keys())
+        self.query_analyzer = QueryAnalyzer.load()
+        self.dictionary = DictionaryLog.load("data/dictionary.dict")
+        self.spelling = SpellingIndex.load('data/spelling')
 
-        self.relevant_docs = json.load(f1)
-        self.non_relevant_docs = json.load(f2)
+        with open('data/segments.json') as f:
+            manifest = json.load(f)
+        self.segments = manifest['segments']
+        self.next_segment = manifest['next']
+        self.docs = DocTables([DocTable.load(os.path.join(self.__segment_path(s['name']), 'docs'))
+                               for s in self.segments], [s['deleted'] for s in self.segments])
 
-        f1.close()
-        f2.close()
+        self.feedback.load()
 
         for model in self.models:
-            model.load(vocabulary,
-                       self.relevant_docs, self.non_relevant_docs)
+            model.load(self.vocabulary, self.query_analyzer, self.dictionary, self.docs,
+                       self.__segment_paths(), self.feedback)
 
-        self.__create_trie(vocabulary)
+        self.__reload_query_builders()
+        self.trie = DeltaTrie.load('data/autocomplete')
+        self.__invalidate()
+
+        if warm_up:
+            self.warm_up_thread = threading.Thread(target=self.__warm_up, daemon=True)
+            self.warm_up_thread.start()
+
+    def __warm_up(self):
+        """
+        Loads the index of every model, the selected one first, and the spaCy
+        pipeline used to lemmatize words of queries that are not in the corpus.
+        """
+        for i in [self.selected] + [i for i in range(len(self.models)) if i != self.selected]:
+            self.models[i].ensure_loaded()
+        get_nlp()
+
+    @staticmethod
+    def verify():
+        """
+        Checks the checksums of every segment saved by the system: the ones of
+        the index and the ones of the vocabulary and the models.
+
+        Raises:
+            SegmentError: If a segment is corrupt or was written by another version of the format.
+        """
+        for root, dirs, files in os.walk('data'):
+            # Segments being written are left out
+            dirs[:] = [name for name in dirs if not name.endswith('.tmp')]
+            if 'header.json' in files:
+                Segment.read(root).verify()
+
+    def close(self):
+        """
+        Writes the relevance feedback that is still pending, when the application shuts down.
+        """
+        self.feedback.close()
+
+    def add_documents(self, docs: List[Document]):
+        """
+        Adds documents to a loaded system, writing them to a new segment. A
+        document with the id of one already in the index replaces it. Models
+        are updated with the new documents, and trained again over the whole
+        index only if they drifted too far.
+
+        Args:
+            docs (List[Document]): The documents.
+        """
+        docs = list({doc.doc_id: doc for doc in docs}.values())
+        if len(docs) == 0:
+            return
+
+        with self.write_lock:
+            for model in self.models:
+                model.ensure_loaded()
+
+            # Analyzed before taking lock, so queries do not wait for the language pipeline
+            cache = self.__analysis_cache()
+            analyses = AnalyzedCorpus.analyze_texts(docs, self.analyzer, cache)
+            if cache is not None:
+                cache.flush()
+
+            with self.lock:
+                old_words = len(self.vocabulary_dict)
+                analyzed = AnalyzedCorpus.of(docs, analyses, self.vocabulary_dict, self.dictionary)
+
+                replaced = [doc.doc_id for doc in docs if doc.doc_id in self.docs]
+                for doc_id in replaced:
+                    self.__delete_row(self.docs.row(doc_id))
+
+                lemmas = AnalyzedCorpus.lemma_table(analyzed.lemma_counts())
+                added = [token for token in lemmas if token not in self.query_analyzer.lemmas]
+                self.query_analyzer.lemmas.update({token: lemmas[token] for token in added})
+                analyzed.append(self.query_analyzer.lemmas, added)
+
+                bow = analyzed.matrix()
+                entry = self.__write_segment(analyzed.docs, bow, analyzed.word_matrix())
+                drifted = [model for model in self.models if model.add_documents(bow)]
+                self.__build_segment(self.__segment_path(entry['name']))
+                self.segments.append(entry)
+                self.docs.append(DocTable.load(os.path.join(self.__segment_path(entry['name']), 'docs')))
+                for model in self.models:
+                    model.set_segments(self.__segment_paths())
+                self.__save_manifest()
+
+                for model in drifted:
+                    self.__retrain(model)
+                if replaced:
+                    # The feedback may have the vectors of the old versions of the documents
+                    for model in self.models:
+                        model.reset_feedback()
+                self.__invalidate()
+
+                words = [self.vocabulary_dict[i] for i in range(old_words, len(self.vocabulary_dict))]
+                self.spelling.add(words, [self.vocabulary_dict.dfs.get(i, 0) for i in range(len(self.vocabulary_dict))])
+                self.spelling.save('data/spelling')
+                if words:
+                    synonyms = SynonymMap.load('data/synonyms')
+                    synonyms.add(words)
+                    synonyms.save('data/synonyms')
+                # The query builders see the new words before the vocabulary has them
+                self.__reload_query_builders()
+                self.vocabulary.extend(words)
+                # Only the words of the new documents changed their frequency
+                touched = sorted({token for tokens in analyzed.tokens for token in tokens})
+                counts = [self.vocabulary_dict.dfs[self.vocabulary_dict.token2id[token]] for token in touched]
+                if self.trie.add(touched, counts):
+                    self.__create_trie(self.vocabulary_dict)
+                    self.trie = DeltaTrie.load('data/autocomplete')
+                else:
+                    self.trie.save('data/autocomplete')
+
+        self.__schedule_merge()
+
+    def delete_documents(self, ids: List[str]):
+        """
+        Deletes documents from a loaded system. They are marked with a tombstone
+        and removed from disk when their segment is merged.
+
+        Args:
+            ids (List[str]): Ids of the documents.
+        """
+        with self.lock:
+            ids = [doc_id for doc_id in ids if doc_id in self.docs]
+            for doc_id in ids:
+                self.__delete_row(self.docs.row(doc_id))
+            self.__save_manifest()
+            self.__invalidate()
+
+            if self.feedback.forget(ids):
+                for model in self.models:
+                    model.reset_feedback()
+
+        self.__schedule_merge()
+
+    def merge(self, full: bool = False):
+        """
+        Merges segments in the calling thread: every segment into one if full,
+        or the ones chosen by the merge policy until it chooses none.
+
+        Args:
+            full (bool): Whether to merge every segment, dropping every deleted document.
+        """
+        with self.write_lock:
+            if full:
+                self.__merge(0, len(self.segments))
+                return
+
+            merge = self.__merge_policy()
+            while merge is not None:
+                self.__merge(*merge)
+                merge = self.__merge_policy()
+
+    def __merge_policy(self) -> Optional[Tuple[int, int]]:
+        """
+        Chooses the segments to merge. A segment with too many deleted documents
+        is rewritten alone. Over max_segments, the longest suffix of segments
+        whose first one is not larger than the rest together is merged, so every
+        document is rewritten a logarithmic number of times. Merges never write
+        segments of more than max_merge_docs documents.
+
+        Returns:
+            Optional[Tuple[int, int]]: The first and one past the last segment to merge, None to merge nothing.
+        """
+        sizes = np.diff(self.docs.starts)
+        for segment, size in enumerate(sizes):
+            if size > 0 and len(self.docs.segment_deleted(segment)) > self.max_deleted * size:
+                return segment, segment + 1
+
+        if len(self.segments) <= self.max_segments:
+            return None
+
+        for start in range(len(sizes) - 1):
+            if sizes[start] <= sizes[start + 1:].sum() and sizes[start:].sum() <= self.max_merge_docs:
+                return start, len(sizes)
+        return None
+
+    def __schedule_merge(self):
+        """
+        Runs the merge policy, in a background thread if background_merge.
+        """
+        if not self.background_merge:
+            self.merge()
+        elif self.merge_thread is None or not self.merge_thread.is_alive():
+            with self.lock:
+                if self.__merge_policy() is None:
+                    return
+            self.merge_thread = threading.Thread(target=self.merge, daemon=True)
+            self.merge_thread.start()
+
+    def __merge(self, start: int, end: int):
+        """
+        Merges a range of segments into a new one without their deleted documents.
+        The new segment is written without blocking queries, and swapped in once
+        it is complete.
+
+        Args:
+            start (int): First segment to merge.
+            end (int): One past the last segment to merge.
+        """
+        with self.lock:
+            merged = [dict(entry, deleted=list(entry['deleted'])) for entry in self.segments[start:end]]
+
+        docs, bows, words, removed, removed_words = [], [], [], [], []
+        for entry in merged:
+            path = self.__segment_path(entry['name'])
+            table = DocTable.load(os.path.join(path, 'docs'))
+            bow = Segment.read(os.path.join(path, 'bow')).sparse()
+            word_counts = Segment.read(os.path.join(path, 'words')).sparse()
+            live = np.setdiff1d(np.arange(len(table)), entry['deleted'])
+            deleted = np.asarray(entry['deleted'], dtype=np.int64)
+            docs.extend(table[i] for i in live)
+            bows.append(bow[live])
+            words.append(word_counts[live])
+            removed.append(bow[deleted])
+            removed_words.append(word_counts[deleted])
+
+        bow, words = self.__stack(bows), self.__stack(words)
+        for model in self.models:
+            model.ensure_loaded()
+
+        # The new segment is weighted with the statistics of the documents that remain
+        with self.lock:
+            self.__update_stats(self.dictionary, removed, -1)
+            self.__update_stats(self.vocabulary_dict, removed_words, -1)
+        try:
+            entry = None
+            if len(docs):
+                entry = self.__write_segment(docs, bow, words)
+                self.__build_segment(self.__segment_path(entry['name']))
+        except BaseException:
+            with self.lock:
+                self.__update_stats(self.dictionary, removed, 1)
+                self.__update_stats(self.vocabulary_dict, removed_words, 1)
+            raise
+
+        with self.lock:
+            # Documents deleted while the segment was written are deleted again in the new one
+            later = [self.docs[int(self.docs.starts[start + i]) + row][0]
+                     for i, old in enumerate(merged)
+                     for row in set(self.segments[start + i]['deleted']) - set(old['deleted'])]
+
+            self.segments[start:end] = [] if entry is None else [entry]
+            tables = self.docs.tables[:start] + self.docs.tables[end:]
+            if entry is not None:
+                tables.insert(start, DocTable.load(os.path.join(self.__segment_path(entry['name']), 'docs')))
+            self.docs = DocTables(tables, [s['deleted'] for s in self.segments])
+            for doc_id in later:
+                if doc_id in self.docs:
+                    self.__delete_row(self.docs.row(doc_id))
+
+            DictionaryLog.save(self.dictionary, 'data/dictionary.dict')
+            for model in self.models:
+                model.docs = self.docs
+                model.set_segments(self.__segment_paths())
+            self.__save_manifest()
+            self.__invalidate()
+
+            if any(removed.shape[0] for removed in removed_words):
+                self.__save_word_counts()
+
+        for old in merged:
+            shutil.rmtree(self.__segment_path(old['name']), ignore_errors=True)
+
+    def __retrain(self, model: Model):
+        """
+        Trains a model again over the live documents of every segment and
+        rebuilds its data of every segment.
+
+        Args:
+            model (Model): The model.
+        """
+        paths = self.__segment_paths()
+        model.build_model(self.dictionary, SegmentCorpus(paths, [s['deleted'] for s in self.segments]))
+        for path in paths:
+            model.build_segment(path, Segment.read(os.path.join(path, 'bow'), mmap=False).sparse())
+        model.reload_segments()
+
+    @staticmethod
+    def __stack(matrices: List[sparse.csr_matrix]) -> sparse.csr_matrix:
+        """
+        Stacks the counts of several segments. Older segments have fewer columns,
+        the terms added after them are empty columns.
+        """
+        n_terms = max(matrix.shape[1] for matrix in matrices)
+        return sparse.vstack([sparse.csr_matrix((m.data, m.indices, m.indptr), shape=(m.shape[0], n_terms))
+                              for m in matrices], format='csr')
+
+    @staticmethod
+    def __update_stats(dictionary: gensim.corpora.Dictionary, bows: List[sparse.csr_matrix], sign: int):
+        """
+        Adds or removes documents from the global statistics of a dictionary.
+        Deleted documents are removed when their segment is merged.
+
+        Args:
+            dictionary (gensim.corpora.Dictionary): The dictionary of the lemmas or of the words.
+            bows (List[scipy.sparse.csr_matrix]): Term counts of the documents, over the dictionary.
+            sign (int): 1 to add the documents, -1 to remove them.
+        """
+        for bow in bows:
+            dfs = np.bincount(bow.indices)
+            cfs = np.bincount(bow.indices, weights=bow.data)
+            for term in np.flatnonzero(dfs).tolist():
+                dictionary.dfs[term] += sign * int(dfs[term])
+                dictionary.cfs[term] += sign * int(cfs[term])
+            dictionary.num_docs += sign * bow.shape[0]
+            dictionary.num_nnz += sign * bow.nnz
+            dictionary.num_pos += sign * int(bow.data.sum())
+
+    def __save_word_counts(self):
+        """
+        Saves the vocabulary after merged documents were removed from its
+        frequencies, and ranks the spelling corrections and the autocomplete
+        with them. The autocomplete is built again as one trie, since its delta
+        only handles frequencies that grow.
+        """
+        counts = [self.vocabulary_dict.dfs.get(i, 0) for i in range(len(self.vocabulary_dict))]
+        DictionaryLog.save(self.vocabulary_dict, 'data/vocabulary.dict')
+        self.spelling.update_counts(counts)
+        self.spelling.save('data/spelling')
+        self.__reload_query_builders()
+        self.__create_trie(self.vocabulary_dict)
+        self.trie = DeltaTrie.load('data/autocomplete')
+
+    def __delete_row(self, row: int):
+        """
+        Marks a row with a tombstone.
+        """
+        segment, local = self.docs.locate(row)
+        self.segments[segment]['deleted'].append(local)
+        self.docs.delete(row)
+
+    def __reload_query_builders(self):
+        """
+        Makes the query builders of every model load again the data the system saved for them.
+        """
+        for model in self.models:
+            for builder in model.query_builders:
+                builder.reload()
+
+    def __segment_path(self, name: str) -> str:
+        return os.path.join('data/segments', name)
+
+    def __segment_paths(self) -> List[str]:
+        return [self.__segment_path(entry['name']) for entry in self.segments]
+
+    def __write_segment(self, docs: List[Tuple[str, str]], bow: sparse.csr_matrix, words: sparse.csr_matrix) -> Dict:
+        """
+        Writes a new segment with the document table, the term counts and the
+        word counts of a list of documents. The data of the models is added by
+        __build_segment.
+
+        Args:
+            docs (List[Tuple[str, str]]): Id and title of every document.
+            bow (scipy.sparse.csr_matrix): Term counts of every document.
+            words (scipy.sparse.csr_matrix): Word counts of every document, over the vocabulary.
+
+        Returns:
+            Dict: The entry of the segment in the manifest.
+        """
+        name = f'seg_{self.next_segment:06d}'
+        self.next_segment += 1
+        path = self.__segment_path(name)
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path)
+
+        DocTable.from_docs(docs).save(os.path.join(path, 'docs'))
+        Segment.write_sparse(os.path.join(path, 'bow'), bow)
+        Segment.write_sparse(os.path.join(path, 'words'), words)
 
-    def __create_trie(self, words: List[str]):
+        return {'name': name, 'deleted': []}
+
+    def __build_segment(self, path: str):
         """
-        Creates a trie from a list of words.
+        Writes the data of every model of a segment from its term counts.
 
         Args:
-            words (List[str]): List of words to insert into the trie.
+            path (str): Directory of the segment.
+        """
+        bow = Segment.read(os.path.join(path, 'bow'), mmap=False).sparse()
+        for model in self.models:
+            model.build_segment(path, bow)
+
+    def __save_manifest(self):
+        """
+        Saves the list of segments and their deleted documents.
+        """
+        with open('data/segments.json.tmp', 'w') as f:
+            json.dump({'next': self.next_segment, 'segments': self.segments}, f)
+        os.replace('data/segments.json.tmp', 'data/segments.json')
+
+    def __analysis_cache(self) -> Optional[AnalysisCache]:
+        """
+        Gets the cache of the analysis of documents, opening it the first time.
+
+        Returns:
+            Optional[AnalysisCache]: The cache, or None if the system does not use it.
         """
-        for word in words:
-            self.trie.insert(word)
+        if self.use_cache and self.cache is None:
+            self.cache = AnalysisCache(self.analyzer.config())
+        return self.cache
 
-    def auto_complete(self, word: str, cant: int = 5) -> List[str]:
+    @staticmethod
+    def __create_trie(vocabulary: gensim.corpora.Dictionary):
         """
-        Provides auto-completions for a given word.
+        Creates the trie of the vocabulary, ranked by document frequency, and saves it without delta.
+        Words that are only in deleted documents are left out.
+
+        Args:
+            vocabulary (gensim.corpora.Dictionary): Dictionary of the words of every document.
+        """
+        words = [i for i in range(len(vocabulary)) if vocabulary.dfs.get(i, 0) > 0]
+        DeltaTrie.build([vocabulary[i] for i in words], [vocabulary.dfs[i] for i in words]).save('data/autocomplete')
+
+    def auto_complete(self, word: str, cant: int = 5, max_distance: int = None) -> List[str]:
+        """
+        Provides auto-completions for a given word, the most frequent in the corpus
+        first. Completions of a prefix with typos are also found, after the exact ones.
 
         Args:
             word (str): The input word.
             cant (int, optional): Number of completions to return. Defaults to 5.
+            max_distance (int, optional): Maximum number of typos of the word. Defaults to
+                one every four characters, up to two.
 
         Returns:
             List[str]: List of closest words.
         """
-        return self.trie.find_closest_words(word, cant)
+        if max_distance is None:
+            max_distance = min(2, len(word) // 4)
+        return self.trie.find_closest_words(word, cant, max_distance)
 
-    def query(self, query: str, cant: int = 10) -> List[Tuple[str, str, int]]:
+    def query(self, query: str, cant: int = 10, scope: str = '') -> List[Tuple[str, str, int]]:
         """
-        Executes a query using the selected model.
+        Executes a query using the selected model, or returns its cached result.
 
         Args:
             query (str): The query string.
             cant (int, optional): Number of relevant documents to return. Defaults to 10.
+            scope (str, optional): Scope of the relevance feedback, such as a session id. Defaults to the
+                feedback shared by every user.
 
         Returns:
             List[Document]: List of relevant documents.
         """
-        return self.models[self.selected].query(query, cant)
+        selected = self.selected
+        model = self.models[selected]
+        model.ensure_loaded()
+        key = (selected, scope, model.normalize_query(query), cant)
+        with self.lock:
+            result = self.results.get(key)
+            if result is not None:
+                return list(result)
+            generation, snapshot = self.generation, model.snapshot(scope)
+
+        result = model.query(query, cant, scope, snapshot)
+        with self.lock:
+            if self.generation == generation:
+                self.results.put(key, result)
+        return list(result)
+
+    def query_batch(self, queries: List[str], cant: int = 10, scope: str = '') -> List[List[Tuple[str, str, int]]]:
+        """
+        Executes several queries using the selected model, scoring the ones
+        that are not cached together.
+
+        Args:
+            queries (List[str]): The query strings.
+            cant (int, optional): Number of relevant documents to return per query. Defaults to 10.
+            scope (str, optional): Scope of the relevance feedback. Defaults to the feedback shared by every user.
+
+        Returns:
+            List[List[Document]]: List of relevant documents of every query, in the order of the queries.
+        """
+        selected = self.selected
+        model = self.models[selected]
+        model.ensure_loaded()
+        keys = [(selected, scope, model.normalize_query(query), cant) for query in queries]
+        with self.lock:
+            results = [self.results.get(key) for key in keys]
+            # Queries with the same key are only executed once
+            missing = {key: query for key, query, result in zip(keys, queries, results) if result is None}
+            if not missing:
+                return [list(result) for result in results]
+            generation, snapshot = self.generation, model.snapshot(scope)
+
+        for key, result in zip(missing, model.query_batch(list(missing.values()), cant, scope, snapshot)):
+            missing[key] = result
+        with self.lock:
+            if self.generation == generation:
+                for key, result in missing.items():
+                    self.results.put(key, result)
+        return [list(result if result is not None else missing[key]) for key, result in zip(keys, results)]
+
+    def __invalidate(self):
+        """
+        Empties the query cache after the index or the feedback changed, and
+        starts a new generation so results of queries scored before the change
+        are not cached. Called while holding lock.
+        """
+        self.generation += 1
+        self.results.clear()
+
+    def cache_stats(self) -> Dict[str, int]:
+        """
+        Returns:
+            Dict[str, int]: Number of hits, misses and results of the query cache.
+        """
+        return self.results.stats()
 
-    def add_relevant(self, doc: str):
+    def add_relevant(self, doc: str, scope: str = ''):
         """
         Adds a document to the relevant documents list.
 
         Args:
             doc (str): The document to add.
+            scope (str, optional): Scope of the feedback, such as a session id or a query. Defaults to
+                the feedback shared by every user.
         """
-        if doc in self.relevant_docs:
-            return
-
-        self.relevant_docs.append(doc)
-        self.__save_relevant_docs()
-
-        self.remove_non_relevant(doc)
+        self.__mark(doc, True, scope)
 
-    def remove_relevant(self, doc: str):
+    def remove_relevant(self, doc: str, scope: str = ''):
         """
         Removes a document from the relevant documents list.
 
         Args:
             doc (str): The document to remove.
+            scope (str, optional): Scope of the feedback.
         """
-        self.relevant_docs = [x for x in self.relevant_docs if x != doc]
-        self.__save_relevant_docs()
+        self.__unmark(doc, True, scope)
 
-    def add_non_relevant(self, doc: str):
+    def add_non_relevant(self, doc: str, scope: str = ''):
         """
         Adds a document to the non-relevant documents list.
 
         Args:
             doc (str): The document to add.
+            scope (str, optional): Scope of the feedback, such as a session id or a query. Defaults to
+                the feedback shared by every user.
         """
-        if doc in self.non_relevant_docs:
-            return
-
-        self.non_relevant_docs.append(doc)
-        self.__save_non_relevant_docs()
+        self.__mark(doc, False, scope)
 
-        self.remove_relevant(doc)
-
-    def remove_non_relevant(self, doc: str):
+    def remove_non_relevant(self, doc: str, scope: str = ''):
         """
         Removes a document from the non-relevant documents list.
 
         Args:
             doc (str): The document to remove.
+            scope (str, optional): Scope of the feedback.
         """
-        self.non_relevant_docs = [x for x in self.relevant_docs if x != doc]
-        self.__save_non_relevant_docs()
+        self.__unmark(doc, False, scope)
 
-    def __save_relevant_docs(self):
-        """
-        Saves the relevant documents to a JSON file.
+    def relevant_docs(self, scope: str = '') -> List[str]:
         """
-        f1 = open('data/relevant_docs.json', 'w')
+        Gets the relevant documents of a scope.
 
-        json.dump(self.relevant_docs, f1)
+        Args:
+            scope (str, optional): Scope of the feedback.
 
-        f1.close()
+        Returns:
+            List[str]: Ids of the documents, sorted.
+        """
+        return sorted(self.feedback.docs(True, scope))
 
-    def __save_non_relevant_docs(self):
+    def non_relevant_docs(self, scope: str = '') -> List[str]:
         """
-        Saves the non-relevant documents to a JSON file.
+        Gets the non-relevant documents of a scope.
+
+        Args:
+            scope (str, optional): Scope of the feedback.
+
+        Returns:
+            List[str]: Ids of the documents, sorted.
         """
-        f2 = open('data/non_relevant_docs.json', 'w')
+        return sorted(self.feedback.docs(False, scope))
 
-        json.dump(self.non_relevant_docs, f2)
+    def __mark(self, doc: str, relevant: bool, scope: str):
+        """
+        Marks a document in the feedback log and in the feedback of every
+        model. The query cache is emptied only if the feedback changed.
+        """
+        with self.lock:
+            if self.feedback.mark(doc, relevant, scope):
+                for model in self.models:
+                    model.add_feedback(doc, relevant, scope)
+                self.__invalidate()
 
-        f2.close()
+    def __unmark(self, doc: str, relevant: bool, scope: str):
+        """
+        Unmarks a document in the feedback log and in the feedback of every
+        model. The query cache is emptied only if the feedback changed.
+        """
+        with self.lock:
+            if self.feedback.unmark(doc, relevant, scope):
+                for model in self.models:
+                    model.remove_feedback(doc, relevant, scope)
+                self.__invalidate()
@@ -0,0 +1,180 @@
+import hashlib
+import os
+from collections import OrderedDict
+import numpy as np
+from typing import Dict, List, Optional, Set, Tuple
+
+
+class AnalysisCache:
+    def __init__(self, config: str, path: str = 'data/analysis_cache', max_open: int = 4) -> None:
+        """
+        Initializes an on-disk cache of the tokens and lemmas of documents, addressed
+        by a hash of their text and of the analyzer configuration.
+
+        Entries are stored in immutable segments. A segment is an uncompressed .npz
+        file with the 16 byte key of every document, a table of the words it uses
+        (utf-8 bytes and offsets) and the word ids of the tokens and lemmas of every
+        document (ids and offsets). Only the keys are read when the cache is
+        opened, and the rest of a segment is read the first time one of its
+        entries is needed, keeping the max_open last used segments in memory.
+
+        Args:
+            config (str): Description of the analyzer. Entries of another configuration are never returned.
+            path (str): Directory of the segments.
+            max_open (int): Number of segments kept in memory.
+        """
+        self.config = config
+        self.path = path
+        self.max_open = max_open
+        self.entries: Dict[bytes, Tuple[int, int]] = {}
+        self.files: List[str] = []
+        self.opened: OrderedDict = OrderedDict()
+        self.pending: Dict[bytes, Tuple[List[str], List[str]]] = {}
+
+        os.makedirs(path, exist_ok=True)
+        for name in sorted(os.listdir(path)):
+            if name.endswith('.npz'):
+                self.__open(os.path.join(path, name))
+
+    def __open(self, file: str) -> None:
+        with np.load(file) as segment:
+            keys = segment['keys']
+        for i, key in enumerate(keys):
+            self.entries[key.tobytes()] = (len(self.files), i)
+        self.files.append(file)
+
+    @staticmethod
+    def __read(file: str) -> Tuple[Dict[str, np.ndarray], List[str]]:
+        """
+        Reads the word ids of a segment and decodes the words it uses.
+        """
+        with np.load(file) as npz:
+            segment = {name: npz[name] for name in ['words', 'word_offsets', 'token_ids', 'lemma_ids', 'doc_offsets']}
+        blob = segment['words'].tobytes()
+        offsets = segment['word_offsets']
+        return segment, [blob[offsets[j]:offsets[j + 1]].decode() for j in range(len(offsets) - 1)]
+
+    @staticmethod
+    def __decode(segment: Dict[str, np.ndarray], words: List[str], i: int) -> Tuple[List[str], List[str]]:
+        """
+        Gets the tokens and the lemmas of the i-th document of a segment.
+        """
+        start, end = segment['doc_offsets'][i], segment['doc_offsets'][i + 1]
+        return ([words[j] for j in segment['token_ids'][start:end].tolist()],
+                [words[j] for j in segment['lemma_ids'][start:end].tolist()])
+
+    def key(self, text: str) -> bytes:
+        """
+        Computes the key of a text.
+
+        Args:
+            text (str): The text of a document.
+
+        Returns:
+            bytes: The key.
+        """
+        return hashlib.blake2b(f'{self.config}\0{text}'.encode(), digest_size=16).digest()
+
+    def __contains__(self, key: bytes) -> bool:
+        return key in self.pending or key in self.entries
+
+    def __len__(self) -> int:
+        return len(self.entries) + len(self.pending)
+
+    def get(self, key: bytes) -> Tuple[List[str], List[str]]:
+        """
+        Gets the tokens and the lemmas of a document.
+
+        Args:
+            key (bytes): Key of the text of the document.
+
+        Returns:
+            Tuple[List[str], List[str]]: The tokens and the lemmas.
+        """
+        if key in self.pending:
+            return self.pending[key]
+
+        s, i = self.entries[key]
+        opened = self.opened.get(s)
+        if opened is None:
+            opened = self.opened[s] = self.__read(self.files[s])
+            if len(self.opened) > self.max_open:
+                self.opened.popitem(last=False)
+        self.opened.move_to_end(s)
+        return self.__decode(*opened, i)
+
+    def put(self, key: bytes, tokens: List[str], lemmas: List[str]) -> None:
+        """
+        Adds the analysis of a document. It is written to disk on the next flush.
+
+        Args:
+            key (bytes): Key of the text of the document.
+            tokens (List[str]): The tokens.
+            lemmas (List[str]): The lemmas.
+        """
+        self.pending[key] = (tokens, lemmas)
+
+    def flush(self) -> None:
+        """
+        Writes the pending entries to a new segment.
+        """
+        if len(self.pending) == 0:
+            return
+
+        self.__write(self.pending)
+        self.pending = {}
+
+    def compact(self, live: Set[bytes], min_live: float = 0.5) -> None:
+        """
+        Rewrites the segments without the entries that are not live, if they
+        take more than 1 - min_live of the cache.
+
+        Args:
+            live (Set[bytes]): Keys of the documents of the current corpus.
+            min_live (float): Fraction of live entries under which the cache is compacted.
+        """
+        self.flush()
+        live = live & self.entries.keys()
+        if len(self.entries) == 0 or len(live) >= min_live * len(self.entries):
+            return
+
+        # One segment is read at a time, so compacting does not need the whole cache in memory
+        rows: Dict[int, List[Tuple[bytes, int]]] = {}
+        for key in live:
+            s, i = self.entries[key]
+            rows.setdefault(s, []).append((key, i))
+
+        files = self.files
+        self.entries, self.files, self.opened = {}, [], OrderedDict()
+        for s, keys in sorted(rows.items()):
+            segment, words = self.__read(files[s])
+            self.__write({key: self.__decode(segment, words, i) for key, i in keys})
+        for file in files:
+            os.remove(file)
+
+    def __write(self, entries: Dict[bytes, Tuple[List[str], List[str]]]) -> None:
+        word_ids: Dict[str, int] = {}
+        token_ids, lemma_ids, doc_offsets = [], [], [0]
+        for tokens, lemmas in entries.values():
+            token_ids.extend(word_ids.setdefault(w, len(word_ids)) for w in tokens)
+            lemma_ids.extend(word_ids.setdefault(w, len(word_ids)) for w in lemmas)
+            doc_offsets.append(len(token_ids))
+
+        encoded = [w.encode() for w in word_ids]
+        segment = {
+            'keys': np.frombuffer(b''.join(entries.keys()), dtype=np.uint8).reshape(-1, 16),
+            'words': np.frombuffer(b''.join(encoded), dtype=np.uint8),
+            'word_offsets': np.append(0, np.cumsum([len(w) for w in encoded], dtype=np.int64)),
+            'token_ids': np.array(token_ids, dtype=np.int32),
+            'lemma_ids': np.array(lemma_ids, dtype=np.int32),
+            'doc_offsets': np.array(doc_offsets, dtype=np.int64),
+        }
+
+        number = max([int(name[4:-4]) for name in os.listdir(self.path)
+                      if name.startswith('seg_') and name.endswith('.npz')] + [-1]) + 1
+        file = os.path.join(self.path, f'seg_{number:06d}.npz')
+        with open(file + '.tmp', 'wb') as f:
+            np.savez(f, **segment)
+        os.replace(file + '.tmp', file)
+
+        self.__open(file)
@@ -0,0 +1,227 @@
+import numpy as np
+from scipy import sparse
+from typing import Optional
+from .segment import Segment
+
+# Number of set bits of every byte value
+POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+class DocSet:
+    def __init__(self, size: int, docs: Optional[np.ndarray] = None, bits: Optional[np.ndarray] = None) -> None:
+        """
+        Initializes a set of documents stored roaring-style: as a sorted array of
+        ids while it is sparse, and as a packed bitmap once it is dense.
+
+        Args:
+            size (int): Number of documents of the collection.
+            docs (np.ndarray, optional): Sorted unique document ids, for the array container.
+            bits (np.ndarray, optional): Packed little-endian bits, for the bitmap container.
+        """
+        self.size = size
+        self.docs: Optional[np.ndarray] = docs
+        self.bits: Optional[np.ndarray] = bits
+        if docs is None and bits is None:
+            self.docs = np.empty(0, dtype=np.uint32)
+
+    @staticmethod
+    def from_docs(docs: np.ndarray, size: int) -> 'DocSet':
+        """
+        Creates a set from sorted unique document ids choosing the smallest container.
+
+        Args:
+            docs (np.ndarray): Sorted unique document ids.
+            size (int): Number of documents of the collection.
+
+        Returns:
+            DocSet: The set.
+        """
+        return DocSet(size, docs=docs.astype(np.uint32, copy=False))._optimize()
+
+    @staticmethod
+    def full(size: int) -> 'DocSet':
+        """
+        Creates the set of all documents.
+
+        Args:
+            size (int): Number of documents of the collection.
+
+        Returns:
+            DocSet: The set.
+        """
+        return DocSet(size, bits=np.packbits(np.ones(size, dtype=bool), bitorder='little'))
+
+    @staticmethod
+    def is_dense(count: int, size: int) -> bool:
+        """
+        Whether a set of count documents takes less memory as a bitmap than as an array of uint32.
+        """
+        return count * 32 > size
+
+    def _optimize(self) -> 'DocSet':
+        """
+        Moves the set to the container that takes less memory.
+        """
+        if self.bits is not None and not DocSet.is_dense(len(self), self.size):
+            self.docs = self.to_array()
+            self.bits = None
+        elif self.docs is not None and DocSet.is_dense(len(self.docs), self.size):
+            self.bits = self.to_bits()
+            self.docs = None
+        return self
+
+    def to_array(self) -> np.ndarray:
+        """
+        Returns the sorted ids of the documents of the set.
+        """
+        if self.docs is not None:
+            return self.docs
+        return np.flatnonzero(np.unpackbits(self.bits, count=self.size, bitorder='little')).astype(np.uint32)
+
+    def to_bits(self) -> np.ndarray:
+        """
+        Returns the packed bitmap of the set.
+        """
+        if self.bits is not None:
+            return self.bits
+        bits = np.zeros((self.size + 7) // 8, dtype=np.uint8)
+        DocSet.__set(bits, self.docs)
+        return bits
+
+    @staticmethod
+    def __set(bits: np.ndarray, docs: np.ndarray) -> None:
+        np.bitwise_or.at(bits, docs >> 3, np.left_shift(1, docs & 7).astype(np.uint8))
+
+    @staticmethod
+    def __test(bits: np.ndarray, docs: np.ndarray) -> np.ndarray:
+        return ((bits[docs >> 3] >> (docs & 7).astype(np.uint8)) & 1).astype(bool)
+
+    def __len__(self) -> int:
+        if self.docs is not None:
+            return len(self.docs)
+        return int(POPCOUNT[self.bits].sum(dtype=np.int64))
+
+    def __and__(self, other: 'DocSet') -> 'DocSet':
+        if self.docs is not None and other.docs is not None:
+            return DocSet(self.size, docs=np.intersect1d(self.docs, other.docs, assume_unique=True))
+        if self.docs is not None:
+            return DocSet(self.size, docs=self.docs[DocSet.__test(other.bits, self.docs)])
+        if other.docs is not None:
+            return other & self
+        return DocSet(self.size, bits=self.bits & other.bits)._optimize()
+
+    def __or__(self, other: 'DocSet') -> 'DocSet':
+        if self.docs is not None and other.docs is not None:
+            return DocSet(self.size, docs=np.union1d(self.docs, other.docs))._optimize()
+        if self.bits is not None and other.bits is not None:
+            return DocSet(self.size, bits=self.bits | other.bits)
+        dense, array = (self, other) if self.bits is not None else (other, self)
+        bits = dense.bits.copy()
+        DocSet.__set(bits, array.docs)
+        return DocSet(self.size, bits=bits)
+
+    def __sub__(self, other: 'DocSet') -> 'DocSet':
+        if self.docs is not None and other.docs is not None:
+            return DocSet(self.size, docs=np.setdiff1d(self.docs, other.docs, assume_unique=True))
+        if self.docs is not None:
+            return DocSet(self.size, docs=self.docs[~DocSet.__test(other.bits, self.docs)])
+        if other.bits is not None:
+            return DocSet(self.size, bits=self.bits & ~other.bits)._optimize()
+        bits = self.bits.copy()
+        np.bitwise_and.at(bits, other.docs >> 3, ~np.left_shift(1, other.docs & 7).astype(np.uint8))
+        return DocSet(self.size, bits=bits)._optimize()
+
+    def __invert__(self) -> 'DocSet':
+        return DocSet.full(self.size) - self
+
+
+class BitmapIndex:
+    def __init__(self, size: int, offsets: np.ndarray, postings: np.ndarray,
+                 bitmap_rows: np.ndarray, bitmaps: np.ndarray, df: np.ndarray) -> None:
+        """
+        Initializes a term to document set index.
+
+        Args:
+            size (int): Number of documents of the collection.
+            offsets (np.ndarray): The array postings of term t are postings[offsets[t]:offsets[t + 1]].
+            postings (np.ndarray): Sorted document ids of the sparse terms, concatenated.
+            bitmap_rows (np.ndarray): Row in bitmaps of every dense term, -1 for the sparse ones.
+            bitmaps (np.ndarray): Packed bitmap of every dense term, one per row.
+            df (np.ndarray): Number of documents that contain every term.
+        """
+        self.size = size
+        self.offsets = offsets
+        self.postings = postings
+        self.bitmap_rows = bitmap_rows
+        self.bitmaps = bitmaps
+        self.df = df
+
+    @staticmethod
+    def build(matrix: sparse.csc_matrix) -> 'BitmapIndex':
+        """
+        Builds the index from a document-term matrix.
+
+        Args:
+            matrix (scipy.sparse.csc_matrix): Matrix with documents as rows and terms as columns.
+
+        Returns:
+            BitmapIndex: The index.
+        """
+        matrix = sparse.csc_matrix(matrix)
+        matrix.sort_indices()
+        size, n_terms = matrix.shape
+        df = np.diff(matrix.indptr)
+
+        dense = np.flatnonzero(DocSet.is_dense(df, size))
+        bitmap_rows = np.full(n_terms, -1, dtype=np.int32)
+        bitmap_rows[dense] = np.arange(len(dense))
+        bitmaps = np.zeros((len(dense), (size + 7) // 8), dtype=np.uint8)
+        for row, t in enumerate(dense):
+            docs = matrix.indices[matrix.indptr[t]:matrix.indptr[t + 1]]
+            bitmaps[row] = DocSet(size, docs=docs.astype(np.uint32)).to_bits()
+
+        sparse_df = np.where(bitmap_rows < 0, df, 0)
+        offsets = np.append(0, np.cumsum(sparse_df))
+        keep = np.repeat(bitmap_rows < 0, df)
+        postings = matrix.indices[keep].astype(np.uint32)
+
+        return BitmapIndex(size, offsets, postings, bitmap_rows, bitmaps, df)
+
+    def get(self, term: int) -> DocSet:
+        """
+        Gets the set of documents that contain a term.
+
+        Args:
+            term (int): Term id.
+
+        Returns:
+            DocSet: The documents.
+        """
+        if self.bitmap_rows[term] >= 0:
+            return DocSet(self.size, bits=self.bitmaps[self.bitmap_rows[term]])
+        return DocSet(self.size, docs=self.postings[self.offsets[term]:self.offsets[term + 1]])
+
+    def save(self, path: str) -> None:
+        """
+        Saves the index as a segment.
+
+        Args:
+            path (str): Directory of the segment.
+        """
+        Segment.write(path, {'offsets': self.offsets, 'postings': self.postings, 'bitmap_rows': self.bitmap_rows,
+                             'bitmaps': self.bitmaps, 'df': self.df}, {'size': self.size})
+
+    @staticmethod
+    def load(path: str) -> 'BitmapIndex':
+        """
+        Loads an index saved with save, memory-mapped.
+
+        Args:
+            path (str): Directory of the segment.
+
+        Returns:
+            BitmapIndex: The index.
+        """
+        segment = Segment.read(path)
+        return BitmapIndex(segment.meta['size'], segment['offsets'], segment['postings'],
+                           segment['bitmap_rows'], segment['bitmaps'], segment['df'])
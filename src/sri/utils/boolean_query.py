@@ -0,0 +1,186 @@
+import re
+import time
+from typing import Dict, List, Optional, Tuple, Union
+from .bitmap import BitmapIndex, DocSet
+
+OPERATORS = {"and": "&", "or": "|", "not": "~"}
+TOKEN = re.compile(r"[()&|~]|[^\s()&|~]+")
+
+
+class QueryBudgetExceeded(Exception):
+    """
+    Raised when a boolean query has too many clauses or takes too long to evaluate.
+    """
+
+
+class BooleanQuery:
+    def __init__(self, query: Union[str, List[str]], max_clauses: int = 64, max_depth: int = 32) -> None:
+        """
+        Parses a boolean query with the operators &, |, ~ (or and, or, not) and
+        parentheses into an expression tree. Adjacent terms are joined with &.
+
+        Nodes are tuples: ("term", word), ("not", node), ("and", [nodes]) and ("or", [nodes]).
+
+        Args:
+            query (str | List[str]): The query or its tokens.
+            max_clauses (int): Maximum number of terms in the query.
+            max_depth (int): Maximum nesting of parentheses and negations.
+
+        Raises:
+            QueryBudgetExceeded: If the query exceeds max_clauses or max_depth.
+        """
+        if not isinstance(query, str):
+            query = " ".join(query)
+
+        self.tokens: List[str] = [OPERATORS.get(t, t) for t in TOKEN.findall(query.lower())]
+        self.max_depth = max_depth
+        self.pos = 0
+
+        terms = sum(1 for t in self.tokens if t not in "()&|~")
+        if terms > max_clauses:
+            raise QueryBudgetExceeded(f"The query has {terms} terms, the limit is {max_clauses}")
+
+        self.root: Tuple = self.__parse_or(0)
+        while self.pos < len(self.tokens):
+            # Tokens left after a stray ")" are joined with &
+            self.pos += 1
+            if self.pos < len(self.tokens):
+                self.root = BooleanQuery.__join("and", [self.root, self.__parse_or(0)])
+
+    @staticmethod
+    def __join(op: str, nodes: List[Tuple]) -> Tuple:
+        nodes = [n for n in nodes if n is not None]
+        if len(nodes) == 0:
+            return None
+        if len(nodes) == 1:
+            return nodes[0]
+
+        children = []
+        for node in nodes:
+            children.extend(node[1] if node[0] == op else [node])
+        return (op, children)
+
+    def __peek(self) -> str:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def __parse_or(self, depth: int) -> Tuple:
+        nodes = [self.__parse_and(depth)]
+        while self.__peek() == "|":
+            self.pos += 1
+            nodes.append(self.__parse_and(depth))
+        return BooleanQuery.__join("or", nodes)
+
+    def __parse_and(self, depth: int) -> Tuple:
+        nodes = [self.__parse_not(depth)]
+        while self.__peek() not in (None, "|", ")"):
+            if self.__peek() == "&":
+                self.pos += 1
+            nodes.append(self.__parse_not(depth))
+        return BooleanQuery.__join("and", nodes)
+
+    def __parse_not(self, depth: int) -> Tuple:
+        if depth > self.max_depth:
+            raise QueryBudgetExceeded(f"The query is nested more than {self.max_depth} levels")
+
+        token = self.__peek()
+        if token == "~":
+            self.pos += 1
+            node = self.__parse_not(depth + 1)
+            return None if node is None else ("not", node)
+        if token == "(":
+            self.pos += 1
+            node = self.__parse_or(depth + 1)
+            if self.__peek() == ")":
+                self.pos += 1
+            return node
+        if token in (None, "|", ")", "&"):
+            # Dangling operator
+            return None
+
+        self.pos += 1
+        return ("term", token)
+
+    def evaluate(self, index: BitmapIndex, token2id: Dict[str, int], time_budget: float = 1.0) -> DocSet:
+        """
+        Evaluates the expression tree directly against a bitmap index, without
+        expanding it to a normal form. The operands of every AND are evaluated
+        from the most to the least selective, negated operands are applied as
+        ANDNOT and the evaluation stops as soon as the intersection is empty.
+
+        Args:
+            index (BitmapIndex): Set of documents of every term.
+            token2id (Dict[str, int]): Term id of every word.
+            time_budget (float): Maximum seconds the evaluation may take.
+
+        Returns:
+            DocSet: The documents that satisfy the query.
+
+        Raises:
+            QueryBudgetExceeded: If the evaluation takes longer than time_budget.
+        """
+        self.index = index
+        self.token2id = token2id
+        self.deadline = time.perf_counter() + time_budget
+
+        if self.root is None:
+            return DocSet(index.size)
+        return self.__evaluate(self.root)
+
+    def __term(self, word: str) -> Optional[int]:
+        """
+        Term id of a word, None if it is not in the index. Indexes built before
+        the word was added to the dictionary do not have its term.
+        """
+        term = self.token2id.get(word)
+        return term if term is not None and term < len(self.index.df) else None
+
+    def __estimate(self, node: Tuple) -> int:
+        """
+        Upper bound of the number of documents that satisfy a node.
+        """
+        op, arg = node
+        if op == "term":
+            term = self.__term(arg)
+            return 0 if term is None else int(self.index.df[term])
+        if op == "not":
+            return self.index.size
+        if op == "and":
+            return min(self.__estimate(n) for n in arg)
+        return min(self.index.size, sum(self.__estimate(n) for n in arg))
+
+    def __evaluate(self, node: Tuple) -> DocSet:
+        if time.perf_counter() > self.deadline:
+            raise QueryBudgetExceeded("The query took longer than its time budget")
+
+        op, arg = node
+        if op == "term":
+            term = self.__term(arg)
+            return DocSet(self.index.size) if term is None else self.index.get(term)
+
+        if op == "not":
+            return ~self.__evaluate(arg)
+
+        if op == "or":
+            result = DocSet(self.index.size)
+            for child in arg:
+                result = result | self.__evaluate(child)
+            return result
+
+        positives = sorted((n for n in arg if n[0] != "not"), key=self.__estimate)
+        negatives = sorted((n[1] for n in arg if n[0] == "not"), key=self.__estimate)
+
+        if len(positives) == 0:
+            result = DocSet.full(self.index.size)
+        else:
+            result = self.__evaluate(positives[0])
+            for child in positives[1:]:
+                if len(result) == 0:
+                    return result
+                result = result & self.__evaluate(child)
+
+        for child in negatives:
+            if len(result) == 0:
+                break
+            result = result - self.__evaluate(child)
+
+        return result
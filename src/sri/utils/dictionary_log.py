@@ -0,0 +1,109 @@
+import json
+import os
+from typing import Iterable
+import gensim
+
+
+class DictionaryLog:
+    """
+    Saves a gensim dictionary as a full copy plus a log of the changes made
+    after it, so adding a few documents appends the entries of their terms
+    instead of rewriting the whole dictionary.
+
+    Every record of the log has a sequence number, and the full copy keeps the
+    number of the last record it includes. Records the copy already includes
+    are skipped, so a crash between saving the copy and emptying the log
+    loses nothing.
+    """
+
+    @staticmethod
+    def __log(path: str) -> str:
+        return path + '.log'
+
+    @staticmethod
+    def load(path: str) -> gensim.corpora.Dictionary:
+        """
+        Loads the full copy of a dictionary and replays its log.
+
+        Args:
+            path (str): Path of the full copy.
+
+        Returns:
+            gensim.corpora.Dictionary: The dictionary.
+        """
+        dictionary = gensim.corpora.Dictionary.load(path)
+        seq = getattr(dictionary, 'log_seq', 0)
+        lines = []
+        if os.path.exists(DictionaryLog.__log(path)):
+            with open(DictionaryLog.__log(path), encoding='utf-8') as f:
+                lines = f.readlines()
+
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A line cut by a crash in the middle of a write is ignored
+                continue
+            if record['seq'] <= seq:
+                continue
+            for term, token, df, cf in record['terms']:
+                dictionary.token2id[token] = term
+                dictionary.dfs[term] = df
+                dictionary.cfs[term] = cf
+            dictionary.num_docs = record['num_docs']
+            dictionary.num_pos = record['num_pos']
+            dictionary.num_nnz = record['num_nnz']
+            seq = record['seq']
+
+        dictionary.id2token = {}
+        dictionary.log_seq = seq
+        return dictionary
+
+    @staticmethod
+    def save(dictionary: gensim.corpora.Dictionary, path: str) -> None:
+        """
+        Saves a full copy of a dictionary and empties its log.
+
+        Args:
+            dictionary (gensim.corpora.Dictionary): The dictionary.
+            path (str): Path of the full copy.
+        """
+        if not hasattr(dictionary, 'log_seq'):
+            # A new dictionary does not include the log of the one it replaces
+            if os.path.exists(DictionaryLog.__log(path)):
+                os.remove(DictionaryLog.__log(path))
+            dictionary.log_seq = 0
+        dictionary.save(path + '.tmp')
+        os.replace(path + '.tmp', path)
+        open(DictionaryLog.__log(path), 'w').close()
+
+    @staticmethod
+    def append(dictionary: gensim.corpora.Dictionary, path: str, terms: Iterable[int]) -> None:
+        """
+        Appends the current entries of some terms and the totals of a dictionary
+        to its log. Once the log is larger than the full copy, a new full copy is
+        saved instead.
+
+        Args:
+            dictionary (gensim.corpora.Dictionary): The dictionary.
+            path (str): Path of the full copy.
+            terms (Iterable[int]): Ids of the terms that were added or whose frequencies changed.
+        """
+        log = DictionaryLog.__log(path)
+        if os.path.exists(log) and os.path.getsize(log) > os.path.getsize(path):
+            DictionaryLog.save(dictionary, path)
+            return
+
+        dictionary.log_seq = getattr(dictionary, 'log_seq', 0) + 1
+        record = {
+            'seq': dictionary.log_seq,
+            'terms': [[term, dictionary[term], dictionary.dfs.get(term, 0), dictionary.cfs.get(term, 0)]
+                      for term in sorted(set(terms))],
+            'num_docs': dictionary.num_docs,
+            'num_pos': dictionary.num_pos,
+            'num_nnz': dictionary.num_nnz,
+        }
+        with open(log, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
@@ -0,0 +1,229 @@
+import numpy as np
+from typing import Dict, Iterator, List, Optional, Tuple
+from .segment import Segment
+
+
+def encode_strings(strings: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Encodes strings as their concatenated utf-8 bytes and the offsets where every one starts.
+
+    Args:
+        strings (List[str]): The strings.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The bytes and the len(strings) + 1 offsets.
+    """
+    encoded = [s.encode() for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(e) for e in encoded], out=offsets[1:])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+
+def decode_string(data: np.ndarray, offsets: np.ndarray, i: int) -> str:
+    """
+    Decodes the i-th string encoded with encode_strings.
+    """
+    return data[offsets[i]:offsets[i + 1]].tobytes().decode()
+
+
+class DocTable:
+    def __init__(self, ids: np.ndarray, id_offsets: np.ndarray, titles: np.ndarray, title_offsets: np.ndarray) -> None:
+        """
+        Initializes a table with the id and the title of every document, stored as
+        utf-8 bytes and offsets so it can be memory-mapped instead of parsed.
+
+        Args:
+            ids (np.ndarray): Concatenated utf-8 bytes of the ids.
+            id_offsets (np.ndarray): Offset of every id.
+            titles (np.ndarray): Concatenated utf-8 bytes of the titles.
+            title_offsets (np.ndarray): Offset of every title.
+        """
+        self.ids = ids
+        self.id_offsets = id_offsets
+        self.titles = titles
+        self.title_offsets = title_offsets
+
+    @staticmethod
+    def from_docs(docs: List[Tuple[str, str]]) -> 'DocTable':
+        """
+        Creates a table from a list of documents.
+
+        Args:
+            docs (List[Tuple[str, str]]): Id and title of every document.
+
+        Returns:
+            DocTable: The table.
+        """
+        ids, id_offsets = encode_strings([doc_id for doc_id, _ in docs])
+        titles, title_offsets = encode_strings([title for _, title in docs])
+        return DocTable(ids, id_offsets, titles, title_offsets)
+
+    def save(self, path: str) -> None:
+        """
+        Saves the table as a segment.
+
+        Args:
+            path (str): Directory of the segment.
+        """
+        Segment.write(path, {'ids': self.ids, 'id_offsets': self.id_offsets,
+                             'titles': self.titles, 'title_offsets': self.title_offsets})
+
+    @staticmethod
+    def load(path: str) -> 'DocTable':
+        """
+        Loads a table saved with save, memory-mapped.
+
+        Args:
+            path (str): Directory of the segment.
+
+        Returns:
+            DocTable: The table.
+        """
+        segment = Segment.read(path)
+        return DocTable(segment['ids'], segment['id_offsets'], segment['titles'], segment['title_offsets'])
+
+    def __len__(self) -> int:
+        return len(self.id_offsets) - 1
+
+    def __getitem__(self, i: int) -> Tuple[str, str]:
+        return (decode_string(self.ids, self.id_offsets, i),
+                decode_string(self.titles, self.title_offsets, i))
+
+    def __iter__(self) -> Iterator[Tuple[str, str]]:
+        return (self[i] for i in range(len(self)))
+
+
+class DocTables:
+    def __init__(self, tables: List[DocTable] = [], deleted: List[List[int]] = []) -> None:
+        """
+        Initializes the table of the documents of several segments, numbered one
+        segment after the other. Deleted documents keep their row, marked with a
+        tombstone, until their segment is merged.
+
+        Args:
+            tables (List[DocTable]): Table of every segment.
+            deleted (List[List[int]]): Rows of every segment with a tombstone, relative to the segment.
+        """
+        self.tables: List[DocTable] = []
+        self.starts = np.zeros(1, dtype=np.int64)
+        self.deleted = np.empty(0, dtype=np.int64)
+        self.rows: Optional[Dict[str, int]] = None
+
+        for table, rows in zip(tables, deleted or [[]] * len(tables)):
+            self.append(table, rows)
+
+    def __len__(self) -> int:
+        return int(self.starts[-1])
+
+    def __getitem__(self, row: int) -> Tuple[str, str]:
+        segment, local = self.locate(row)
+        return self.tables[segment][local]
+
+    def __iter__(self) -> Iterator[Tuple[str, str]]:
+        return (doc for table in self.tables for doc in table)
+
+    def locate(self, row: int) -> Tuple[int, int]:
+        """
+        Finds the segment of a row.
+
+        Args:
+            row (int): The row.
+
+        Returns:
+            Tuple[int, int]: The segment and the row in it.
+        """
+        segment = int(np.searchsorted(self.starts, row, side='right')) - 1
+        return segment, row - int(self.starts[segment])
+
+    def append(self, table: DocTable, deleted: List[int] = []) -> None:
+        """
+        Adds the table of a new segment after the others.
+
+        Args:
+            table (DocTable): The table.
+            deleted (List[int]): Rows of the segment with a tombstone.
+        """
+        start = len(self)
+        self.tables.append(table)
+        self.starts = np.append(self.starts, start + len(table))
+        if len(deleted):
+            self.deleted = np.union1d(self.deleted, start + np.asarray(deleted, dtype=np.int64))
+        if self.rows is not None:
+            self.__index(len(self.tables) - 1)
+
+    def snapshot(self) -> 'DocTables':
+        """
+        Copies the table of the documents as it is now, sharing the tables of
+        the segments. Segments appended and tombstones added later do not
+        change the copy, as they replace the arrays instead of writing to them.
+
+        Returns:
+            DocTables: The copy.
+        """
+        copy = DocTables()
+        copy.tables, copy.starts, copy.deleted = list(self.tables), self.starts, self.deleted
+        return copy
+
+    def delete(self, row: int) -> None:
+        """
+        Marks a row with a tombstone.
+
+        Args:
+            row (int): The row.
+        """
+        self.deleted = np.union1d(self.deleted, [row])
+        if self.rows is not None and self.rows.get(self[row][0]) == row:
+            del self.rows[self[row][0]]
+
+    def is_deleted(self, row: int) -> bool:
+        """
+        Checks whether a row has a tombstone.
+        """
+        i = np.searchsorted(self.deleted, row)
+        return i < len(self.deleted) and self.deleted[i] == row
+
+    def segment_deleted(self, segment: int) -> np.ndarray:
+        """
+        Gets the rows of a segment with a tombstone, relative to the segment.
+
+        Args:
+            segment (int): The segment.
+
+        Returns:
+            np.ndarray: The sorted rows.
+        """
+        start, end = self.starts[segment], self.starts[segment + 1]
+        rows = self.deleted[np.searchsorted(self.deleted, start):np.searchsorted(self.deleted, end)]
+        return rows - start
+
+    def row(self, doc_id: str) -> int:
+        """
+        Finds the row of a live document. The id to row map is built on the first call.
+
+        Args:
+            doc_id (str): Id of the document.
+
+        Returns:
+            int: The row.
+        """
+        if self.rows is None:
+            self.rows = {}
+            for segment in range(len(self.tables)):
+                self.__index(segment)
+        return self.rows[doc_id]
+
+    def __contains__(self, doc_id: str) -> bool:
+        try:
+            self.row(doc_id)
+            return True
+        except KeyError:
+            return False
+
+    def __index(self, segment: int) -> None:
+        start = int(self.starts[segment])
+        dead = set(self.segment_deleted(segment).tolist())
+        ids = self.tables[segment].ids.tobytes()
+        offsets = self.tables[segment].id_offsets
+        for i in range(len(self.tables[segment])):
+            if i not in dead:
+                self.rows[ids[offsets[i]:offsets[i + 1]].decode()] = start + i
@@ -0,0 +1,285 @@
+import atexit
+import json
+import os
+import threading
+from typing import Dict, Iterable, List, Set, Tuple
+
+# Operations of the log: mark as relevant, mark as non-relevant, unmark relevant, unmark non-relevant
+RELEVANT, NON_RELEVANT, UNMARK_RELEVANT, UNMARK_NON_RELEVANT = 'R', 'N', 'r', 'n'
+
+
+def escape(field: str) -> str:
+    """
+    Escapes the backslashes, tabs and newlines of a field of the log.
+    """
+    return field.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n')
+
+
+def unescape(field: str) -> str:
+    """
+    Reverts escape.
+    """
+    if '\\' not in field:
+        return field
+    chars, i = [], 0
+    while i < len(field):
+        if field[i] == '\\' and i + 1 < len(field):
+            chars.append({'t': '\t', 'n': '\n'}.get(field[i + 1], field[i + 1]))
+            i += 2
+        else:
+            chars.append(field[i])
+            i += 1
+    return ''.join(chars)
+
+
+class FeedbackLog:
+    def __init__(self, path: str = 'data/feedback', batch_size: int = 64, flush_interval: float = 0.5,
+                 compact_after: int = 10000) -> None:
+        """
+        Initializes the store of the relevant and non-relevant documents. The
+        documents are kept in sets, one pair per scope, and every change is
+        appended to a log instead of rewriting the whole state.
+
+        Appends are committed in groups: they are written and synced to disk
+        together once batch_size of them are pending or flush_interval seconds
+        after the first of them, so a burst of clicks costs one fsync. The timer
+        dies with the process, so close writes the pending records, and it is
+        called when the interpreter exits. Once the log has compact_after
+        records more than the state, the state is written to a snapshot and the
+        log starts again.
+
+        A scope is any string, such as the id of a session or a query. The
+        empty scope is the feedback shared by every user.
+
+        Args:
+            path (str): Directory of the snapshot and the log, None to keep the feedback only in memory.
+            batch_size (int): Number of pending records that are written at once.
+            flush_interval (float): Maximum seconds a record waits before it is written.
+            compact_after (int): Number of redundant records of the log that triggers a compaction.
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.compact_after = compact_after
+        self.scopes: Dict[str, Tuple[Set[str], Set[str]]] = {}
+        self.pending: List[str] = []
+        self.records = 0
+        self.timer: threading.Timer = None
+        self.lock = threading.RLock()
+        atexit.register(self.close)
+
+    def __file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def load(self):
+        """
+        Reads the snapshot and replays the log. The feedback of the JSON files
+        of previous versions is imported if there is no log yet.
+        """
+        with self.lock:
+            self.scopes = {}
+            self.pending = []
+            self.records = 0
+            if self.path is None:
+                return
+
+            if not os.path.exists(self.__file('snapshot.json')) and os.path.exists('data/relevant_docs.json'):
+                self.__import_json()
+                return
+
+            if os.path.exists(self.__file('snapshot.json')):
+                with open(self.__file('snapshot.json')) as f:
+                    snapshot = json.load(f)
+                self.scopes = {scope: (set(relevant), set(non_relevant))
+                               for scope, (relevant, non_relevant) in snapshot.items()}
+
+            if os.path.exists(self.__file('log')):
+                with open(self.__file('log'), encoding='utf-8') as f:
+                    for line in f:
+                        fields = line.rstrip('\n').split('\t')
+                        # A line cut by a crash in the middle of a write is ignored
+                        if len(fields) == 3:
+                            self.__apply(fields[0], unescape(fields[1]), unescape(fields[2]))
+                            self.records += 1
+
+    def __import_json(self):
+        """
+        Moves the feedback of data/relevant_docs.json and data/non_relevant_docs.json to a snapshot.
+        """
+        scope = self.__scope('')
+        for name, docs in [('data/relevant_docs.json', scope[0]), ('data/non_relevant_docs.json', scope[1])]:
+            if os.path.exists(name):
+                with open(name) as f:
+                    docs.update(json.load(f))
+        # Both lists may have a document after a bug of older versions, relevant wins
+        scope[1].difference_update(scope[0])
+        self.compact()
+
+    def __scope(self, scope: str) -> Tuple[Set[str], Set[str]]:
+        state = self.scopes.get(scope)
+        if state is None:
+            state = self.scopes[scope] = (set(), set())
+        return state
+
+    def __apply(self, op: str, scope: str, doc: str) -> bool:
+        """
+        Applies a record to the state.
+
+        Returns:
+            bool: Whether the state changed.
+        """
+        relevant, non_relevant = self.__scope(scope)
+        if op == RELEVANT or op == NON_RELEVANT:
+            marked, other = (relevant, non_relevant) if op == RELEVANT else (non_relevant, relevant)
+            if doc in marked:
+                return False
+            marked.add(doc)
+            other.discard(doc)
+            return True
+
+        unmarked = relevant if op == UNMARK_RELEVANT else non_relevant
+        if doc not in unmarked:
+            return False
+        unmarked.discard(doc)
+        return True
+
+    def __append(self, op: str, scope: str, doc: str) -> bool:
+        """
+        Applies a record and queues it to be written if it changed the state.
+        """
+        with self.lock:
+            if not self.__apply(op, scope, doc):
+                return False
+            if self.path is None:
+                return True
+
+            self.pending.append(f'{op}\t{escape(scope)}\t{escape(doc)}\n')
+            if len(self.pending) >= self.batch_size:
+                self.flush()
+            elif self.timer is None:
+                self.timer = threading.Timer(self.flush_interval, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+            return True
+
+    def mark(self, doc: str, relevant: bool, scope: str = '') -> bool:
+        """
+        Marks a document as relevant or non-relevant, and unmarks it from the other set.
+
+        Args:
+            doc (str): Document id.
+            relevant (bool): Whether the document is relevant.
+            scope (str): Scope of the feedback.
+
+        Returns:
+            bool: Whether the feedback changed.
+        """
+        return self.__append(RELEVANT if relevant else NON_RELEVANT, scope, doc)
+
+    def unmark(self, doc: str, relevant: bool, scope: str = '') -> bool:
+        """
+        Unmarks a relevant or non-relevant document.
+
+        Args:
+            doc (str): Document id.
+            relevant (bool): Whether the document was marked as relevant.
+            scope (str): Scope of the feedback.
+
+        Returns:
+            bool: Whether the feedback changed.
+        """
+        return self.__append(UNMARK_RELEVANT if relevant else UNMARK_NON_RELEVANT, scope, doc)
+
+    def forget(self, docs: Iterable[str]) -> bool:
+        """
+        Unmarks documents in every scope, after they were deleted from the index.
+
+        Args:
+            docs (Iterable[str]): Document ids.
+
+        Returns:
+            bool: Whether the feedback changed.
+        """
+        docs = set(docs)
+        changed = False
+        with self.lock:
+            for scope, (relevant, non_relevant) in list(self.scopes.items()):
+                for doc in docs & relevant:
+                    changed |= self.unmark(doc, True, scope)
+                for doc in docs & non_relevant:
+                    changed |= self.unmark(doc, False, scope)
+        return changed
+
+    def docs(self, relevant: bool, scope: str = '') -> Set[str]:
+        """
+        Gets the relevant or non-relevant documents of a scope.
+
+        Args:
+            relevant (bool): Whether to get the relevant documents.
+            scope (str): Scope of the feedback.
+
+        Returns:
+            Set[str]: Document ids. The set must not be modified.
+        """
+        state = self.scopes.get(scope)
+        return state[0 if relevant else 1] if state is not None else set()
+
+    def flush(self):
+        """
+        Writes the pending records and syncs them to disk, compacting the log if it grew too much.
+        """
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            if not self.pending or self.path is None:
+                return
+
+            os.makedirs(self.path, exist_ok=True)
+            with open(self.__file('log'), 'a', encoding='utf-8') as f:
+                f.write(''.join(self.pending))
+                f.flush()
+                os.fsync(f.fileno())
+            self.records += len(self.pending)
+            self.pending = []
+
+            live = sum(len(relevant) + len(non_relevant) for relevant, non_relevant in self.scopes.values())
+            if self.records - live >= self.compact_after:
+                self.compact()
+
+    def close(self):
+        """
+        Cancels the timer and writes the pending records, before the process
+        exits. The log can still be used after it.
+        """
+        self.flush()
+
+    def compact(self):
+        """
+        Writes the state to a new snapshot and empties the log. The snapshot
+        replaces the old one atomically before the log is emptied, and
+        replaying the log on top of a snapshot that already has its records
+        gives the same state, so a crash at any point loses nothing.
+        """
+        with self.lock:
+            if self.path is None:
+                return
+            os.makedirs(self.path, exist_ok=True)
+            self.pending = []
+            snapshot = {scope: [sorted(relevant), sorted(non_relevant)]
+                        for scope, (relevant, non_relevant) in self.scopes.items() if relevant or non_relevant}
+            with open(self.__file('snapshot.json.tmp'), 'w') as f:
+                json.dump(snapshot, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(self.__file('snapshot.json.tmp'), self.__file('snapshot.json'))
+            open(self.__file('log'), 'w').close()
+            self.records = 0
+
+    def clear(self):
+        """
+        Unmarks every document of every scope, after the index is built again.
+        """
+        with self.lock:
+            self.scopes = {}
+            self.compact()
@@ -0,0 +1,135 @@
+import numpy as np
+from scipy import sparse
+from typing import Optional, Tuple
+from .methods import top_k
+from .segment import Segment
+
+
+class InvertedIndex:
+    def __init__(self, matrix: sparse.csc_matrix, max_impact: np.ndarray) -> None:
+        """
+        Initializes an inverted index over a document-term matrix.
+
+        The postings list of a term is its column of the matrix in CSC form: the
+        sorted documents that contain it and their weights.
+
+        Args:
+            matrix (scipy.sparse.csc_matrix): Matrix with documents as rows and terms as columns, with sorted indices.
+            max_impact (np.ndarray): Highest weight of every term.
+
+        Attributes:
+            postings_scored (int): Postings evaluated by the queries made so far.
+            postings_skipped (int): Postings skipped by the queries made so far.
+        """
+        self.matrix: sparse.csc_matrix = matrix
+        self.max_impact: np.ndarray = max_impact
+
+        self.postings_scored = 0
+        self.postings_skipped = 0
+
+    @staticmethod
+    def build(matrix: sparse.spmatrix) -> 'InvertedIndex':
+        """
+        Builds the index from a document-term matrix.
+
+        Args:
+            matrix (scipy.sparse.spmatrix): Matrix with documents as rows and terms as columns.
+
+        Returns:
+            InvertedIndex: The index.
+        """
+        matrix = sparse.csc_matrix(matrix)
+        matrix.sort_indices()
+        return InvertedIndex(matrix, matrix.max(axis=0).toarray().ravel())
+
+    def top_k(self, query: np.ndarray, k: int, scale: Optional[np.ndarray] = None,
+              max_impact: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Finds the k documents with the highest dot product with the query using
+        term-at-a-time accumulators and MaxScore pruning. The weight of a posting
+        is multiplied by the scale of its document, if given.
+
+        Terms are processed in decreasing order of their upper bound. Once the
+        bounds of the remaining terms cannot lift an unseen document over the
+        k-th best score, only the documents already in the accumulators are
+        scored, and the ones that cannot reach the top k are discarded.
+
+        Args:
+            query (np.ndarray): Dense query vector with non-negative weights.
+            k (int): Number of documents to return.
+            scale (np.ndarray, optional): Factor of the weights of every document.
+            max_impact (np.ndarray, optional): Highest scaled weight of every term, instead of the stored one.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Rows of the best documents and their scores, best first.
+        """
+        indptr, indices, data = self.matrix.indptr, self.matrix.indices, self.matrix.data
+        if max_impact is None:
+            max_impact = self.max_impact
+
+        terms = np.flatnonzero(query > 0)
+        upper = query[terms] * max_impact[terms]
+        order = np.argsort(-upper, kind='stable')
+        terms, upper = terms[order], upper[order]
+        remaining = np.append(np.cumsum(upper[::-1])[::-1], 0)
+
+        acc = np.zeros(self.matrix.shape[0])
+        candidates = np.empty(0, dtype=indices.dtype)
+        threshold = 0.0
+
+        def kth_score() -> float:
+            if len(candidates) < k:
+                return 0.0
+            return np.partition(acc[candidates], len(candidates) - k)[len(candidates) - k]
+
+        i = 0
+        while i < len(terms) and remaining[i] > threshold:
+            start, end = indptr[terms[i]], indptr[terms[i] + 1]
+            docs = indices[start:end]
+            weights = data[start:end] if scale is None else data[start:end] * scale[docs]
+            acc[docs] += query[terms[i]] * weights
+            candidates = np.union1d(candidates, docs)
+            self.postings_scored += end - start
+            threshold = kth_score()
+            i += 1
+
+        for j in range(i, len(terms)):
+            start, end = indptr[terms[j]], indptr[terms[j] + 1]
+            candidates = candidates[acc[candidates] + remaining[j] > threshold]
+
+            docs = indices[start:end]
+            pos = np.minimum(np.searchsorted(docs, candidates), max(len(docs) - 1, 0))
+            hit = docs[pos] == candidates if len(docs) else np.zeros(len(candidates), bool)
+            weights = data[start + pos[hit]] if scale is None else data[start + pos[hit]] * scale[candidates[hit]]
+            acc[candidates[hit]] += query[terms[j]] * weights
+
+            scored = int(hit.sum())
+            self.postings_scored += scored
+            self.postings_skipped += end - start - scored
+            threshold = kth_score()
+
+        best = candidates[top_k(acc[candidates], k)]
+        return best, acc[best]
+
+    def save(self, path: str) -> None:
+        """
+        Saves the index as a segment.
+
+        Args:
+            path (str): Directory of the segment.
+        """
+        Segment.write_sparse(path, self.matrix, {'max_impact': self.max_impact})
+
+    @staticmethod
+    def load(path: str) -> 'InvertedIndex':
+        """
+        Loads an index saved with save. The postings are memory-mapped, not read.
+
+        Args:
+            path (str): Directory of the segment.
+
+        Returns:
+            InvertedIndex: The index.
+        """
+        segment = Segment.read(path)
+        return InvertedIndex(segment.sparse(), segment['max_impact'])
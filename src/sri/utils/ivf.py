@@ -0,0 +1,117 @@
+import numpy as np
+from scipy import sparse
+from typing import Optional, Tuple
+from .methods import normalize_rows, top_k
+from .segment import Segment
+
+
+class IVFIndex:
+    def __init__(self, centroids: np.ndarray, list_ptr: np.ndarray, list_rows: np.ndarray) -> None:
+        """
+        Initializes an inverted file index over the rows of a normalized dense matrix.
+
+        Args:
+            centroids (np.ndarray): Normalized centroid of every list, one per row.
+            list_ptr (np.ndarray): The rows of list i are list_rows[list_ptr[i]:list_ptr[i + 1]].
+            list_rows (np.ndarray): Matrix rows grouped by list.
+        """
+        self.centroids: np.ndarray = centroids
+        self.list_ptr: np.ndarray = list_ptr
+        self.list_rows: np.ndarray = list_rows
+
+    @staticmethod
+    def build(matrix: np.ndarray, n_lists: Optional[int] = None, iterations: int = 10,
+              sample: int = 256, seed: int = 0) -> 'IVFIndex':
+        """
+        Clusters the rows of a matrix with spherical k-means and groups them by nearest centroid.
+
+        Args:
+            matrix (np.ndarray): Matrix with normalized rows.
+            n_lists (int, optional): Number of lists. Defaults to the square root of the number of rows.
+            iterations (int): Number of k-means iterations.
+            sample (int): Rows per list used to train the centroids.
+            seed (int): Seed of the random generator.
+
+        Returns:
+            IVFIndex: The index.
+        """
+        rng = np.random.default_rng(seed)
+        n = matrix.shape[0]
+        if n_lists is None:
+            n_lists = int(np.sqrt(n))
+        n_lists = max(1, min(n_lists, n))
+
+        train = matrix
+        if n > sample * n_lists:
+            train = matrix[rng.choice(n, sample * n_lists, replace=False)]
+
+        centroids = train[rng.choice(len(train), n_lists, replace=False)].copy()
+        for _ in range(iterations):
+            assign = IVFIndex.__assign(train, centroids)
+            one_hot = sparse.csr_matrix((np.ones(len(train), dtype=train.dtype),
+                                         (assign, np.arange(len(train)))), shape=(n_lists, len(train)))
+            sums = np.asarray(one_hot @ train)
+
+            # Empty lists are reseeded with random rows so no centroid is wasted
+            empty = np.flatnonzero(np.bincount(assign, minlength=n_lists) == 0)
+            sums[empty] = train[rng.choice(len(train), len(empty))]
+            centroids = normalize_rows(sums)
+
+        assign = IVFIndex.__assign(matrix, centroids)
+        list_rows = np.argsort(assign, kind='stable').astype(np.int32)
+        list_ptr = np.append(0, np.cumsum(np.bincount(assign, minlength=n_lists)))
+
+        return IVFIndex(centroids.astype(np.float32), list_ptr, list_rows)
+
+    @staticmethod
+    def __assign(matrix: np.ndarray, centroids: np.ndarray, batch: int = 4096) -> np.ndarray:
+        """
+        Finds the centroid with the highest cosine similarity of every row.
+        """
+        return np.concatenate([np.argmax(matrix[i:i + batch] @ centroids.T, axis=1)
+                               for i in range(0, matrix.shape[0], batch)] or [np.empty(0, np.int64)])
+
+    def search(self, matrix: np.ndarray, query: np.ndarray, k: int, nprobe: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Finds approximately the k rows with the highest dot product with the query,
+        scanning only the nprobe lists whose centroids are closest to it.
+
+        Args:
+            matrix (np.ndarray): The matrix the index was built over.
+            query (np.ndarray): Dense query vector.
+            k (int): Number of rows to return.
+            nprobe (int): Number of lists to scan. Higher is slower and more accurate.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The best rows and their scores, best first.
+        """
+        lists = top_k(self.centroids @ query, nprobe)
+        rows = np.concatenate([self.list_rows[self.list_ptr[i]:self.list_ptr[i + 1]] for i in lists]
+                              or [np.empty(0, np.int32)])
+
+        scores = matrix[rows] @ query
+        best = top_k(scores, k)
+        return rows[best], scores[best]
+
+    def save(self, path: str) -> None:
+        """
+        Saves the index as a segment.
+
+        Args:
+            path (str): Directory of the segment.
+        """
+        Segment.write(path, {'centroids': self.centroids, 'list_ptr': self.list_ptr, 'list_rows': self.list_rows})
+
+    @staticmethod
+    def load(path: str) -> 'IVFIndex':
+        """
+        Loads an index saved with save, memory-mapped.
+
+        Args:
+            path (str): Directory of the segment.
+
+        Returns:
+            IVFIndex: The index.
+        """
+        segment = Segment.read(path)
+        return IVFIndex(segment['centroids'], segment['list_ptr'], segment['list_rows'])
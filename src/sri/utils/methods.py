@@ -1,77 +1,94 @@
-def sum_vectors(vec1, vec2):
+import numpy as np
+from scipy import sparse
+
+
+def normalize_rows(matrix):
     """
-    Adds two vectors represented as lists of tuples (index, value).
+    Scales every row of a matrix to unit L2 norm. Rows with norm 0 are left unchanged.
 
     Args:
-        vec1 (list): First vector.
-        vec2 (list): Second vector.
+        matrix (scipy.sparse.csr_matrix | np.ndarray): Matrix to normalize.
 
     Returns:
-        list: Resultant vector after addition.
+        scipy.sparse.csr_matrix | np.ndarray: Matrix with the same type and rows of norm 1.
     """
-    dict1 = {ind: valor for ind, valor in vec1}
-    dict2 = {ind: valor for ind, valor in vec2}
-
-    sum_dict = {ind: dict1.get(ind, 0) + dict2.get(ind, 0)
-                for ind in set(dict1) | set(dict2)}
+    if sparse.issparse(matrix):
+        matrix = sparse.csr_matrix(matrix)
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        norms[norms == 0] = 1
+        return sparse.csr_matrix(sparse.diags(1 / norms) @ matrix, dtype=matrix.dtype)
 
-    sum_vec = [(ind, sum_dict[ind]) for ind in sum_dict]
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return (matrix / norms).astype(matrix.dtype)
 
-    return sum_vec
 
-
-def sub_vectors(vec1, vec2):
+def top_k(scores, k):
     """
-    Subtracts two vectors represented as lists of tuples (index, value).
+    Finds the positions of the k highest scores using a partial sort.
 
     Args:
-        vec1 (list): First vector.
-        vec2 (list): Second vector.
+        scores (np.ndarray): One dimensional array of scores.
+        k (int): Number of positions to return.
 
     Returns:
-        list: Resultant vector after subtraction.
+        np.ndarray: Positions of the k highest scores, in descending order of score.
     """
-    dict1 = {ind: valor for ind, valor in vec1}
-    dict2 = {ind: valor for ind, valor in vec2}
-
-    sub_dict = {ind: dict1.get(ind, 0) - dict2.get(ind, 0)
-                for ind in set(dict1) | set(dict2)}
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
 
-    sub_vec = [(ind, sub_dict[ind]) for ind in sub_dict]
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
 
-    return sub_vec
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
 
 
-def mult_scalar(vec, scalar):
+def top_k_rows(scores, k):
     """
-    Multiplies a vector by a scalar.
+    Finds the k highest scores of every row of a matrix.
 
     Args:
-        vec (list): Vector represented as a list of tuples (index, value).
-        scalar (float): Scalar value to multiply the vector by.
+        scores (np.ndarray): Two dimensional array of scores, one row per query.
+        k (int): Number of positions to return per row.
 
     Returns:
-        list: Resultant vector after scalar multiplication.
+        list: Positions of the k highest scores of every row and the scores, in descending order of score.
     """
-    return [(ind, valor * scalar) for ind, valor in vec]
-
-
-def mean(vectors):
+    scores = np.asarray(scores)
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        return [(np.empty(0, dtype=np.int64), np.empty(0, dtype=scores.dtype)) for _ in range(len(scores))]
+
+    if k < scores.shape[1]:
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.broadcast_to(np.arange(k), scores.shape)
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1, kind='stable')
+    best = np.take_along_axis(candidates, order, axis=1)
+    best_scores = np.take_along_axis(candidate_scores, order, axis=1)
+    return list(zip(best, best_scores))
+
+
+def chunks(iterable, size):
     """
-    Computes the mean vector from a list of vectors.
+    Splits an iterable into lists of at most size items, reading it lazily.
 
     Args:
-        vectors (list): List of vectors, each represented as a list of tuples (index, value).
+        iterable (Iterable): Items to split.
+        size (int): Maximum number of items of a chunk.
 
-    Returns:
-        list: Mean vector.
+    Yields:
+        list: The next chunk of items.
     """
-    if len(vectors) == 0:
-        return []
-
-    r = []
-
-    for vec in vectors:
-        r = sum_vectors(r, vec)
-
-    return mult_scalar(r, 1/len(vectors))
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
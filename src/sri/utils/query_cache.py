@@ -0,0 +1,82 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+
+class QueryCache:
+    def __init__(self, max_size: int = 1024, ttl: float = 600) -> None:
+        """
+        Initializes an in-memory cache of query results, which evicts the least
+        recently used result once it has max_size of them and expires every
+        result ttl seconds after it was stored.
+
+        Args:
+            max_size (int): Maximum number of results, 0 disables the cache.
+            ttl (float): Seconds a result is valid for, None to never expire them.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        Finds the result of a query, and marks it as the most recently used.
+
+        Args:
+            key (Hashable): Key of the query.
+
+        Returns:
+            Optional[Any]: The result, None if it is not cached or expired.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and self.ttl is not None and time.monotonic() - entry[0] > self.ttl:
+                del self.entries[key]
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, value: Any):
+        """
+        Stores the result of a query.
+
+        Args:
+            key (Hashable): Key of the query.
+            value (Any): The result.
+        """
+        if self.max_size <= 0:
+            return
+
+        with self.lock:
+            self.entries[key] = (time.monotonic(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        """
+        Removes every result, after a change of the index or of the relevance feedback.
+        """
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: Number of hits, misses and cached results.
+        """
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self.entries)}
+
+    def __len__(self) -> int:
+        return len(self.entries)
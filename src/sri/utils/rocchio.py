@@ -0,0 +1,151 @@
+import numpy as np
+from typing import Dict, Tuple, Union
+
+# A dense vector, or the indices and values of the non-zero entries of a sparse one
+Vector = Union[np.ndarray, Tuple[np.ndarray, np.ndarray]]
+
+
+class Rocchio:
+    def __init__(self, sparse: bool, alpha: float = 1.0, beta: float = 0.8, gamma: float = 0.1,
+                 clip: bool = False) -> None:
+        """
+        Initializes the relevance feedback of a model. The sums of the vectors
+        of the relevant and of the non-relevant documents are kept up to date as
+        documents are marked, so expanding a query costs the same however many
+        documents were marked:
+
+            alpha * query + beta * mean(relevant) - gamma * mean(non relevant)
+
+        The vector of every marked document is kept, so it is subtracted when
+        the document is unmarked even if it was deleted from the index.
+
+        Args:
+            sparse (bool): Whether the vectors are sparse, and sums are kept as dictionaries of their non-zero entries.
+            alpha (float): Weight of the original query.
+            beta (float): Weight of the mean of the relevant documents.
+            gamma (float): Weight of the mean of the non-relevant documents.
+            clip (bool): Whether negative weights of expanded queries are set to 0.
+        """
+        self.sparse = sparse
+        self.alpha = alpha
+        self.beta = beta
+        self.gamma = gamma
+        self.clip = clip
+        self.clear()
+
+    def clear(self):
+        """
+        Unmarks every document.
+        """
+        self.vectors: Tuple[Dict[str, Vector], Dict[str, Vector]] = ({}, {})
+        self.sums = ({}, {}) if self.sparse else (None, None)
+        self.shift: Tuple[np.ndarray, np.ndarray] = None
+
+    def add(self, doc: str, vector: Vector, relevant: bool):
+        """
+        Marks a document as relevant or non-relevant.
+
+        Args:
+            doc (str): Document id.
+            vector (Vector): Vector of the document.
+            relevant (bool): Whether the document is relevant.
+        """
+        if doc in self.vectors[not relevant]:
+            self.remove(doc, not relevant)
+        if doc in self.vectors[relevant]:
+            return
+
+        self.vectors[relevant][doc] = vector
+        self.__update(vector, relevant, 1)
+
+    def remove(self, doc: str, relevant: bool):
+        """
+        Unmarks a relevant or non-relevant document.
+
+        Args:
+            doc (str): Document id.
+            relevant (bool): Whether the document was marked as relevant.
+        """
+        vector = self.vectors[relevant].pop(doc, None)
+        if vector is not None:
+            self.__update(vector, relevant, -1)
+
+    def __update(self, vector: Vector, relevant: bool, sign: int):
+        """
+        Adds or subtracts the vector of a document from its sum.
+        """
+        if self.sparse:
+            total = self.sums[relevant]
+            for i, value in zip(*(part.tolist() for part in vector)):
+                total[i] = total.get(i, 0.0) + sign * value
+            if len(self.vectors[relevant]) == 0:
+                # Empty sums are reset, so rounding errors do not pile up
+                total.clear()
+        else:
+            sums = list(self.sums)
+            if len(self.vectors[relevant]) == 0:
+                sums[relevant] = None
+            elif sums[relevant] is None:
+                sums[relevant] = np.array(vector, dtype=np.float64)
+            else:
+                sums[relevant] = sums[relevant] + sign * np.asarray(vector, dtype=np.float64)
+            self.sums = tuple(sums)
+        self.shift = None
+
+    def __shift(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Computes beta * mean(relevant) - gamma * mean(non relevant) once after every change.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Indices and values of the shift of the query.
+        """
+        if self.shift is None:
+            indices, values = [np.empty(0, dtype=np.int64)], [np.empty(0)]
+            for relevant, weight in [(True, self.beta), (False, -self.gamma)]:
+                n = len(self.vectors[relevant])
+                if n == 0:
+                    continue
+                total = self.sums[relevant]
+                if self.sparse:
+                    indices.append(np.fromiter(total.keys(), dtype=np.int64, count=len(total)))
+                    values.append(np.fromiter(total.values(), dtype=np.float64, count=len(total)) * (weight / n))
+                else:
+                    indices.append(np.arange(len(total)))
+                    values.append(total * (weight / n))
+            self.shift = (np.concatenate(indices), np.concatenate(values))
+        return self.shift
+
+    def snapshot(self) -> 'Rocchio':
+        """
+        Copies the feedback as it is now, to expand queries while documents are
+        marked. The copy only keeps the shift of the queries, so it can not be changed.
+
+        Returns:
+            Rocchio: The copy.
+        """
+        copy = Rocchio(self.sparse, self.alpha, self.beta, self.gamma, self.clip)
+        copy.shift = self.__shift()
+        return copy
+
+    def expand(self, query: np.ndarray) -> np.ndarray:
+        """
+        Moves a query towards the relevant documents and away from the non-relevant ones.
+
+        Args:
+            query (np.ndarray): Dense vector of the query.
+
+        Returns:
+            np.ndarray: Dense vector of the expanded query, of the type of the query.
+        """
+        indices, values = self.__shift()
+        expanded = self.alpha * np.asarray(query, dtype=np.float64)
+        if len(indices):
+            # Documents of older segments may have fewer terms, and newer ones more than the query
+            keep = indices < len(expanded)
+            np.add.at(expanded, indices[keep], values[keep])
+        if self.clip:
+            np.maximum(expanded, 0, out=expanded)
+        return expanded.astype(np.asarray(query).dtype)
+
+    def __len__(self) -> int:
+        return len(self.vectors[True]) + len(self.vectors[False])
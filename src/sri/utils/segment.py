@@ -0,0 +1,150 @@
+import json
+import os
+import shutil
+import zlib
+import numpy as np
+from scipy import sparse
+from typing import Any, Dict
+
+FORMAT = 'sri-segment'
+VERSION = 1
+
+
+class SegmentError(Exception):
+    """
+    Raised when a segment is missing, was written by another version of the format or is corrupt.
+    """
+
+
+class Segment:
+    def __init__(self, path: str, meta: Dict[str, Any], arrays: Dict[str, np.ndarray],
+                 checksums: Dict[str, int] = {}) -> None:
+        """
+        Initializes a segment: a directory with one .npy file per array and a
+        header.json with the format version, the metadata of the segment and the
+        dtype, shape and CRC32 checksum of every array.
+
+        Args:
+            path (str): Directory of the segment.
+            meta (Dict[str, Any]): Metadata of the segment.
+            arrays (Dict[str, np.ndarray]): Arrays of the segment, memory-mapped when read.
+            checksums (Dict[str, int]): CRC32 of every array, as written in the header.
+        """
+        self.path = path
+        self.meta = meta
+        self.arrays = arrays
+        self.checksums = checksums
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.arrays[name]
+
+    @staticmethod
+    def checksum(array: np.ndarray) -> int:
+        """
+        Computes the CRC32 checksum of the bytes of an array.
+        """
+        return zlib.crc32(np.ascontiguousarray(array).view(np.uint8).ravel())
+
+    @staticmethod
+    def write(path: str, arrays: Dict[str, np.ndarray], meta: Dict[str, Any] = {}) -> None:
+        """
+        Writes a segment, replacing any segment already in path. The segment is
+        written to a temporary directory first, so readers never see a partial one.
+
+        Args:
+            path (str): Directory of the segment.
+            arrays (Dict[str, np.ndarray]): Arrays of the segment.
+            meta (Dict[str, Any]): Metadata of the segment. Must be serializable to JSON.
+        """
+        tmp = path + '.tmp'
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+
+        header = {'format': FORMAT, 'version': VERSION, 'meta': meta, 'arrays': {}}
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            np.save(os.path.join(tmp, name + '.npy'), array)
+            header['arrays'][name] = {'dtype': array.dtype.str, 'shape': list(array.shape),
+                                      'crc32': Segment.checksum(array)}
+
+        with open(os.path.join(tmp, 'header.json'), 'w') as f:
+            json.dump(header, f)
+
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp, path)
+
+    @staticmethod
+    def read(path: str, mmap: bool = True) -> 'Segment':
+        """
+        Reads a segment. With mmap, the arrays are mapped read-only, so reading is
+        almost instant and the pages are shared between processes.
+
+        Args:
+            path (str): Directory of the segment.
+            mmap (bool): Whether to memory-map the arrays instead of reading them.
+
+        Returns:
+            Segment: The segment.
+
+        Raises:
+            SegmentError: If the segment is missing, of another version or its arrays do not match the header.
+        """
+        try:
+            with open(os.path.join(path, 'header.json')) as f:
+                header = json.load(f)
+        except FileNotFoundError:
+            raise SegmentError(f'{path} is not a segment, rebuild the system')
+
+        if header.get('format') != FORMAT or header.get('version') != VERSION:
+            raise SegmentError(f'{path} was written with version {header.get("version")} '
+                               f'of the format, this is version {VERSION}, rebuild the system')
+
+        arrays = {}
+        for name, info in header['arrays'].items():
+            array = np.load(os.path.join(path, name + '.npy'), mmap_mode='r' if mmap else None)
+            if array.dtype.str != info['dtype'] or list(array.shape) != info['shape']:
+                raise SegmentError(f'{path}/{name}.npy does not match the header of the segment')
+            arrays[name] = array
+
+        return Segment(path, header['meta'], arrays,
+                       {name: info['crc32'] for name, info in header['arrays'].items()})
+
+    @staticmethod
+    def write_sparse(path: str, matrix: sparse.spmatrix, arrays: Dict[str, np.ndarray] = {},
+                     meta: Dict[str, Any] = {}) -> None:
+        """
+        Writes a segment with the arrays of a CSR or CSC matrix and, optionally, other arrays.
+
+        Args:
+            path (str): Directory of the segment.
+            matrix (scipy.sparse.spmatrix): The matrix, in CSR or CSC format.
+            arrays (Dict[str, np.ndarray]): Other arrays of the segment.
+            meta (Dict[str, Any]): Other metadata of the segment.
+        """
+        Segment.write(path, {'data': matrix.data, 'indices': matrix.indices, 'indptr': matrix.indptr, **arrays},
+                      {'format': matrix.format, 'shape': list(matrix.shape),
+                       'sorted': bool(matrix.has_sorted_indices), **meta})
+
+    def sparse(self) -> sparse.spmatrix:
+        """
+        Gets the matrix of a segment written with write_sparse, over the memory-mapped arrays.
+
+        Returns:
+            scipy.sparse.spmatrix: The matrix, in the format it was written in.
+        """
+        constructor = sparse.csr_matrix if self.meta['format'] == 'csr' else sparse.csc_matrix
+        matrix = constructor((self['data'], self['indices'], self['indptr']),
+                             shape=tuple(self.meta['shape']), copy=False)
+        matrix.has_sorted_indices = self.meta['sorted']
+        return matrix
+
+    def verify(self) -> None:
+        """
+        Checks the checksum of every array. It reads the whole segment.
+
+        Raises:
+            SegmentError: If an array does not match its checksum.
+        """
+        for name, array in self.arrays.items():
+            if Segment.checksum(array) != self.checksums[name]:
+                raise SegmentError(f'{self.path}/{name}.npy is corrupt, rebuild the system')
@@ -0,0 +1,246 @@
+import zlib
+import numpy as np
+from typing import Iterator, List, Optional, Set
+from .doc_table import decode_string, encode_strings
+from .segment import Segment
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """
+    Computes the Levenshtein distance between two strings, stopping as soon
+    as it is known to be over a limit. Only the cells of the dynamic
+    programming table at most limit away from its diagonal are computed.
+
+    Args:
+        a (str): First string.
+        b (str): Second string.
+        limit (int): Largest distance of interest.
+
+    Returns:
+        int: The distance, or limit + 1 if it is larger than limit.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+
+    over = limit + 1
+    previous = [j if j <= limit else over for j in range(len(b) + 1)]
+    for i, ca in enumerate(a, 1):
+        low, high = max(1, i - limit), min(len(b), i + limit)
+        current = [i if i <= limit else over] + [over] * len(b)
+        best = current[0]
+        for j in range(low, high + 1):
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != b[j - 1]))
+            current[j] = value
+            if value < best:
+                best = value
+        if best > limit:
+            return over
+        previous = current
+    return min(previous[-1], over)
+
+
+def deletes(word: str, distance: int) -> Set[str]:
+    """
+    Finds every string obtained by deleting up to distance characters of a word.
+
+    Args:
+        word (str): The word.
+        distance (int): Maximum number of deleted characters.
+
+    Returns:
+        Set[str]: The strings, including the word itself.
+    """
+    result = {word}
+    level = {word}
+    for _ in range(distance):
+        level = {w[:i] + w[i + 1:] for w in level if len(w) > 1 for i in range(len(w))}
+        result |= level
+    return result
+
+
+def hash_strings(strings: Set[str]) -> np.ndarray:
+    """
+    Hashes strings with a hash that does not change between processes.
+    """
+    return np.array([zlib.crc32(s.encode()) for s in strings], dtype=np.uint32)
+
+
+class SpellingIndex:
+    def __init__(self, words: np.ndarray, word_offsets: np.ndarray, lengths: np.ndarray, counts: np.ndarray,
+                 keys: np.ndarray, entries: np.ndarray, max_distance: int = 2, prefix_length: int = 7) -> None:
+        """
+        Initializes a symmetric delete (SymSpell) index over a vocabulary. Every
+        string obtained by deleting up to max_distance characters of the prefix
+        of a word is hashed and points to the word, so the candidates for a
+        misspelled token are found by hashing its own deletions, instead of
+        comparing it with every word. Candidates are then checked with the
+        Levenshtein distance, which also discards hash collisions.
+
+        Args:
+            words (np.ndarray): Concatenated utf-8 bytes of the words.
+            word_offsets (np.ndarray): Offset of every word.
+            lengths (np.ndarray): Number of characters of every word.
+            counts (np.ndarray): Frequency of every word, used to break ties.
+            keys (np.ndarray): Sorted hashes of the deletions.
+            entries (np.ndarray): Word of every hash of keys.
+            max_distance (int): Largest edit distance of a correction.
+            prefix_length (int): Number of characters of every word whose deletions are indexed.
+        """
+        self.words = words
+        self.word_offsets = word_offsets
+        self.lengths = lengths
+        self.counts = counts
+        self.keys = keys
+        self.entries = entries
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+
+    @staticmethod
+    def build(words: List[str], counts: List[int] = None, max_distance: int = 2,
+              prefix_length: int = 7) -> 'SpellingIndex':
+        """
+        Builds the index of a vocabulary.
+
+        Args:
+            words (List[str]): The words, in the order of their ids.
+            counts (List[int], optional): Frequency of every word. Defaults to 1 for every word.
+            max_distance (int): Largest edit distance of a correction.
+            prefix_length (int): Number of characters of every word whose deletions are indexed.
+
+        Returns:
+            SpellingIndex: The index.
+        """
+        index = SpellingIndex(*encode_strings([]), np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int64),
+                              np.empty(0, dtype=np.uint32), np.empty(0, dtype=np.int32), max_distance, prefix_length)
+        index.add(words, counts if counts is not None else np.ones(len(words), dtype=np.int64))
+        return index
+
+    def add(self, words: List[str], counts: List[int]):
+        """
+        Adds words to the index, after the ones it has.
+
+        Args:
+            words (List[str]): The new words, in the order of their ids.
+            counts (List[int]): Frequency of every word of the index after adding them.
+        """
+        keys, entries = [self.keys], [self.entries]
+        for i, word in enumerate(words, len(self)):
+            hashes = hash_strings(deletes(word[:self.prefix_length], self.max_distance))
+            keys.append(hashes)
+            entries.append(np.full(len(hashes), i, dtype=np.int32))
+
+        keys, entries = np.concatenate(keys), np.concatenate(entries)
+        order = np.argsort(keys, kind='stable')
+        self.keys, self.entries = keys[order], entries[order]
+
+        new_words, new_offsets = encode_strings(words)
+        self.words = np.concatenate([self.words, new_words])
+        self.word_offsets = np.concatenate([self.word_offsets, new_offsets[1:] + self.word_offsets[-1]])
+        self.lengths = np.concatenate([self.lengths, np.array([len(word) for word in words], dtype=np.int32)])
+        self.counts = np.asarray(counts, dtype=np.int64)
+
+    def update_counts(self, counts: List[int]):
+        """
+        Replaces the frequencies of the words of the index.
+
+        Args:
+            counts (List[int]): Frequency of every word of the index.
+        """
+        self.counts = np.asarray(counts, dtype=np.int64)
+
+    def save(self, path: str):
+        """
+        Saves the index as a segment.
+
+        Args:
+            path (str): Directory of the segment.
+        """
+        Segment.write(path, {'words': self.words, 'word_offsets': self.word_offsets, 'lengths': self.lengths,
+                             'counts': self.counts, 'keys': self.keys, 'entries': self.entries},
+                      {'max_distance': self.max_distance, 'prefix_length': self.prefix_length})
+
+    @staticmethod
+    def load(path: str) -> 'SpellingIndex':
+        """
+        Loads an index saved with save, memory-mapped.
+
+        Args:
+            path (str): Directory of the segment.
+
+        Returns:
+            SpellingIndex: The index.
+        """
+        segment = Segment.read(path)
+        # Plain views of the memory maps, which are much faster to slice one word at a time
+        arrays = [np.asarray(segment[name]) for name in ['words', 'word_offsets', 'lengths', 'counts', 'keys', 'entries']]
+        return SpellingIndex(*arrays, segment.meta['max_distance'], segment.meta['prefix_length'])
+
+    def __len__(self) -> int:
+        return len(self.word_offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        return decode_string(self.words, self.word_offsets, i)
+
+    def __iter__(self) -> Iterator[str]:
+        return (self[i] for i in range(len(self)))
+
+    def __contains__(self, word: str) -> bool:
+        return any(self[i] == word for i in self.__candidates({word[:self.prefix_length]}))
+
+    def __candidates(self, strings: Set[str]) -> np.ndarray:
+        """
+        Finds the words that share the hash of a deletion with a token.
+
+        Args:
+            strings (Set[str]): Deletions of the prefix of the token.
+
+        Returns:
+            np.ndarray: Ids of the words.
+        """
+        hashes = hash_strings(strings)
+        starts = np.searchsorted(self.keys, hashes, side='left')
+        ends = np.searchsorted(self.keys, hashes, side='right')
+        if not np.any(ends > starts):
+            return np.empty(0, dtype=np.int32)
+        return np.unique(np.concatenate([self.entries[s:e] for s, e in zip(starts, ends)]))
+
+    def correct(self, token: str, score_cutoff: int = 70) -> Optional[str]:
+        """
+        Finds the closest word to a token. A word is accepted if its similarity,
+        100 * (1 - distance / length of the longest of both), is at least the
+        cutoff, and ties are broken by the frequency of the word.
+
+        Args:
+            token (str): The token.
+            score_cutoff (int): Minimum similarity of the word, from 0 to 100.
+
+        Returns:
+            Optional[str]: The word, None if no word is close enough.
+        """
+        allowed = 1 - score_cutoff / 100
+        # The longest a word can be is len(token) + max_distance, which bounds every distance
+        distance = min(self.max_distance, int(allowed * (len(token) + self.max_distance) + 1e-9))
+        if distance == 0:
+            return None
+
+        candidates = self.__candidates(deletes(token[:self.prefix_length], distance))
+        lengths = self.lengths[candidates]
+        limits = np.minimum(distance, (allowed * np.maximum(lengths, len(token)) + 1e-9).astype(np.int64))
+        # Words that are only in deleted documents have no frequency, and are not suggested
+        keep = (np.abs(lengths - len(token)) <= limits) & (self.counts[candidates] > 0)
+        candidates, limits = candidates[keep], limits[keep]
+
+        best, best_key = None, None
+        for i, limit in zip(candidates.tolist(), limits.tolist()):
+            if best_key is not None:
+                # Words farther than the best one can not replace it
+                limit = min(limit, best_key[0])
+            word = self[i]
+            distance = edit_distance(token, word, limit)
+            if distance > limit:
+                continue
+
+            key = (distance, -int(self.counts[i]), word)
+            if best_key is None or key < best_key:
+                best, best_key = word, key
+        return best
@@ -1,4 +1,9 @@
-from nltk.corpus import wordnet
+import bisect
+import numpy as np
+from typing import Callable, List
+from .doc_table import decode_string, encode_strings
+from .segment import Segment
+
 
 class SynonimousDictionary:
     def synonym(self, word: str):
@@ -11,6 +16,9 @@ class SynonimousDictionary:
         Returns:
             list: A list of unique synonyms for the input word.
         """
+        # Imported here, so only building the synonym map loads NLTK
+        from nltk.corpus import wordnet
+
         synsets = wordnet.synsets(word)
         synonyms = [lemma.name().lower()
                     for synset in synsets for lemma in synset.lemmas()]
@@ -20,3 +28,163 @@ class SynonimousDictionary:
             synonymus_set.add(word)
 
         return [word for word in synonymus_set]
+
+
+class SynonymMap:
+    def __init__(self, words: np.ndarray, word_offsets: np.ndarray, order: np.ndarray,
+                 offsets: np.ndarray, neighbors: np.ndarray) -> None:
+        """
+        Initializes a map from every word of the vocabulary to its synonyms that
+        are also in the vocabulary, stored as an adjacency table of word ids so
+        expanding a query needs neither WordNet nor the vocabulary as a set.
+
+        Args:
+            words (np.ndarray): Concatenated utf-8 bytes of the words, in the order of their ids.
+            word_offsets (np.ndarray): Offset of every word.
+            order (np.ndarray): Ids of the words in alphabetical order, to find the id of a word.
+            offsets (np.ndarray): Position in neighbors of the synonyms of every word.
+            neighbors (np.ndarray): Ids of the synonyms of every word, one word after the other.
+        """
+        self.words = words
+        self.word_offsets = word_offsets
+        self.order = order
+        self.offsets = offsets
+        self.neighbors = neighbors
+
+    @staticmethod
+    def build(words: List[str], synonym: Callable[[str], List[str]] = None) -> 'SynonymMap':
+        """
+        Builds the synonym map of a vocabulary.
+
+        Args:
+            words (List[str]): The words, in the order of their ids.
+            synonym (Callable[[str], List[str]], optional): Finds the synonyms of a word. Defaults to WordNet.
+
+        Returns:
+            SynonymMap: The map.
+        """
+        synonyms = SynonymMap(*encode_strings([]), np.empty(0, dtype=np.int32), np.zeros(1, dtype=np.int64),
+                              np.empty(0, dtype=np.int32))
+        synonyms.add(words, synonym)
+        return synonyms
+
+    def add(self, words: List[str], synonym: Callable[[str], List[str]] = None):
+        """
+        Adds words to the map, after the ones it has. Only the synonyms of the
+        new words are looked up: their rows are appended to the table, and the
+        new words are appended to the rows of the words they are synonyms of,
+        which keeps every row sorted as the new ids are the largest.
+
+        Args:
+            words (List[str]): The new words, in the order of their ids.
+            synonym (Callable[[str], List[str]], optional): Finds the synonyms of a word. Defaults to WordNet.
+        """
+        if synonym is None:
+            synonym = SynonimousDictionary().synonym
+
+        old = len(self)
+        ids = {word: i for i, word in enumerate(words, old)}
+        rows = [set() for _ in words]
+        # Edges from words already in the map to new words
+        reverse = set()
+        for i, word in enumerate(words, old):
+            for syn in synonym(word):
+                j = ids.get(syn, -1)
+                if j < 0 and old > 0:
+                    j = self.id(syn)
+                if j < 0 or j == i:
+                    continue
+                rows[i - old].add(j)
+                if j >= old:
+                    rows[j - old].add(i)
+                else:
+                    reverse.add((j, i))
+
+        # Positions of the new words in the alphabetical order, found before the order changes
+        alphabetical = sorted(range(old, old + len(words)), key=lambda i: words[i - old])
+        positions = [self.__position(words[i - old]) for i in alphabetical]
+
+        if reverse:
+            sources, targets = np.array(sorted(reverse), dtype=np.int64).T
+            self.neighbors = np.insert(self.neighbors, self.offsets[sources + 1], targets)
+            self.offsets = self.offsets + np.append(0, np.cumsum(np.bincount(sources, minlength=old)))
+        self.offsets = np.append(self.offsets, self.offsets[-1] + np.cumsum([len(row) for row in rows],
+                                                                            dtype=np.int64))
+        self.neighbors = np.concatenate([self.neighbors, np.array([j for row in rows for j in sorted(row)],
+                                                                  dtype=np.int32)]).astype(np.int32)
+
+        new_words, new_offsets = encode_strings(words)
+        self.words = np.concatenate([self.words, new_words])
+        self.word_offsets = np.concatenate([self.word_offsets, new_offsets[1:] + self.word_offsets[-1]])
+        self.order = np.insert(self.order, np.array(positions, dtype=np.int64), alphabetical).astype(np.int32)
+
+    def save(self, path: str):
+        """
+        Saves the map as a segment.
+
+        Args:
+            path (str): Directory of the segment.
+        """
+        Segment.write(path, {'words': self.words, 'word_offsets': self.word_offsets, 'order': self.order,
+                             'offsets': self.offsets, 'neighbors': self.neighbors})
+
+    @staticmethod
+    def load(path: str) -> 'SynonymMap':
+        """
+        Loads a map saved with save, memory-mapped.
+
+        Args:
+            path (str): Directory of the segment.
+
+        Returns:
+            SynonymMap: The map.
+        """
+        segment = Segment.read(path)
+        # Plain views of the memory maps, which are much faster to slice one word at a time
+        return SynonymMap(*[np.asarray(segment[name]) for name in ['words', 'word_offsets', 'order', 'offsets',
+                                                                   'neighbors']])
+
+    def __len__(self) -> int:
+        return len(self.word_offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        return decode_string(self.words, self.word_offsets, i)
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def __position(self, word: str) -> int:
+        """
+        Finds the position of the first word not smaller than word in the alphabetical order.
+        """
+        return bisect.bisect_left(range(len(self.order)), word, key=lambda k: self[int(self.order[k])])
+
+    def id(self, word: str) -> int:
+        """
+        Finds the id of a word with a binary search.
+
+        Args:
+            word (str): The word.
+
+        Returns:
+            int: The id, -1 if the word is not in the vocabulary.
+        """
+        position = self.__position(word)
+        if position < len(self.order) and self[int(self.order[position])] == word:
+            return int(self.order[position])
+        return -1
+
+    def synonyms(self, word: str) -> List[str]:
+        """
+        Finds the synonyms of a word that are in the vocabulary.
+
+        Args:
+            word (str): The word.
+
+        Returns:
+            List[str]: The synonyms, empty if the word is not in the vocabulary.
+        """
+        i = self.id(word)
+        if i < 0:
+            return []
+        return [self[j] for j in self.neighbors[self.offsets[i]:self.offsets[i + 1]].tolist()]
@@ -1,41 +1,199 @@
-import json
-from typing import Dict, Optional, List
+import os
+import shutil
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+from .doc_table import decode_string, encode_strings
+from .segment import Segment
 
 
-class TrieNode:
-    def __init__(self, char: str = '~', is_end_of_word: bool = False) -> None:
+class Trie:
+    def __init__(self, words: np.ndarray, word_offsets: np.ndarray, counts: np.ndarray, labels: np.ndarray,
+                 first_child: np.ndarray, starts: np.ndarray, ends: np.ndarray, top_offsets: np.ndarray,
+                 top: np.ndarray, top_k: int = 10) -> None:
         """
-        Initializes a TrieNode.
+        Initializes a trie of the vocabulary flattened into arrays, so it is
+        loaded with a memory map instead of being built node by node.
+
+        The words are sorted, so the words under a node are a range of the
+        sorted words. The nodes are numbered in breadth-first order, so the
+        children of a node are a range of the nodes, sorted by character. The
+        top_k most frequent completions of every node with more words than
+        top_k are precomputed, the rest are ranked when asked for.
 
         Args:
-            char (str): The character associated with this node.
-            is_end_of_word (bool): Indicates whether this node represents the end of a word.
+            words (np.ndarray): Concatenated utf-8 bytes of the sorted words.
+            word_offsets (np.ndarray): Offset of every word.
+            counts (np.ndarray): Document frequency of every word.
+            labels (np.ndarray): Code point of the character of every node, -1 for the root.
+            first_child (np.ndarray): First child of every node, the children of node are
+                first_child[node] to first_child[node + 1].
+            starts (np.ndarray): First word under every node.
+            ends (np.ndarray): One past the last word under every node.
+            top_offsets (np.ndarray): Position in top of the completions of every node.
+            top (np.ndarray): Precomputed completions of every node, most frequent first.
+            top_k (int): Number of completions precomputed per node.
         """
-        self.char: str = char
-        self.children: Dict[str, 'TrieNode'] = {}
-        self.is_end_of_word: bool = is_end_of_word
+        self.words = words
+        self.word_offsets = word_offsets
+        self.counts = counts
+        self.labels = labels
+        self.first_child = first_child
+        self.starts = starts
+        self.ends = ends
+        self.top_offsets = top_offsets
+        self.top = top
+        self.top_k = top_k
 
+    @staticmethod
+    def build(words: List[str], counts: List[int], top_k: int = 10) -> 'Trie':
+        """
+        Builds the trie of a vocabulary.
 
-class Trie:
-    def __init__(self) -> None:
+        Args:
+            words (List[str]): The words.
+            counts (List[int]): Document frequency of every word.
+            top_k (int): Number of completions precomputed per node.
+
+        Returns:
+            Trie: The trie.
+        """
+        frequency = {}
+        for word, count in zip(words, counts):
+            frequency[word] = max(frequency.get(word, 0), count)
+        words = sorted(frequency)
+        counts = np.array([frequency[word] for word in words], dtype=np.int64)
+
+        # Nodes in depth-first order, the order in which the sorted words create them
+        labels, starts, ends, depths, parents = [-1], [0], [len(words)], [0], [-1]
+        # Open nodes of the path of the previous word, the root at depth 0
+        path = [0]
+        previous = ''
+        for i, word in enumerate(words):
+            common = 0
+            while common < min(len(word), len(previous)) and word[common] == previous[common]:
+                common += 1
+            while len(path) > common + 1:
+                ends[path.pop()] = i
+            for char in word[common:]:
+                parents.append(path[-1])
+                path.append(len(labels))
+                labels.append(ord(char))
+                starts.append(i)
+                ends.append(len(words))
+                depths.append(len(path) - 1)
+            previous = word
+
+        # Renumbered in breadth-first order: by depth, and by depth-first order within a depth
+        order = np.lexsort((np.arange(len(labels)), np.array(depths)))
+        position = np.empty(len(order), dtype=np.int64)
+        position[order] = np.arange(len(order))
+        parents = position[np.array(parents)[order[1:]]]
+        first_child = np.ones(len(order) + 1, dtype=np.int32)
+        first_child[1:] += np.cumsum(np.bincount(parents, minlength=len(order))).astype(np.int32)
+
+        labels = np.array(labels, dtype=np.int32)[order]
+        starts, ends = np.array(starts, dtype=np.int32)[order], np.array(ends, dtype=np.int32)[order]
+        heavy = np.flatnonzero(ends - starts > top_k)
+        top_offsets = np.zeros(len(labels) + 1, dtype=np.int64)
+        top_offsets[heavy + 1] = top_k
+        np.cumsum(top_offsets, out=top_offsets)
+        top = np.empty(len(heavy) * top_k, dtype=np.int32)
+        for i, node in enumerate(heavy.tolist()):
+            top[i * top_k:(i + 1) * top_k] = Trie.__rank(counts, starts[node], ends[node], top_k)
+
+        return Trie(*encode_strings(words), counts, labels, first_child, starts, ends, top_offsets, top, top_k)
+
+    @staticmethod
+    def __rank(counts: np.ndarray, start: int, end: int, k: int) -> np.ndarray:
+        """
+        Finds the k most frequent words of a range, the first in alphabetical order on ties.
+
+        Returns:
+            np.ndarray: Ids of the words, most frequent first.
+        """
+        order = np.argsort(-counts[start:end], kind='stable')[:k]
+        return (order + start).astype(np.int32)
+
+    def save(self, path: str):
+        """
+        Saves the trie as a segment.
+
+        Args:
+            path (str): Directory of the segment.
+        """
+        Segment.write(path, {'words': self.words, 'word_offsets': self.word_offsets, 'counts': self.counts,
+                             'labels': self.labels, 'first_child': self.first_child, 'starts': self.starts, 'ends': self.ends,
+                             'top_offsets': self.top_offsets, 'top': self.top}, {'top_k': self.top_k})
+
+    @staticmethod
+    def load(path: str) -> 'Trie':
+        """
+        Loads a trie saved with save, memory-mapped.
+
+        Args:
+            path (str): Directory of the segment.
+
+        Returns:
+            Trie: The trie.
         """
-        Initializes a Trie data structure.
+        segment = Segment.read(path)
+        # Plain views of the memory maps, which are much faster to read one item at a time
+        names = ['words', 'word_offsets', 'counts', 'labels', 'first_child', 'starts', 'ends', 'top_offsets', 'top']
+        return Trie(*[np.asarray(segment[name]) for name in names], segment.meta['top_k'])
+
+    def __len__(self) -> int:
+        return len(self.word_offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        return decode_string(self.words, self.word_offsets, i)
+
+    def children(self, node: int) -> List[Tuple[int, str]]:
+        """
+        Finds the children of a node.
+
+        Args:
+            node (int): The node.
+
+        Returns:
+            List[Tuple[int, str]]: Every child and its character.
         """
-        self.root: TrieNode = TrieNode()
+        first, last = int(self.first_child[node]), int(self.first_child[node + 1])
+        return list(zip(range(first, last), map(chr, self.labels[first:last].tolist())))
 
-    def insert(self, word: str) -> None:
+    def find(self, prefix: str) -> int:
         """
-        Inserts a word into the Trie.
+        Finds the node of a prefix.
 
         Args:
-            word (str): The word to insert.
+            prefix (str): The prefix.
+
+        Returns:
+            int: The node, -1 if no word starts with the prefix.
+        """
+        node = 0
+        for char in prefix:
+            first, last = int(self.first_child[node]), int(self.first_child[node + 1])
+            child = first + int(np.searchsorted(self.labels[first:last], ord(char)))
+            if child == last or self.labels[child] != ord(char):
+                return -1
+            node = child
+        return node
+
+    def completions(self, node: int, k: int) -> List[int]:
         """
-        node: TrieNode = self.root
-        for char in word:
-            if char not in node.children:
-                node.children[char] = TrieNode(char)
-            node = node.children[char]
-        node.is_end_of_word = True
+        Finds the most frequent words under a node.
+
+        Args:
+            node (int): The node.
+            k (int): The maximum number of words to return.
+
+        Returns:
+            List[int]: Ids of the words, most frequent first.
+        """
+        start, end = int(self.top_offsets[node]), int(self.top_offsets[node + 1])
+        if k <= self.top_k and end > start:
+            return self.top[start:start + k].tolist()
+        return Trie.__rank(self.counts, int(self.starts[node]), int(self.ends[node]), k).tolist()
 
     def search(self, word: str) -> bool:
         """
@@ -47,12 +205,8 @@ class Trie:
         Returns:
             bool: True if the word exists in the Trie, False otherwise.
         """
-        node: TrieNode = self.root
-        for char in word:
-            if char not in node.children:
-                return False
-            node = node.children[char]
-        return node.is_end_of_word
+        node = self.find(word)
+        return node >= 0 and self[int(self.starts[node])] == word
 
     def starts_with(self, prefix: str) -> bool:
         """
@@ -64,68 +218,248 @@ class Trie:
         Returns:
             bool: True if there is a word with the given prefix, False otherwise.
         """
-        node: TrieNode = self.root
-        for char in prefix:
-            if char not in node.children:
-                return False
-            node = node.children[char]
-        return True
+        return self.find(prefix) >= 0
 
-    def find_closest_words(self, prefix: str, k: int) -> List[str]:
+    def fuzzy_completions(self, prefix: str, k: int, max_distance: int,
+                          exact_prefix: int = 1) -> List[Tuple[int, int]]:
         """
-        Finds the closest k words to the given prefix in the Trie.
+        Finds the most frequent words that start with a string at most
+        max_distance edits away from a prefix, the closest first.
+
+        The first exact_prefix characters must match, as typos are rare there
+        and every character matched exactly divides the number of branches to
+        walk by the size of the alphabet. The distance is raised one edit at a
+        time, and the search stops at the first distance with k words, since
+        farther words would rank after them.
+
+        Args:
+            prefix (str): The prefix, possibly misspelled.
+            k (int): The maximum number of words to return.
+            max_distance (int): The maximum edit distance between the prefix and the start of a word.
+            exact_prefix (int): Number of characters of the prefix that must match.
+
+        Returns:
+            List[Tuple[int, int]]: Id and distance of every word, closest first and then most frequent.
+        """
+        node = self.find(prefix[:exact_prefix])
+        if node < 0:
+            return []
+
+        for distance in range(max_distance + 1):
+            distances = self.__fuzzy_search(node, prefix[exact_prefix:], k, distance)
+            if len(distances) >= k:
+                break
+        return sorted(distances.items(), key=lambda item: (item[1], -int(self.counts[item[0]]), item[0]))[:k]
+
+    def __fuzzy_search(self, root: int, prefix: str, k: int, max_distance: int) -> Dict[int, int]:
+        """
+        Walks the trie depth first keeping the row of the Levenshtein table of
+        the prefix against the string of every node. A branch is pruned once
+        every value of its row is over max_distance, since the row can only grow
+        below it. Only the cells at most max_distance away from the diagonal of
+        the table can be within max_distance, so the rest are not computed.
+
+        Args:
+            root (int): Node where the walk starts.
+            prefix (str): The rest of the prefix after the string of root, possibly misspelled.
+            k (int): The maximum number of words to return.
+            max_distance (int): The maximum edit distance between the prefix and the start of a word.
+
+        Returns:
+            Dict[int, int]: Distance of the k most frequent words of every node within max_distance.
+        """
+        over = max_distance + 1
+        distances = {}
+        stack = [(root, 0, [min(j, over) for j in range(len(prefix) + 1)], over)]
+        while stack:
+            node, depth, row, covered = stack.pop()
+            if row[-1] < covered:
+                # Every word under the node starts at row[-1] edits, better than under any matched ancestor
+                for word in self.completions(node, k):
+                    if distances.get(word, covered) > row[-1]:
+                        distances[word] = row[-1]
+                covered = row[-1]
+            if min(row) >= covered:
+                continue
+
+            low, high = max(1, depth + 1 - max_distance), min(len(prefix), depth + 1 + max_distance)
+            for child, char in self.children(node):
+                next_row = [over] * len(row)
+                next_row[0] = first = min(depth + 1, over)
+                best = first
+                left = next_row[low - 1]
+                for j in range(low, high + 1):
+                    # Written out instead of calling min, as this is the innermost loop of the walk
+                    value = row[j - 1] if prefix[j - 1] == char else row[j - 1] + 1
+                    if row[j] + 1 < value:
+                        value = row[j] + 1
+                    if left + 1 < value:
+                        value = left + 1
+                    if value > over:
+                        value = over
+                    next_row[j] = left = value
+                    if value < best:
+                        best = value
+                if best < covered:
+                    stack.append((child, depth + 1, next_row, covered))
+
+        return distances
+
+    def find_closest_words(self, prefix: str, k: int, max_distance: int = 0) -> List[str]:
+        """
+        Finds the k most frequent words that start with the given prefix, or
+        with a string at most max_distance edits away from it.
 
         Args:
             prefix (str): The prefix to search for.
             k (int): The maximum number of closest words to return.
+            max_distance (int): The maximum number of typos of the prefix.
 
         Returns:
-            List[str]: A list of closest words.
+            List[str]: A list of closest words, the ones with fewer typos first and then the most frequent.
         """
-        node = self.root
-        for char in prefix:
-            if char not in node.children:
-                return []
-            node = node.children[char]
+        if max_distance > 0:
+            return [self[i] for i, _ in self.fuzzy_completions(prefix, k, max_distance)]
 
-        def dfs(node: TrieNode, word: str, result: List[str]) -> None:
-            if len(result) == k:
-                return
-            if node.is_end_of_word:
-                result.append(word)
-            for char in node.children:
-                dfs(node.children[char], word + char, result)
+        node = self.find(prefix)
+        if node < 0:
+            return []
+        return [self[i] for i in self.completions(node, k)]
 
-        result: List[str] = []
-        dfs(node, prefix, result)
-        return result
 
-    def to_json(self, node: Optional[TrieNode] = None) -> Dict[str, str] | str:
+class DeltaTrie:
+    def __init__(self, base: Trie, delta: Trie = None, max_delta: float = 0.1) -> None:
         """
-        Converts the Trie to a JSON representation.
+        Initializes the autocomplete of a vocabulary that grows with the index.
+        The base trie has the whole vocabulary when it was built, and the small
+        delta trie has the words added after it and the words whose frequency
+        changed, with their current frequency, so adding documents does not
+        rebuild the base trie.
+
+        Adding documents only makes frequencies grow, so a word that is not
+        among the completions of the base trie is not more frequent than them,
+        and the most frequent completions are the best of the completions of
+        both tries, with the frequencies of the delta. Deleted documents lower
+        frequencies when their segments are merged, and the merge builds both
+        tries again as one instead of adding to the delta.
 
         Args:
-            node (Optional[TrieNode]): The starting node for conversion.
+            base (Trie): Trie of the vocabulary when it was built.
+            delta (Trie, optional): Trie of the words added or changed after it.
+            max_delta (float): Size of the delta, as a fraction of the base, over which both should be built again as one.
+        """
+        self.base = base
+        self.delta = delta
+        self.max_delta = max_delta
+        # Frequency of every word of the delta, which is small, to rank the completions of the base
+        self.delta_counts: Dict[str, int] = {} if delta is None else \
+            {delta[i]: count for i, count in enumerate(delta.counts.tolist())}
+
+    @staticmethod
+    def build(words: List[str], counts: List[int], top_k: int = 10) -> 'DeltaTrie':
+        """
+        Builds the autocomplete of a vocabulary, without delta.
+
+        Args:
+            words (List[str]): The words.
+            counts (List[int]): Document frequency of every word.
+            top_k (int): Number of completions precomputed per node.
 
         Returns:
-            Dict[str, str] | str: The JSON representation of the Trie.
-        """
-        if node is None:
-            node = self.root
-        if node.is_end_of_word:
-            return '$'
-        children = {char: self.to_json(child)
-                    for char, child in node.children.items()}
-        return children
-
-    def from_json(self, json_str: str) -> None:
-        self.root = self._from_json(json.loads(json_str))
-
-    def _from_json(self, node: Dict[str, str] | str) -> TrieNode:
-        if isinstance(node, str):
-            return TrieNode(char=node[-1], is_end_of_word=True)
-        else:
-            trie_node = TrieNode()
-            for char, child in node.items():
-                trie_node.children[char] = self._from_json(child)
-            return trie_node
+            DeltaTrie: The autocomplete.
+        """
+        return DeltaTrie(Trie.build(words, counts, top_k))
+
+    def save(self, path: str):
+        """
+        Saves the delta, or the base and no delta if there is none. The base of
+        a trie with a delta is the one it was loaded from, so it is not written again.
+
+        Args:
+            path (str): Directory of the base.
+        """
+        if self.delta is not None:
+            self.delta.save(path + '_delta')
+            return
+        self.base.save(path)
+        shutil.rmtree(path + '_delta', ignore_errors=True)
+
+    @staticmethod
+    def load(path: str) -> 'DeltaTrie':
+        """
+        Loads the base and the delta saved with save, memory-mapped.
+
+        Args:
+            path (str): Directory of the base.
+
+        Returns:
+            DeltaTrie: The autocomplete.
+        """
+        delta = Trie.load(path + '_delta') if os.path.exists(path + '_delta') else None
+        return DeltaTrie(Trie.load(path), delta)
+
+    def __base_count(self, word: str) -> Optional[int]:
+        """
+        Finds the frequency of a word in the base, None if it is not in it.
+        """
+        node = self.base.find(word)
+        if node < 0 or self.base[int(self.base.starts[node])] != word:
+            return None
+        return int(self.base.counts[int(self.base.starts[node])])
+
+    def add(self, words: List[str], counts: List[int]) -> bool:
+        """
+        Adds words or updates their frequency. Only the words that are not in
+        the base with the same frequency go to the delta, which is built again
+        with them and the words it already had.
+
+        Args:
+            words (List[str]): The words.
+            counts (List[int]): Current document frequency of every word.
+
+        Returns:
+            bool: Whether the delta grew over max_delta of the base, and both should be built again as one.
+        """
+        frequency = dict(self.delta_counts)
+        for word, count in zip(words, counts):
+            if word in frequency or self.__base_count(word) != count:
+                frequency[word] = count
+
+        if frequency != self.delta_counts:
+            delta = Trie.build(list(frequency), list(frequency.values()), self.base.top_k)
+            self.delta, self.delta_counts = delta, frequency
+        return len(frequency) > self.max_delta * len(self.base)
+
+    def find_closest_words(self, prefix: str, k: int, max_distance: int = 0) -> List[str]:
+        """
+        Finds the k most frequent words that start with the given prefix, or
+        with a string at most max_distance edits away from it.
+
+        Args:
+            prefix (str): The prefix to search for.
+            k (int): The maximum number of closest words to return.
+            max_distance (int): The maximum number of typos of the prefix.
+
+        Returns:
+            List[str]: A list of closest words, the ones with fewer typos first and then the most frequent.
+        """
+        # Read once, as add replaces them while completions are searched
+        delta, delta_counts = self.delta, self.delta_counts
+        if delta is None:
+            return self.base.find_closest_words(prefix, k, max_distance)
+
+        # Distance and current frequency of the completions of both tries
+        found: Dict[str, Tuple[int, int]] = {}
+        for trie in (self.base, delta):
+            if max_distance > 0:
+                completions = trie.fuzzy_completions(prefix, k, max_distance)
+            else:
+                node = trie.find(prefix)
+                completions = [(i, 0) for i in trie.completions(node, k)] if node >= 0 else []
+            for i, distance in completions:
+                word = trie[i]
+                count = delta_counts.get(word, int(trie.counts[i]))
+                if word not in found or distance < found[word][0]:
+                    found[word] = (distance, count)
+
+        return sorted(found, key=lambda word: (found[word][0], -found[word][1], word))[:k]